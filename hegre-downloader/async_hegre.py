@@ -0,0 +1,698 @@
+from __future__ import annotations
+
+import os
+import re
+import math
+import time
+import asyncio
+import httpx
+import hashlib
+
+from rich.progress import Progress, TaskID
+from httpx import HTTPError, StreamError
+from typing import BinaryIO, Callable, Optional
+from itertools import takewhile
+from collections import deque
+
+from model.movie import HegreMovie
+from model.gallery import HegreGallery
+from model.media_file import MediaFile
+from sort_option import SortOption
+from exceptions import (
+    HegreError,
+    MovieAlreadyDownloaded,
+    CircuitOpenError,
+    PartialFileMismatch,
+)
+from configuration import Configuration
+from metadata_cache import MetadataCache
+from rate_limiter import BandwidthLimiter
+from helper import CHECKSUM_ALGORITHM, hash_file
+from metrics import Metrics, stage
+from retry import RetryPolicy
+from hegre import (
+    DEFAULT_MAX_CONNECTIONS,
+    PROGRESS_BATCH_SIZE,
+    LOGIN_URL,
+    LOGIN_HEADERS,
+    ALL_MOVIES_URL_PATTERN,
+    ALL_GALLERIES_URL_PATTERN,
+    MODEL_URL_PATTERN,
+    SINGLE_URL_PATTERN,
+    MOVIES_TOTAL_URL,
+    GALLERIES_TOTAL_URL,
+    MOVIES_LISTING_URL,
+    MOVIES_LISTING_SELECTOR,
+    GALLERIES_LISTING_URL,
+    LISTING_PAGES_PER_WORKER,
+    GALLERIES_LISTING_SELECTOR,
+    generate_filename,
+    http2_available,
+    create_limits,
+    get_destination_folder,
+    get_sidecar_files,
+    get_resume_offset,
+    get_resume_request,
+    get_validators,
+    load_resume_validators,
+    store_resume_validators,
+    get_asset_validators,
+    check_body_length,
+    aiter_body,
+    check_range_response,
+    parse_authenticity_token,
+    check_login_response,
+    parse_listing_page,
+    parse_total_count,
+    parse_model_page,
+    parse_film_page,
+    archive_id_from_url,
+    parse_gallery_page,
+)
+
+
+class AsyncHegre:
+    """Asynchronous counterpart of Hegre, built on httpx.AsyncClient
+
+    All requests of a single instance share one connection pool, so many page fetches and
+    downloads can be in flight at the same time without a thread for each of them.
+    """
+
+    _session: httpx.AsyncClient
+    _cookies: dict[str, str]
+    _metadata_cache: Optional[MetadataCache]
+    _bandwidth_limiter: Optional[BandwidthLimiter]
+    _metrics: Optional[Metrics]
+    _retry_policy: RetryPolicy
+    _listing_codes: dict[str, int]
+
+    def __init__(
+        self,
+        locale: str = "en",
+        country: str = "US",
+        width: int = 3840,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        http2: bool = True,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        metadata_cache: Optional[MetadataCache] = None,
+        bandwidth_limiter: Optional[BandwidthLimiter] = None,
+        metrics: Optional[Metrics] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+    ) -> None:
+        async def record_response(response: httpx.Response) -> None:
+            metrics.record_response(response)
+
+        self._cookies = {"locale": locale, "country": country, "_width": str(width)}
+        self._session = httpx.AsyncClient(
+            cookies=self._cookies,
+            limits=create_limits(max_connections),
+            http2=http2 and http2_available(),
+            transport=transport,
+            event_hooks={"response": [record_response]} if metrics else None,
+        )
+        self._metadata_cache = metadata_cache
+        self._bandwidth_limiter = bandwidth_limiter
+        self._metrics = metrics
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._listing_codes = {}
+
+    async def __aenter__(self) -> AsyncHegre:
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._session.aclose()
+
+    async def login(self, username: str, password: str) -> None:
+        """Starts a session with the given credentials
+
+        Args:
+            username (str): Hegre username
+            password (str): Hegre password
+
+        Raises:
+            HegreError: If the authenticity_token could not be extracted or the login failed
+        """
+        with stage(self._metrics, "login"):
+            raw_login_page = await self._get(LOGIN_URL)
+            token = parse_authenticity_token(raw_login_page.text)
+
+            r = await self._session.post(
+                LOGIN_URL,
+                data={
+                    "authenticity_token": token,
+                    "username": username,
+                    "password": password,
+                },
+                headers=LOGIN_HEADERS,
+            )
+
+            check_login_response(r)
+
+    async def resolve_urls(
+        self,
+        url: str,
+        sort: SortOption = SortOption.MOST_RECENT,
+        workers: int = 1,
+        stop_at: Optional[set[str]] = None,
+    ) -> list[str]:
+        """Resolves the given URL into URLs of single movies and galleries
+
+        Args:
+            url (str): Hegre URL
+            sort (SortOption, optional): Sorting of all movies/galleries. Defaults to SortOption.MOST_RECENT.
+            workers (int, optional): Number of listing pages fetched concurrently. Defaults to 1.
+            stop_at (Optional[set[str]], optional): URLs at which a listing is cut off, see Hegre._iter_listing_pages(). Defaults to None.
+
+        Raises:
+            HegreError: If the URL is not supported
+
+        Returns:
+            list[str]: URLs of single movies and galleries
+        """
+        if re.match(ALL_MOVIES_URL_PATTERN, url):
+            return await self._get_listing_urls(
+                MOVIES_TOTAL_URL,
+                MOVIES_LISTING_URL,
+                MOVIES_LISTING_SELECTOR,
+                sort,
+                workers,
+                stop_at,
+            )
+        elif re.match(ALL_GALLERIES_URL_PATTERN, url):
+            return await self._get_listing_urls(
+                GALLERIES_TOTAL_URL,
+                GALLERIES_LISTING_URL,
+                GALLERIES_LISTING_SELECTOR,
+                sort,
+                workers,
+                stop_at,
+            )
+        elif re.match(MODEL_URL_PATTERN, url):
+            model_page_res = await self._get(url)
+            return self._remember_codes(parse_model_page(model_page_res.text))
+        elif re.match(SINGLE_URL_PATTERN, url):
+            return [url]
+        else:
+            raise HegreError(
+                "Unsupported URL! Only galleries, movies, films, massage, sexed and orgasms are supported."
+            )
+
+    async def _get_listing_urls(
+        self,
+        total_url: str,
+        page_url: str,
+        selector: str,
+        sort: SortOption,
+        workers: int,
+        stop_at: Optional[set[str]] = None,
+    ) -> list[str]:
+        if stop_at:
+            return await self._get_new_listing_urls(page_url, selector, sort, stop_at)
+
+        total_res = await self._get(total_url)
+        total = parse_total_count(total_res.text)
+
+        page = 1
+        urls = await self._get_listing_page_urls(
+            page_url.format(sort=str(sort), page=page), selector
+        )
+        if not urls:
+            return []
+
+        page_count = math.ceil(total / len(urls))
+        semaphore = asyncio.Semaphore(workers)
+
+        async def fetch_page(p: int) -> Optional[list[str]]:
+            async with semaphore:
+                return await self._get_listing_page_urls(
+                    page_url.format(sort=str(sort), page=p), selector
+                )
+
+        # like Hegre._fetch_listing_pages(), only a few pages per worker are fetched ahead, and the
+        # fetches still running are cancelled, if a page fails or is past the end of the listing
+        pending = deque()
+        next_page = page + 1
+        try:
+            while True:
+                while (
+                    next_page <= page_count
+                    and len(pending) < workers * LISTING_PAGES_PER_WORKER
+                ):
+                    pending.append(asyncio.create_task(fetch_page(next_page)))
+                    next_page += 1
+
+                if not pending:
+                    break
+
+                # the pages are taken in their order, not in the order of completion
+                urls_on_page = await pending.popleft()
+                if urls_on_page is None:
+                    return urls
+
+                urls.extend(urls_on_page)
+                page += 1
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        # fetch pages beyond the derived page count sequentially, if the total was outdated
+        while urls_on_page := await self._get_listing_page_urls(
+            page_url.format(sort=str(sort), page=page + 1), selector
+        ):
+            urls.extend(urls_on_page)
+            page += 1
+
+        return urls
+
+    async def _get_new_listing_urls(
+        self, page_url: str, selector: str, sort: SortOption, stop_at: set[str]
+    ) -> list[str]:
+        """Fetches the listing page by page, until one of the URLs in stop_at is reached"""
+        urls = []
+        page = 1
+
+        while urls_on_page := await self._get_listing_page_urls(
+            page_url.format(sort=str(sort), page=page), selector
+        ):
+            new_urls = list(takewhile(lambda url: url not in stop_at, urls_on_page))
+            urls.extend(new_urls)
+
+            if len(new_urls) < len(urls_on_page):
+                break
+
+            page += 1
+
+        return urls
+
+    async def _get_listing_page_urls(
+        self, url: str, selector: str
+    ) -> Optional[list[str]]:
+        listing_page_res = await self._get(url, "listing_fetch")
+        with stage(self._metrics, "listing_parse"):
+            items = parse_listing_page(listing_page_res.text, selector)
+
+        return self._remember_codes(items) if items is not None else None
+
+    async def _get(
+        self,
+        url: str,
+        stage_name: Optional[str] = None,
+        headers: Optional[dict[str, str]] = None,
+    ) -> httpx.Response:
+        """Fetches a page, repeating failed requests according to the retry policy, see Hegre._get()"""
+
+        async def get() -> httpx.Response:
+            with stage(self._metrics, stage_name):
+                response = await self._session.get(url, headers=headers)
+                if response.is_error:
+                    response.raise_for_status()
+
+            return response
+
+        def count_retry(*_) -> None:
+            if self._metrics and stage_name:
+                self._metrics.add_retry(stage_name)
+
+        return await self._retry_policy.call_async(url, get, on_retry=count_retry)
+
+    def _remember_codes(self, items: dict[str, Optional[int]]) -> list[str]:
+        for url, code in items.items():
+            if code is not None:
+                self._listing_codes[url] = code
+
+        return list(items)
+
+    def get_archive_id(self, url: str) -> Optional[str]:
+        """Returns the archive ID of a movie or gallery without fetching its page, see Hegre.get_archive_id()"""
+        if code := self._listing_codes.pop(url, None):
+            return archive_id_from_url(url, code)
+
+        if self._metadata_cache:
+            return self._metadata_cache.get_archive_id(url)
+
+        return None
+
+    async def get_movie_from_url(self, url: str) -> HegreMovie:
+        if "login" not in self._session.cookies:
+            raise HegreError("No active session detected, please login first!")
+
+        return await self._get_object(url, parse_film_page)
+
+    async def get_gallery_from_url(self, url: str) -> HegreGallery:
+        return await self._get_object(url, parse_gallery_page)
+
+    async def _get_object(
+        self,
+        url: str,
+        parse: Callable[[str, str], HegreMovie | HegreGallery],
+    ) -> HegreMovie | HegreGallery:
+        cached = self._metadata_cache.get(url) if self._metadata_cache else None
+        if cached and cached.is_fresh(self._metadata_cache.ttl):
+            return cached.hegre_object
+
+        page_res = await self._get(
+            url, "page_fetch", headers=cached.validators() if cached else None
+        )
+        if cached and page_res.status_code == 304:
+            self._metadata_cache.touch(url)
+            return cached.hegre_object
+
+        with stage(self._metrics, "page_parse"):
+            hegre_object = parse(url, page_res.text)
+
+        if self._metadata_cache:
+            self._metadata_cache.put(
+                hegre_object,
+                page_res.headers.get("ETag"),
+                page_res.headers.get("Last-Modified"),
+            )
+
+        return hegre_object
+
+    async def download_movie(
+        self,
+        movie: HegreMovie,
+        configuration: Configuration,
+        progress: Optional[Progress] = None,
+        task_prefix: str = "",
+    ) -> None:
+        await self._download_object(movie, configuration, progress, task_prefix)
+
+    async def download_gallery(
+        self,
+        gallery: HegreGallery,
+        configuration: Configuration,
+        progress: Optional[Progress] = None,
+        task_prefix: str = "",
+    ) -> None:
+        await self._download_object(gallery, configuration, progress, task_prefix)
+
+    async def _download_object(
+        self,
+        hegre_object: HegreMovie | HegreGallery,
+        configuration: Configuration,
+        progress: Optional[Progress] = None,
+        task_prefix: str = "",
+    ) -> None:
+        """Downloads the file of a movie/gallery and its assets, which are downloaded in parallel to the file"""
+        if "login" not in self._session.cookies:
+            raise HegreError("No active session detected, please login first!")
+
+        dest_folder = get_destination_folder(hegre_object, configuration)
+        asset_slots = asyncio.Semaphore(configuration.asset_tasks)
+
+        async def download_asset(url: str, dest_file: str) -> None:
+            async with asset_slots:
+                try:
+                    await self._download_with_retries(
+                        url,
+                        os.path.dirname(dest_file),
+                        os.path.basename(dest_file),
+                        progress,
+                        task_prefix,
+                        max_attempts=configuration.retries + 1,
+                        asset=True,
+                    )
+                except MovieAlreadyDownloaded:
+                    if configuration.refresh_assets and await self._refresh_asset(
+                        url, dest_file
+                    ):
+                        if progress:
+                            progress.console.print(
+                                f"{task_prefix}Updated '{os.path.basename(dest_file)}'"
+                            )
+
+        await asyncio.gather(
+            self._download_media(hegre_object, configuration, progress, task_prefix),
+            *(
+                download_asset(asset_url, asset_file)
+                for asset_url, asset_file in get_sidecar_files(
+                    hegre_object, configuration, dest_folder
+                )
+            ),
+        )
+
+    async def _refresh_asset(self, url: str, dest_file: str) -> bool:
+        """Revalidates an existing asset with a conditional GET and replaces it, see Hegre._refresh_asset()"""
+        temp_file = f"{dest_file}.temp"
+
+        async def refresh() -> bool:
+            async with self._session.stream(
+                "GET",
+                url,
+                headers=get_asset_validators(dest_file, self._metadata_cache),
+            ) as stream:
+                if stream.status_code == 304:
+                    return False
+
+                stream.raise_for_status()
+                with open(temp_file, "wb") as file:
+                    await self._write_body(stream, file, asset=True)
+                    check_body_length(stream, file.tell())
+
+            os.replace(temp_file, dest_file)
+            if self._metadata_cache:
+                self._metadata_cache.put_asset_validators(
+                    dest_file,
+                    stream.headers.get("ETag"),
+                    stream.headers.get("Last-Modified"),
+                )
+
+            return True
+
+        with stage(self._metrics, "asset_revalidate"):
+            return await self._retry_policy.call_async(url, refresh)
+
+    async def _download_media(
+        self,
+        hegre_object: HegreMovie | HegreGallery,
+        configuration: Configuration,
+        progress: Optional[Progress] = None,
+        task_prefix: str = "",
+    ) -> None:
+        dest_folder = get_destination_folder(hegre_object, configuration)
+
+        _, url = hegre_object.get_download_url_for_res(configuration.resolution)
+
+        filename, metadata_filename = generate_filename(url, hegre_object)
+
+        try:
+            if not configuration.no_download:
+                checksum = await self._download_with_retries(
+                    url,
+                    dest_folder,
+                    filename,
+                    progress,
+                    task_prefix,
+                    max_attempts=configuration.retries + 1,
+                    checksum=True,
+                )
+                hegre_object.file = MediaFile(
+                    filename,
+                    os.path.getsize(os.path.join(dest_folder, filename)),
+                    checksum,
+                )
+        except MovieAlreadyDownloaded as e:
+            if progress:
+                progress.console.print(
+                    f"{task_prefix}Skipping '{hegre_object.title}': {e}"
+                )
+                return
+            else:
+                raise e
+
+        if not configuration.no_meta:
+            with stage(self._metrics, "metadata_write"):
+                hegre_object.write_metadata_file(dest_folder, metadata_filename)
+
+    async def _download_with_retries(
+        self,
+        url: str,
+        destination_folder: str,
+        filename: str,
+        progress: Optional[Progress] = None,
+        task_prefix: str = "",
+        max_attempts: int = 3,
+        asset: bool = False,
+        checksum: bool = False,
+    ) -> Optional[str]:
+        dest_file = os.path.join(destination_folder, filename)
+        temp_file = os.path.join(destination_folder, f"{filename}.temp")
+
+        if os.path.exists(dest_file):
+            raise MovieAlreadyDownloaded(f"{filename} exists already!")
+
+        task_id = None
+        if progress:
+            task_id = progress.add_task(task_prefix + filename, start=False)
+
+        transfer_stage = "asset_transfer" if asset else "transfer"
+        for attempt in range(1, max_attempts + 1):
+            try:
+                self._retry_policy.check(url)
+                with stage(self._metrics, transfer_stage):
+                    # a temp file left behind by a failed attempt or a previous run is resumed
+                    digest = await self._download_file(
+                        url,
+                        temp_file,
+                        progress,
+                        task_id,
+                        resume=True,
+                        asset=asset,
+                        checksum=checksum,
+                    )
+                self._retry_policy.record(url)
+                break
+            except (HTTPError, StreamError, CircuitOpenError) as e:
+                self._retry_policy.record(url, e)
+                delay = self._retry_policy.get_delay(attempt, e)
+
+                if delay is None or attempt >= max_attempts:
+                    raise e
+                elif not progress:
+                    raise HegreError(
+                        f"Failed attempt {attempt} to download {filename}: {e}"
+                    )
+
+                if self._metrics:
+                    self._metrics.add_retry(transfer_stage)
+                progress.console.print(
+                    f"[yellow]:warning: Failed attempt {attempt} to download '{filename}', retrying in {delay:.1f} s: {e}"
+                )
+                progress.update(
+                    task_id, description=f"[red strike]{task_prefix}{filename}[/]"
+                )
+                progress.stop_task(task_id)
+                await asyncio.sleep(delay)
+                task_id = progress.add_task(task_prefix + filename, start=False)
+            except BaseException:
+                # e.g. a full disk or a missing header, which says nothing about the health of the host
+                self._retry_policy.release(url)
+                raise
+
+        # we can assume a successful download here
+        with stage(self._metrics, "rename"):
+            validators = load_resume_validators(temp_file)
+            os.rename(temp_file, dest_file)
+            store_resume_validators(temp_file, {})
+
+        if asset and self._metadata_cache and validators:
+            self._metadata_cache.put_asset_validators(
+                dest_file, validators.get("ETag"), validators.get("Last-Modified")
+            )
+
+        return digest
+
+    async def _download_file(
+        self,
+        url: str,
+        dest_file: str,
+        progress: Optional[Progress] = None,
+        task_id: Optional[TaskID] = None,
+        chunk_size: Optional[int] = None,
+        resume: bool = False,
+        asset: bool = False,
+        checksum: bool = False,
+    ) -> Optional[str]:
+        offset, headers = get_resume_request(dest_file) if resume else (0, {})
+
+        started = time.monotonic()
+        try:
+            async with self._session.stream("GET", url, headers=headers) as stream:
+                if self._metrics:
+                    self._metrics.observe("first_byte", time.monotonic() - started)
+
+                offset = check_range_response(stream, dest_file, offset)
+                if offset is None:
+                    if progress and task_id != None:
+                        size = get_resume_offset(dest_file)
+                        progress.update(task_id, total=size, completed=size)
+                    if not checksum:
+                        return None
+                    return (await asyncio.to_thread(hash_file, dest_file)).hexdigest()
+
+                if offset == 0:
+                    store_resume_validators(dest_file, get_validators(stream.headers))
+
+                digest = None
+                if checksum:
+                    digest = (
+                        await asyncio.to_thread(hash_file, dest_file, offset)
+                        if offset > 0
+                        else hashlib.new(CHECKSUM_ALGORITHM)
+                    )
+
+                with open(dest_file, "ab" if offset > 0 else "wb") as file:
+                    if progress and task_id != None:
+                        content_length = stream.headers.get("Content-Length")
+                        progress.update(
+                            task_id,
+                            total=offset + int(content_length)
+                            if content_length
+                            else None,
+                            completed=offset,
+                        )
+                        progress.start_task(task_id)
+
+                    await self._write_body(
+                        stream, file, chunk_size, progress, task_id, asset, digest
+                    )
+                    check_body_length(stream, file.tell() - offset)
+        except PartialFileMismatch:
+            # the partial file has been removed, so the file is downloaded from the start
+            return await self._download_file(
+                url, dest_file, progress, task_id, chunk_size, False, asset, checksum
+            )
+
+        return digest.hexdigest() if digest else None
+
+    async def _write_body(
+        self,
+        stream: httpx.Response,
+        file: BinaryIO,
+        chunk_size: Optional[int] = None,
+        progress: Optional[Progress] = None,
+        task_id: Optional[TaskID] = None,
+        asset: bool = False,
+        digest: Optional["hashlib._Hash"] = None,
+    ) -> None:
+        """Writes the body of a response to a file, see Hegre._write_body()
+
+        The writes run in a worker thread, so a slow disk does not stall the other transfers of the event loop.
+        """
+        unreported = 0
+        written = 0
+        write_seconds = 0.0
+
+        try:
+            async for chunk in aiter_body(stream, chunk_size):
+                if self._bandwidth_limiter:
+                    await asyncio.sleep(
+                        self._bandwidth_limiter.reserve(len(chunk), asset)
+                    )
+
+                write_started = time.perf_counter()
+                await asyncio.to_thread(file.write, chunk)
+                write_seconds += time.perf_counter() - write_started
+
+                if digest:
+                    digest.update(chunk)
+
+                written += len(chunk)
+                unreported += len(chunk)
+                if unreported >= PROGRESS_BATCH_SIZE and progress and task_id != None:
+                    progress.update(task_id, advance=unreported)
+                    unreported = 0
+        finally:
+            if self._metrics:
+                self._metrics.add_bytes(
+                    "asset_transfer" if asset else "transfer", written
+                )
+                self._metrics.observe("disk_write", write_seconds)
+
+        if unreported and progress and task_id != None:
+            progress.update(task_id, advance=unreported)
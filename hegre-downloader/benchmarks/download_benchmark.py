@@ -0,0 +1,118 @@
+"""Micro-benchmark of the write path of Hegre._download_file against a local HTTP server
+
+Compares the previous write path (decoded 16 KiB chunks, a progress update per chunk) with the current
+one (raw reads from the connection, batched progress updates). The CPU time is the time the client
+process spends in Python, i.e. mostly holding the GIL, while the server runs in a separate process. Run it from the hegre-downloader folder:
+
+    python -m benchmarks.download_benchmark --size 1024
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from rich.console import Console
+from rich.progress import Progress
+
+from hegre import Hegre
+from helper import convert_size
+
+SERVER_CHUNK_SIZE = 1024 * 1024
+LEGACY_CHUNK_SIZE = 16 * 1024
+
+
+def serve(port: int, size: int) -> None:
+    """Serves a file of the given size with zero bytes at every path"""
+    payload = bytes(SERVER_CHUNK_SIZE)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            self.send_response(200)
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+
+            remaining = size
+            while remaining > 0:
+                self.wfile.write(payload[: min(remaining, len(payload))])
+                remaining -= len(payload)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+
+def download_legacy(hegre: Hegre, url: str, dest_file: str, progress: Progress) -> None:
+    """The write path of _download_file before raw reads and batched progress updates"""
+    task_id = progress.add_task("legacy")
+
+    with hegre._session.stream("GET", url) as stream:
+        progress.update(task_id, total=int(stream.headers["Content-Length"]))
+
+        with open(dest_file, "wb") as file:
+            for chunk in stream.iter_bytes(chunk_size=LEGACY_CHUNK_SIZE):
+                file.write(chunk)
+                progress.update(task_id, advance=len(chunk))
+
+
+def download_current(
+    hegre: Hegre, url: str, dest_file: str, progress: Progress
+) -> None:
+    task_id = progress.add_task("current")
+    hegre._download_file(url, dest_file, progress, task_id)
+
+
+def measure(download, hegre: Hegre, url: str, dest_file: str) -> tuple[float, float]:
+    """Returns the wall clock and CPU seconds of a download"""
+    with Progress(console=Console(quiet=True)) as progress:
+        started, cpu_started = time.perf_counter(), time.process_time()
+        download(hegre, url, dest_file, progress)
+        elapsed, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+
+    os.remove(dest_file)
+    return elapsed, cpu
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=512, help="File size in MiB")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each path")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    size = args.size * 1024 * 1024
+    server = multiprocessing.Process(target=serve, args=(args.port, size), daemon=True)
+    server.start()
+    time.sleep(0.5)
+
+    url = f"http://127.0.0.1:{args.port}/movie.mp4"
+    hegre = Hegre(http2=False)
+
+    print(f"Downloading {convert_size(size)} {args.repeat} times per path")
+    print(f"{'path':<10}{'MB/s':>10}{'CPU s':>10}{'CPU s/GB':>10}")
+
+    with tempfile.TemporaryDirectory() as dest_folder:
+        dest_file = os.path.join(dest_folder, "movie.mp4")
+
+        for name, download in (
+            ("legacy", download_legacy),
+            ("current", download_current),
+        ):
+            runs = [
+                measure(download, hegre, url, dest_file) for _ in range(args.repeat)
+            ]
+            elapsed = min(run[0] for run in runs)
+            cpu = min(run[1] for run in runs)
+
+            print(
+                f"{name:<10}{size / elapsed / 1e6:>10.1f}{cpu:>10.2f}{cpu / size * 1024**3:>10.2f}"
+            )
+
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
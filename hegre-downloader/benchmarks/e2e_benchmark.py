@@ -0,0 +1,174 @@
+"""End-to-end benchmark of crawling, parsing and downloading against the local mock server
+
+Starts benchmarks.mock_server in a separate process and reports
+- crawl: items/s of resolve_urls over all movie listing pages,
+- pages: pages/s of get_movie_from_url (fetch and parse),
+- parse: milliseconds per page of the parsers alone,
+- transfer: MB/s of movie downloads, including retries of injected faults.
+Pages and listings are retried like downloads, so --page-fault-rate measures the cost of the backoff.
+Run it from the hegre-downloader folder:
+
+    python -m benchmarks.e2e_benchmark --items 500 --latency 0.02 --downloads 8 --media-size 64M
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from rich.console import Console
+from rich.progress import Progress
+
+from hegre import Hegre, generate_filename, parse_film_page, parse_gallery_page
+from helper import parse_size
+from retry import RetryPolicy
+from benchmarks.mock_server import (
+    MockSettings,
+    LocalTransport,
+    serve,
+    film_page,
+    sexed_page,
+    gallery_page,
+)
+
+MOVIES_URL = "https://www.hegre.com/movies"
+
+
+def timed(function: Callable, *args) -> tuple[float, object]:
+    """Returns the wall clock seconds and the result of a call"""
+    started = time.perf_counter()
+    result = function(*args)
+
+    return time.perf_counter() - started, result
+
+
+def measure_parse(parse: Callable[[str, str], object], url: str, html: str) -> float:
+    """Returns the milliseconds per page of a parser, the best of several rounds"""
+    rounds = []
+    for _ in range(5):
+        elapsed, _ = timed(lambda: [parse(url, html) for _ in range(20)])
+        rounds.append(elapsed / 20)
+
+    return min(rounds) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--items", type=int, default=500, help="Movies/galleries")
+    parser.add_argument("--pages", type=int, default=100, help="Item pages fetched")
+    parser.add_argument("--downloads", type=int, default=4, help="Movies downloaded")
+    parser.add_argument("--media-size", type=parse_size, default="64M")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds")
+    parser.add_argument(
+        "--bandwidth", type=parse_size, default=0, help="Per response, e.g. 10M"
+    )
+    parser.add_argument("--fault-rate", type=float, default=0.0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--page-fault-rate", type=float, default=0.0)
+    parser.add_argument("--crawl-tasks", type=int, default=4)
+    parser.add_argument("-p", type=int, default=2, help="Parallel downloads")
+    parser.add_argument("--segments", type=int, default=1)
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--retry-backoff", type=float, default=0.1, help="Seconds")
+    args = parser.parse_args()
+
+    settings = MockSettings(
+        args.items,
+        args.media_size,
+        args.latency,
+        args.bandwidth,
+        args.fault_rate,
+        args.truncate_rate,
+        args.page_fault_rate,
+    )
+    server = multiprocessing.Process(
+        target=serve, args=(settings, args.port), daemon=True
+    )
+    server.start()
+    time.sleep(0.5)
+
+    max_connections = args.crawl_tasks + args.p * args.segments
+    hegre = Hegre(
+        http2=False,
+        max_connections=max_connections,
+        transport=LocalTransport(args.port, max_connections),
+        retry_policy=RetryPolicy(args.retries + 1, backoff=args.retry_backoff),
+    )
+    hegre.login("benchmark", "benchmark")
+
+    print(
+        f"{args.items} items, latency {args.latency:g}s, fault rate {args.fault_rate:g}, page fault rate {args.page_fault_rate:g}, truncate rate {args.truncate_rate:g}"
+    )
+    print(f"{'stage':<18}{'result':>14}")
+
+    elapsed, urls = timed(
+        lambda: hegre.resolve_urls(MOVIES_URL, workers=args.crawl_tasks)
+    )
+    print(f"{'crawl':<18}{len(urls) / elapsed:>10.1f} items/s")
+
+    page_urls = urls[: args.pages]
+    with ThreadPoolExecutor(max_workers=args.crawl_tasks) as pool:
+        elapsed, movies = timed(
+            lambda: list(pool.map(hegre.get_movie_from_url, page_urls))
+        )
+    print(f"{'pages':<18}{len(page_urls) / elapsed:>10.1f} pages/s")
+
+    for name, parse, url, html in (
+        (
+            "parse film",
+            parse_film_page,
+            "https://www.hegre.com/films/film-0",
+            film_page(0),
+        ),
+        (
+            "parse sexed",
+            parse_film_page,
+            "https://www.hegre.com/sexed/film-9",
+            sexed_page(9),
+        ),
+        (
+            "parse gallery",
+            parse_gallery_page,
+            "https://www.hegre.com/photos/gallery-0",
+            gallery_page(0),
+        ),
+    ):
+        print(f"{name:<18}{measure_parse(parse, url, html):>10.2f} ms/page")
+
+    # failed attempts are only retried with a progress to report them to
+    with tempfile.TemporaryDirectory() as dest_folder, Progress(
+        console=Console(quiet=True)
+    ) as progress:
+
+        def download(movie) -> None:
+            _, url = movie.get_highest_res_download_url()
+            filename, _ = generate_filename(url, movie)
+            hegre._download_with_retries(
+                url,
+                dest_folder,
+                filename,
+                progress,
+                max_attempts=args.retries + 1,
+                segments=args.segments,
+            )
+
+        downloads = movies[: args.downloads]
+        with ThreadPoolExecutor(max_workers=args.p) as pool:
+            elapsed, _ = timed(lambda: list(pool.map(download, downloads)))
+
+        size = sum(
+            os.path.getsize(os.path.join(dest_folder, file))
+            for file in os.listdir(dest_folder)
+        )
+    print(f"{'transfer':<18}{size / elapsed / 1e6:>10.1f} MB/s")
+
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""Local stand-in for hegre.com, to benchmark crawling, parsing and downloading offline
+
+Serves synthetic listing pages, film, sexed and gallery pages, a login and media bodies of any size,
+with configurable latency, bandwidth and fault injection. LocalTransport routes the requests of a Hegre
+client for any host (www.hegre.com, c.hegre.com, ...) to the server. Run it standalone from the
+hegre-downloader folder:
+
+    python -m benchmarks.mock_server --port 8765 --items 1000 --latency 0.05
+"""
+
+from __future__ import annotations
+
+import re
+import time
+import random
+import argparse
+import threading
+
+from datetime import date, timedelta
+from typing import Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+from hegre import create_limits, DEFAULT_MAX_CONNECTIONS
+from helper import parse_size
+
+ITEMS_PER_PAGE = 24
+FIRST_CODE = 10000
+ASSET_SIZE = 64 * 1024
+# size of the writes of media bodies, which is also the granularity of the bandwidth limit
+WRITE_SIZE = 64 * 1024
+MEDIA_EXTENSIONS = (".mp4", ".zip", ".jpg", ".srt")
+PAYLOAD = bytes(range(256)) * (WRITE_SIZE // 256)
+
+
+class MockSettings:
+    """Catalog and network conditions of the mock server"""
+
+    items: int
+    media_size: int
+    latency: float
+    bandwidth: int
+    fault_rate: float
+    truncate_rate: float
+    page_fault_rate: float
+
+    def __init__(
+        self,
+        items: int = 1000,
+        media_size: int = 64 * 1024 * 1024,
+        latency: float = 0.0,
+        bandwidth: int = 0,
+        fault_rate: float = 0.0,
+        truncate_rate: float = 0.0,
+        page_fault_rate: float = 0.0,
+    ) -> None:
+        """Creates the settings
+
+        Args:
+            items (int, optional): Number of movies and of galleries. Defaults to 1000.
+            media_size (int, optional): Size of every movie/gallery file in bytes. Defaults to 64 MiB.
+            latency (float, optional): Seconds before every response. Defaults to 0.0.
+            bandwidth (int, optional): Bytes per second of every response body, 0 for no limit. Defaults to 0.
+            fault_rate (float, optional): Share of media requests that fail with HTTP 503. Defaults to 0.0.
+            truncate_rate (float, optional): Share of media bodies that end early. Defaults to 0.0.
+            page_fault_rate (float, optional): Share of listing and item page requests that fail with HTTP 503. Defaults to 0.0.
+        """
+        self.items = items
+        self.media_size = media_size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.fault_rate = fault_rate
+        self.truncate_rate = truncate_rate
+        self.page_fault_rate = page_fault_rate
+
+
+def item_date(i: int) -> date:
+    """Items are released daily, the first item of a listing is the newest"""
+    return date(2024, 1, 1) - timedelta(days=i)
+
+
+def movie_path(i: int) -> str:
+    # every tenth movie is a sexed film, whose page has a different layout
+    return f"/sexed/film-{i}" if i % 10 == 9 else f"/films/film-{i}"
+
+
+def listing_page(kind: str, page: int, settings: MockSettings) -> str:
+    """Returns a movie ("films") or gallery ("galleries") listing page, with a hint past its end"""
+    start = (page - 1) * ITEMS_PER_PAGE
+    if start >= settings.items:
+        return '<html><body><div class="hint">No results</div></body></html>'
+
+    items = []
+    for i in range(start, min(start + ITEMS_PER_PAGE, settings.items)):
+        path = movie_path(i) if kind == "films" else f"/photos/gallery-{i}"
+        items.append(
+            f'<div class="item" data-id="{FIRST_CODE + i}"><a href="{path}">Item {i}</a>'
+            f'<span class="date">{item_date(i):%B %d, %Y}</span></div>'
+        )
+
+    return f"""<html><body>
+<h2><strong>{settings.items}</strong> {kind}</h2>
+<div id="{kind}-listing">{"".join(items)}</div>
+</body></html>"""
+
+
+def film_page(i: int) -> str:
+    slug = f"film-{i}"
+    media = f"https://c.hegre.com/films/{slug}/{slug}"
+    player = (
+        '{"resolutions":['
+        f'{{"type":2160,"sources":{{"default":[{{"mp4":"{media}-2160p.mp4?token=a"}}]}}}},'
+        f'{{"type":1080,"sources":{{"default":[{{"mp4":"{media}-1080p.mp4?token=b"}}]}}}}],'
+        f'"clip":{{"subtitles":[{{"label":"English","src":"{media}-en.srt?token=c"}}]}}}}'
+    )
+
+    return f"""<!DOCTYPE html>
+<html lang="en"><head><title>Film {i} - Hegre</title></head>
+<body class="films show">
+  <div class="content">
+    <div class="video-player-wrapper" style="background-image: url(https://img.hegre.com/films/{slug}/cover.jpg?v=1);">
+      <div class="video-inner"><script>window.videoPlayer = new VideoPlayer("#player", {player});</script></div>
+      <div class="trailer"><a href="https://p.hegre.com/films/{slug}/{slug}-trailer-1080p.mp4?token=d"><strong>1080p</strong> trailer</a></div>
+    </div>
+    <div class="record-details">
+      <h1 class="title"><span class="translated-text">Film {i}</span></h1>
+      <div class="date">{item_date(i):%B %d, %Y}</div>
+      <div class="format-details">4K 25:13 min</div>
+      <div class="models"><a class="record-model" href="/models/model-{i % 50}" title="Model {i % 50}">Model {i % 50}</a></div>
+      <div class="massage-copy"><p>{"A description of the film. " * 20}</p></div>
+      <div class="approved-tags"><a class="tag" href="/tags/outdoor">outdoor</a><a class="tag" href="/tags/massage">massage</a></div>
+      <div class="video-stills"><a href="{media}-stills.zip?token=e">Download screengrabs</a></div>
+    </div>
+    <div class="comments-wrapper" data-id="{FIRST_CODE + i}">{'<div class="comment"><p>Great film!</p></div>' * 30}</div>
+  </div>
+</body></html>"""
+
+
+def sexed_page(i: int) -> str:
+    slug = f"film-{i}"
+    media = f"https://c.hegre.com/sexed/{slug}/{slug}"
+    player = (
+        f'{{"resolutions":[{{"type":1080,"sources":{{"default":[{{"mp4":"{media}-1080p.mp4?token=a"}}]}}}}],'
+        '"clip":{"subtitles":[]}}'
+    )
+
+    return f"""<!DOCTYPE html>
+<html lang="en"><head><title>Film {i} - Hegre</title></head>
+<body class="sexed show">
+  <div class="top">
+    <div class="video-player-wrapper" style="background-image: url(https://img.hegre.com/sexed/{slug}/cover.jpg?v=1);"></div>
+    <script>window.videoPlayer = new VideoPlayer("#player", {player});</script>
+  </div>
+  <div class="film-header"><h1>Film {i}</h1><div><strong>12:34 min</strong></div><div class="intro">An introduction.</div></div>
+  <div class="approved-tags"><a class="tag" href="/tags/education">education</a></div>
+  <div class="comments-wrapper" data-id="{FIRST_CODE + i}"></div>
+</body></html>"""
+
+
+def gallery_page(i: int) -> str:
+    slug = f"gallery-{i}"
+    media = f"https://c.hegre.com/photos/{slug}/{slug}"
+
+    return f"""<!DOCTYPE html>
+<html lang="en"><head><title>Gallery {i} - Hegre</title></head>
+<body class="galleries show">
+  <div class="record-content"><div class="non-members" style="background-image: url(https://img.hegre.com/photos/{slug}/cover.jpg?v=1);"></div></div>
+  <h1 class="translated-text">Gallery {i}</h1>
+  <div class="date">{item_date(i):%B %d, %Y}</div>
+  <a class="record-model" href="/models/model-{i % 50}" title="Model {i % 50}">Model {i % 50}</a>
+  <div class="approved-tags"><a class="tag" href="/tags/outdoor">outdoor</a></div>
+  <div class="gallery-zips">
+    <a class="members-only" href="{media}-6000px.zip?token=a">6000px</a>
+    <a class="members-only" href="{media}-3000px.zip?token=b">3000px</a>
+  </div>
+  <div class="comments-wrapper" data-id="{FIRST_CODE + i}"></div>
+</body></html>"""
+
+
+def create_handler(settings: MockSettings) -> type[BaseHTTPRequestHandler]:
+    """Returns a request handler that serves the catalog of the given settings"""
+
+    class MockHandler(BaseHTTPRequestHandler):
+        # keep-alive connections, like the real server
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self) -> None:
+            if settings.latency:
+                time.sleep(settings.latency)
+
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+
+            if url.path.endswith(MEDIA_EXTENSIONS):
+                if random.random() < settings.fault_rate:
+                    self._send_body(503, b"Service unavailable", "text/plain")
+                else:
+                    self._send_media(url.path)
+            elif url.path != "/login" and random.random() < settings.page_fault_rate:
+                self._send_body(503, b"Service unavailable", "text/plain")
+            elif url.path == "/login":
+                self._send_html(
+                    '<form><input name="authenticity_token" value="token"></form>'
+                )
+            elif url.path in ("/movies", "/photos"):
+                kind = "films" if url.path == "/movies" else "galleries"
+                page = int(query.get(f"{kind}_page", ["1"])[0])
+                self._send_html(listing_page(kind, page, settings))
+            elif match := re.fullmatch(r"/(films|sexed)/film-(\d+)", url.path):
+                i = int(match.group(2))
+                self._send_html(
+                    film_page(i) if match.group(1) == "films" else sexed_page(i)
+                )
+            elif match := re.fullmatch(r"/photos/gallery-(\d+)", url.path):
+                self._send_html(gallery_page(int(match.group(1))))
+            else:
+                self._send_body(404, b"Not found", "text/plain")
+
+        def do_POST(self) -> None:
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if settings.latency:
+                time.sleep(settings.latency)
+
+            self._send_body(
+                200,
+                b'{"status": "success"}',
+                "application/json",
+                {"Set-Cookie": "login=1; Path=/"},
+            )
+
+        def log_message(self, *args) -> None:
+            pass
+
+        def _send_html(self, html: str) -> None:
+            self._send_body(200, html.encode("utf-8"), "text/html; charset=utf-8")
+
+        def _send_body(
+            self,
+            status: int,
+            body: bytes,
+            content_type: str,
+            headers: Optional[dict[str, str]] = None,
+        ) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_media(self, path: str) -> None:
+            size = (
+                settings.media_size
+                if path.endswith((".mp4", ".zip"))
+                and "trailer" not in path
+                and "stills" not in path
+                else ASSET_SIZE
+            )
+            first, last = 0, size - 1
+
+            if match := re.fullmatch(
+                r"bytes=(\d+)-(\d*)", self.headers.get("Range", "")
+            ):
+                first = int(match.group(1))
+                last = min(int(match.group(2)), size - 1) if match.group(2) else last
+
+                if first >= size:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {first}-{last}/{size}")
+            else:
+                self.send_response(200)
+
+            length = last - first + 1
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+
+            if random.random() < settings.truncate_rate:
+                # the connection breaks halfway through the body
+                length //= 2
+                self.close_connection = True
+
+            self._write_paced(length)
+
+        def _write_paced(self, length: int) -> None:
+            started = time.monotonic()
+            written = 0
+
+            while written < length:
+                chunk = PAYLOAD[: min(WRITE_SIZE, length - written)]
+                self.wfile.write(chunk)
+                written += len(chunk)
+
+                if settings.bandwidth:
+                    ahead = written / settings.bandwidth - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+    return MockHandler
+
+
+def create_server(settings: MockSettings, port: int = 0) -> ThreadingHTTPServer:
+    """Creates the server on 127.0.0.1, with a free port if port is 0 (see server_address)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), create_handler(settings))
+    server.daemon_threads = True
+
+    return server
+
+
+def start_server(settings: MockSettings, port: int = 0) -> ThreadingHTTPServer:
+    """Starts the server in a background thread of this process, e.g. for tests"""
+    server = create_server(settings, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def serve(settings: MockSettings, port: int) -> None:
+    """Serves until the process is terminated, e.g. as the target of a separate process"""
+    create_server(settings, port).serve_forever()
+
+
+class LocalTransport(httpx.BaseTransport):
+    """Sends the requests for all hosts to the mock server, while the client sees the original URLs
+
+    The client keeps the original request, so cookies and redirects still refer to the real hosts.
+    """
+
+    port: int
+    _transport: httpx.HTTPTransport
+
+    def __init__(
+        self, port: int, max_connections: int = DEFAULT_MAX_CONNECTIONS
+    ) -> None:
+        self.port = port
+        self._transport = httpx.HTTPTransport(limits=create_limits(max_connections))
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        local_request = httpx.Request(
+            request.method,
+            request.url.copy_with(scheme="http", host="127.0.0.1", port=self.port),
+            headers=request.headers,
+            stream=request.stream,
+            extensions=request.extensions,
+        )
+
+        return self._transport.handle_request(local_request)
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--media-size", type=parse_size, default="64M")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds")
+    parser.add_argument(
+        "--bandwidth", type=parse_size, default=0, help="Per response, e.g. 10M"
+    )
+    parser.add_argument("--fault-rate", type=float, default=0.0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--page-fault-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    print(f"Serving {args.items} movies and galleries on 127.0.0.1:{args.port}")
+    serve(
+        MockSettings(
+            args.items,
+            args.media_size,
+            args.latency,
+            args.bandwidth,
+            args.fault_rate,
+            args.truncate_rate,
+            args.page_fault_rate,
+        ),
+        args.port,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import time
+import threading
+
+from typing import Callable, Optional
+
+# length (in seconds) of the windows throughput, latency and errors are measured in
+DEFAULT_INTERVAL = 10.0
+# minimum relative throughput gain that justifies another concurrent download
+MIN_GAIN = 0.05
+# a window whose average latency exceeds the best one by this factor counts as congested
+LATENCY_FACTOR = 2.0
+# number of windows the limit is held after a probe did not pay off
+HOLD_WINDOWS = 3
+
+
+class ResizableSemaphore:
+    """Semaphore whose limit can be changed while it is in use
+
+    Lowering the limit does not interrupt holders, it only delays new acquisitions until enough holders
+    have released the semaphore.
+    """
+
+    limit: int
+    active: int
+    _condition: threading.Condition
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.active = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._condition:
+            self._condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    def release(self) -> None:
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def set_limit(self, limit: int) -> None:
+        with self._condition:
+            self.limit = limit
+            self._condition.notify_all()
+
+    def __enter__(self) -> ResizableSemaphore:
+        self.acquire()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.release()
+
+
+class AdaptiveConcurrency:
+    """Adjusts the number of concurrent downloads to the measured throughput, latency and error rate
+
+    Downloads report the responses they receive and the bytes they read. At the end of every window the
+    limit is
+    - halved, if the server throttled (HTTP 429) or failed (HTTP 5xx) any request,
+    - decreased by one, if the latency to the first byte doubled compared to the best window,
+    - decreased by one and held for a few windows, if the last increase did not raise the throughput,
+    - increased by one otherwise.
+    This keeps the limit near the lowest number of downloads that saturates the link.
+    """
+
+    min_tasks: int
+    max_tasks: int
+    interval: float
+    semaphore: ResizableSemaphore
+    _clock: Callable[[], float]
+    _lock: threading.Lock
+    _window_start: float
+    _bytes: int
+    _responses: int
+    _errors: int
+    _latency: float
+    _last_throughput: Optional[float]
+    _best_latency: Optional[float]
+    _increased: bool
+    _hold: int
+
+    def __init__(
+        self,
+        min_tasks: int,
+        max_tasks: int,
+        interval: float = DEFAULT_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Creates the controller, starting with min_tasks concurrent downloads
+
+        Args:
+            min_tasks (int): Lower bound of concurrent downloads
+            max_tasks (int): Upper bound of concurrent downloads
+            interval (float, optional): Length of a measurement window in seconds. Defaults to DEFAULT_INTERVAL.
+            clock (Callable[[], float], optional): Monotonic clock in seconds. Defaults to time.monotonic.
+        """
+        self.min_tasks = max(1, min_tasks)
+        self.max_tasks = max(self.min_tasks, max_tasks)
+        self.interval = interval
+        self.semaphore = ResizableSemaphore(self.min_tasks)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last_throughput = None
+        self._best_latency = None
+        self._increased = False
+        self._hold = 0
+        self._start_window(clock())
+
+    @property
+    def limit(self) -> int:
+        return self.semaphore.limit
+
+    def record_response(self, status_code: int, latency: float) -> None:
+        """Records a response and the number of seconds it took to receive its headers"""
+        with self._lock:
+            self._responses += 1
+            self._latency += latency
+            if status_code == 429 or status_code >= 500:
+                self._errors += 1
+
+        self._maybe_adjust()
+
+    def record_bytes(self, size: int) -> None:
+        """Records the number of bytes a download has read"""
+        with self._lock:
+            self._bytes += size
+
+        self._maybe_adjust()
+
+    def _maybe_adjust(self) -> None:
+        with self._lock:
+            now = self._clock()
+            elapsed = now - self._window_start
+            if elapsed < self.interval:
+                return
+
+            limit = self._next_limit(self._bytes / elapsed)
+            self._start_window(now)
+
+        if limit != self.semaphore.limit:
+            self.semaphore.set_limit(limit)
+
+    def _next_limit(self, throughput: float) -> int:
+        limit = self.semaphore.limit
+        latency = self._latency / self._responses if self._responses else None
+        last_throughput = self._last_throughput
+        increased = self._increased
+
+        self._last_throughput = throughput
+        self._increased = False
+
+        if self._errors:
+            return max(self.min_tasks, limit // 2)
+
+        if latency is not None:
+            if self._best_latency is None or latency < self._best_latency:
+                self._best_latency = latency
+            elif latency > self._best_latency * LATENCY_FACTOR:
+                return max(self.min_tasks, limit - 1)
+
+        if (
+            increased
+            and last_throughput is not None
+            and throughput < last_throughput * (1 + MIN_GAIN)
+        ):
+            self._hold = HOLD_WINDOWS
+            return max(self.min_tasks, limit - 1)
+
+        if self._hold:
+            self._hold -= 1
+            return limit
+
+        if limit < self.max_tasks:
+            self._increased = True
+            return limit + 1
+
+        return limit
+
+    def _start_window(self, now: float) -> None:
+        self._window_start = now
+        self._bytes = 0
+        self._responses = 0
+        self._errors = 0
+        self._latency = 0.0
@@ -2,6 +2,7 @@ from typing import Optional
 from pathlib import Path
 
 from sort_option import SortOption
+from rate_limiter import RateWindow
 
 
 class Configuration:
@@ -10,6 +11,34 @@ class Configuration:
     retries: int
     parallel_tasks: int
     sort: SortOption
+    crawl_tasks: int
+    asset_tasks: int
+    stream: bool
+    use_async: bool
+    max_connections: Optional[int]
+    http2: bool
+    segments: int
+    metadata_cache: Optional[str]
+    metadata_cache_ttl: int
+    incremental: Optional[str]
+    parser: Optional[str]
+    limit_rate: int
+    limit_rate_media: int
+    limit_rate_assets: int
+    limit_rate_schedule: Optional[list[RateWindow]]
+    adaptive: bool
+    min_tasks: int
+    json_progress: Optional[float]
+    import_download_archive: Optional[str]
+    work_ledger: Optional[str]
+    lease: float
+    metrics: Optional[str]
+    metrics_interval: float
+    summary: bool
+    retry_backoff: float
+    circuit_breaker: int
+    refresh_assets: bool
+    refresh_metadata: bool
 
     no_thumb: bool
     no_meta: bool
@@ -38,12 +67,68 @@ class Configuration:
         resolution: Optional[int] = None,
         subtitles: Optional[list[str]] = None,
         download_archive: Optional[str] = None,
+        crawl_tasks: int = 1,
+        asset_tasks: int = 2,
+        stream: bool = False,
+        use_async: bool = False,
+        max_connections: Optional[int] = None,
+        http2: bool = True,
+        segments: int = 1,
+        metadata_cache: Optional[str] = None,
+        metadata_cache_ttl: int = 24,
+        incremental: Optional[str] = None,
+        parser: Optional[str] = None,
+        limit_rate: int = 0,
+        limit_rate_media: int = 0,
+        limit_rate_assets: int = 0,
+        limit_rate_schedule: Optional[list[RateWindow]] = None,
+        adaptive: bool = False,
+        min_tasks: int = 1,
+        json_progress: Optional[float] = None,
+        import_download_archive: Optional[str] = None,
+        work_ledger: Optional[str] = None,
+        lease: float = 300,
+        metrics: Optional[str] = None,
+        metrics_interval: float = 15,
+        summary: bool = False,
+        retry_backoff: float = 1.0,
+        circuit_breaker: int = 5,
+        refresh_assets: bool = False,
+        refresh_metadata: bool = False,
     ) -> None:
         self.urls = urls
         self.destination_folder = destination_folder
         self.retries = retries
         self.parallel_tasks = parallel_tasks
         self.sort = sort
+        self.crawl_tasks = crawl_tasks
+        self.asset_tasks = asset_tasks
+        self.stream = stream
+        self.use_async = use_async
+        self.max_connections = max_connections
+        self.http2 = http2
+        self.segments = segments
+        self.metadata_cache = metadata_cache
+        self.metadata_cache_ttl = metadata_cache_ttl
+        self.incremental = incremental
+        self.parser = parser
+        self.limit_rate = limit_rate
+        self.limit_rate_media = limit_rate_media
+        self.limit_rate_assets = limit_rate_assets
+        self.limit_rate_schedule = limit_rate_schedule
+        self.adaptive = adaptive
+        self.min_tasks = min_tasks
+        self.json_progress = json_progress
+        self.import_download_archive = import_download_archive
+        self.work_ledger = work_ledger
+        self.lease = lease
+        self.metrics = metrics
+        self.metrics_interval = metrics_interval
+        self.summary = summary
+        self.retry_backoff = retry_backoff
+        self.circuit_breaker = circuit_breaker
+        self.refresh_assets = refresh_assets
+        self.refresh_metadata = refresh_metadata
 
         self.no_thumb = no_thumb
         self.no_meta = no_meta
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import os
+import time
+import socket
+import sqlite3
+import threading
+
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from helper import connect_shared_sqlite
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, appends of several processes are not locked there
+    fcntl = None
+
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+
+class DownloadArchive(ABC):
+    """Archive of the IDs of all downloaded movies and galleries (see HegreObject.archive_id())"""
+
+    @abstractmethod
+    def __contains__(self, archive_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def add(
+        self,
+        archive_id: str,
+        url: Optional[str] = None,
+        size: Optional[int] = None,
+        checksum: Optional[str] = None,
+    ) -> None:
+        """Records a downloaded movie/gallery
+
+        Args:
+            archive_id (str): Archive ID of the movie/gallery
+            url (Optional[str], optional): URL of its page. Defaults to None.
+            size (Optional[int], optional): Size of its file in bytes. Defaults to None.
+            checksum (Optional[str], optional): Checksum of its file. Defaults to None.
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class TextArchive(DownloadArchive):
+    """Archive in a text file with one archive ID per line, compatible with previous versions
+
+    The file is read incrementally: a lookup of an unknown ID first reads the lines other processes have
+    appended since the last read. Appends are locked, so several threads and processes can share the file.
+    Extra fields are not stored.
+    """
+
+    filename: str
+    _ids: set[str]
+    _offset: int
+    _lock: threading.Lock
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self._ids = set()
+        self._offset = 0
+        self._lock = threading.Lock()
+
+        with self._lock:
+            self._read_new_lines()
+
+    def __contains__(self, archive_id: str) -> bool:
+        with self._lock:
+            if archive_id not in self._ids:
+                self._read_new_lines()
+
+            return archive_id in self._ids
+
+    def add(
+        self,
+        archive_id: str,
+        url: Optional[str] = None,
+        size: Optional[int] = None,
+        checksum: Optional[str] = None,
+    ) -> None:
+        with self._lock, open(self.filename, "ab") as archive_file:
+            if fcntl:
+                fcntl.flock(archive_file, fcntl.LOCK_EX)
+
+            archive_file.write(f"{archive_id}\n".encode("utf-8"))
+            archive_file.flush()
+
+            self._ids.add(archive_id)
+
+    def _read_new_lines(self) -> None:
+        if not os.path.exists(self.filename):
+            return
+
+        with open(self.filename, "rb") as archive_file:
+            archive_file.seek(self._offset)
+            data = archive_file.read()
+
+        # an incomplete last line is still being written, it is read next time
+        complete = data.rfind(b"\n") + 1
+        for line in data[:complete].decode("utf-8").splitlines():
+            if line := line.strip():
+                self._ids.add(line)
+
+        self._offset += complete
+
+
+class SqliteArchive(DownloadArchive):
+    """Archive in a SQLite database (with a rollback journal), indexed by archive ID
+
+    Lookups query the index instead of loading the archive into memory. Several threads, processes and
+    hosts (on a file system with working locks) can read and write the archive at the same time.
+    """
+
+    filename: str
+    host: str
+    _connection: sqlite3.Connection
+    _lock: threading.Lock
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.host = socket.gethostname()
+        self._lock = threading.Lock()
+        self._connection = connect_shared_sqlite(filename)
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS archive (
+                    id TEXT PRIMARY KEY,
+                    url TEXT,
+                    size INTEGER,
+                    checksum TEXT,
+                    host TEXT,
+                    recorded_at REAL NOT NULL
+                )"""
+            )
+
+    def __contains__(self, archive_id: str) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM archive WHERE id = ?", (archive_id,)
+            ).fetchone()
+
+        return row is not None
+
+    def add(
+        self,
+        archive_id: str,
+        url: Optional[str] = None,
+        size: Optional[int] = None,
+        checksum: Optional[str] = None,
+    ) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO archive VALUES (?, ?, ?, ?, ?, ?)",
+                (archive_id, url, size, checksum, self.host, time.time()),
+            )
+
+    def get(self, archive_id: str) -> Optional[dict]:
+        """Returns the recorded fields of an archive ID"""
+        with self._lock:
+            cursor = self._connection.execute(
+                "SELECT * FROM archive WHERE id = ?", (archive_id,)
+            )
+            row = cursor.fetchone()
+
+        if row is None:
+            return None
+
+        return dict(zip((column[0] for column in cursor.description), row))
+
+    def import_text_archive(self, filename: str) -> int:
+        """Imports the IDs of a text archive, e.g. to migrate an existing archive
+
+        Returns:
+            int: Number of imported IDs that were not recorded yet
+        """
+        with open(filename, "r", encoding="utf-8") as archive_file:
+            ids = [line.strip() for line in archive_file if line.strip()]
+
+        with self._lock, self._connection:
+            imported = self._connection.executemany(
+                "INSERT OR IGNORE INTO archive (id, host, recorded_at) VALUES (?, ?, ?)",
+                [(id, self.host, time.time()) for id in ids],
+            ).rowcount
+
+        return imported
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+def open_download_archive(filename: str) -> DownloadArchive:
+    """Opens a SQLite archive, if the file name has a SQLite extension (e.g. .db), otherwise a text archive"""
+    if str(filename).lower().endswith(SQLITE_EXTENSIONS):
+        return SqliteArchive(filename)
+
+    return TextArchive(filename)
@@ -3,21 +3,63 @@ import re
 import sys
 import argparse
 import pathlib
+import atexit
+import asyncio
+import contextlib
 
-from hegre import Hegre
+from hegre import (
+    Hegre,
+    DEFAULT_MAX_CONNECTIONS,
+    ALL_MOVIES_URL_PATTERN,
+    ALL_GALLERIES_URL_PATTERN,
+    PARSERS,
+    set_parser,
+    get_destination_folder,
+    get_sidecar_files,
+    get_media_file,
+)
+from async_hegre import AsyncHegre
 from model.movie import HegreMovie
 from model.gallery import HegreGallery
 from sort_option import SortOption
 from exceptions import HegreError
 from configuration import Configuration
+from metadata_cache import MetadataCache
+from sync_state import SyncState, MARK_SIZE
+from download_archive import (
+    DownloadArchive,
+    SQLITE_EXTENSIONS,
+    open_download_archive,
+)
+from work_ledger import WorkLedger, DEFAULT_LEASE
+from rate_limiter import BandwidthLimiter, parse_schedule
+from concurrency import AdaptiveConcurrency
+from metrics import Metrics, MetricsExporter, DEFAULT_EXPORT_INTERVAL
+from retry import (
+    RetryPolicy,
+    CircuitBreaker,
+    DEFAULT_BACKOFF,
+    DEFAULT_FAILURE_THRESHOLD,
+    DEFAULT_RESET_TIMEOUT,
+)
+from pipeline import DownloadPipeline, PipelineItem
+from metadata_refresh import refresh_metadata
+from progress_reporter import (
+    ProgressReporter,
+    create_progress_reporter,
+    DEFAULT_JSON_INTERVAL,
+)
+from helper import parse_size
 
 from dotenv import load_dotenv
-from rich.progress import Progress
 from rich.console import Console
-from concurrent.futures import ThreadPoolExecutor
+from httpx import HTTPError
+from typing import Iterable, Iterator, Optional
 
 DOWNLOAD_TASK_PREFIX = "[{:>4} / {:>4}] "
-archive: set[str] = set()
+archive: Optional[DownloadArchive] = None
+ledger: Optional[WorkLedger] = None
+metrics: Optional[Metrics] = None
 
 
 def load_config_from_args() -> Configuration:
@@ -66,11 +108,123 @@ You can specify one or more URLs that will be downloaded. The following URLs are
     parser.add_argument(
         "-p",
         metavar="NUM_OF_TASKS",
-        help="Number of parallel tasks. Defaults to 1.",
+        help="Number of parallel tasks (the maximum with --adaptive). Defaults to 1.",
         type=int,
         action="store",
         default=1,
     )
+    parser.add_argument(
+        "--adaptive",
+        help="Adjust the number of parallel downloads to the measured throughput, latency and server errors, between --min-tasks and -p. Not supported with --async.",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--min-tasks",
+        metavar="NUM_OF_TASKS",
+        help="Minimum number of parallel downloads with --adaptive. Defaults to 1.",
+        type=int,
+        action="store",
+        default=1,
+        dest="min_tasks",
+    )
+    parser.add_argument(
+        "--crawl-tasks",
+        metavar="NUM_OF_TASKS",
+        help="Number of listing and movie/gallery pages that are fetched in parallel. Defaults to 1.",
+        type=int,
+        action="store",
+        default=1,
+        dest="crawl_tasks",
+    )
+    parser.add_argument(
+        "--asset-tasks",
+        metavar="NUM_OF_TASKS",
+        help="Number of thumbnails, subtitles, screengrabs and trailers that are downloaded in parallel to the movies/galleries (per movie/gallery with --async). Defaults to 2.",
+        type=int,
+        action="store",
+        default=2,
+        dest="asset_tasks",
+    )
+    parser.add_argument(
+        "--stream",
+        help="Start downloading while all movies/galleries are still being resolved, instead of resolving all URLs first",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--async",
+        help="Use the asyncio based engine instead of threads. Item pages are fetched with up to --crawl-tasks and files are downloaded with up to -p concurrent requests",
+        action="store_true",
+        default=False,
+        dest="use_async",
+    )
+    parser.add_argument(
+        "--segments",
+        metavar="NUM_OF_SEGMENTS",
+        help="Download each movie/gallery in NUM_OF_SEGMENTS parts over parallel connections, if the server supports it. Defaults to 1. Not supported with --async.",
+        type=int,
+        action="store",
+        default=1,
+    )
+    parser.add_argument(
+        "--max-connections",
+        metavar="NUM_OF_CONNECTIONS",
+        help=f"Maximum number of connections that are kept open and reused for all requests. Defaults to the number of parallel tasks (times segments), crawl tasks and asset tasks, but at least {DEFAULT_MAX_CONNECTIONS}.",
+        type=int,
+        action="store",
+        dest="max_connections",
+    )
+    parser.add_argument(
+        "--no-http2",
+        help="Do not use HTTP/2, even if it is supported by the server",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--limit-rate",
+        metavar="RATE",
+        help="Maximum download rate of all downloads together in bytes per second, e.g. 500K or 2M. Defaults to no limit.",
+        type=parse_size,
+        action="store",
+        default=0,
+        dest="limit_rate",
+    )
+    parser.add_argument(
+        "--limit-rate-media",
+        metavar="RATE",
+        help="Maximum download rate of all movie/gallery files together, e.g. 2M. Defaults to no limit.",
+        type=parse_size,
+        action="store",
+        default=0,
+        dest="limit_rate_media",
+    )
+    parser.add_argument(
+        "--limit-rate-assets",
+        metavar="RATE",
+        help="Maximum download rate of all thumbnails, subtitles, screengrabs and trailers together, e.g. 500K. Defaults to no limit.",
+        type=parse_size,
+        action="store",
+        default=0,
+        dest="limit_rate_assets",
+    )
+    parser.add_argument(
+        "--limit-rate-schedule",
+        metavar="SCHEDULE",
+        help="Time of day windows that override --limit-rate, e.g. '09:00-18:00=1M,18:00-09:00=0' (0 means no limit). The first matching window applies.",
+        type=parse_schedule,
+        action="store",
+        dest="limit_rate_schedule",
+    )
+    parser.add_argument(
+        "--json-progress",
+        metavar="SECONDS",
+        help=f"Instead of progress bars, print the progress of all downloads as a JSON line every SECONDS seconds (defaults to {DEFAULT_JSON_INTERVAL:g}). Messages are printed to stderr.",
+        type=float,
+        nargs="?",
+        const=DEFAULT_JSON_INTERVAL,
+        dest="json_progress",
+    )
     parser.add_argument(
         "--sort",
         help="Sorting when downloading all movies/galleries. Defaults to 'most_recent'. Valid values are 'most_recent', 'most_viewed', 'top_rated'.",
@@ -79,11 +233,29 @@ You can specify one or more URLs that will be downloaded. The following URLs are
     )
     parser.add_argument(
         "--retries",
-        help="Number of retries for failed downloads. Defaults to 2. Set to 0 to disable retries.",
+        help="Number of retries for failed downloads and page fetches. Defaults to 2. Set to 0 to disable retries.",
         type=int,
         action="store",
         default=2,
     )
+    parser.add_argument(
+        "--retry-backoff",
+        metavar="SECONDS",
+        help=f"Base delay between retries, which is doubled with every failed attempt and randomized, so parallel downloads do not retry all at once. A Retry-After of the server takes precedence. Errors like HTTP 404 are not retried. Defaults to {DEFAULT_BACKOFF:g}.",
+        type=float,
+        action="store",
+        default=DEFAULT_BACKOFF,
+        dest="retry_backoff",
+    )
+    parser.add_argument(
+        "--circuit-breaker",
+        metavar="FAILURES",
+        help=f"Suspend all requests to a host for {DEFAULT_RESET_TIMEOUT:g} seconds after FAILURES consecutive failed requests. Defaults to {DEFAULT_FAILURE_THRESHOLD}. Set to 0 to disable.",
+        type=int,
+        action="store",
+        default=DEFAULT_FAILURE_THRESHOLD,
+        dest="circuit_breaker",
+    )
     parser.add_argument(
         "--no-thumb",
         help="Do not download thumbnails",
@@ -120,23 +292,151 @@ You can specify one or more URLs that will be downloaded. The following URLs are
     parser.add_argument(
         "--trailer", help="Download trailer", action="store_true", default=False
     )
+    parser.add_argument(
+        "--refresh-metadata",
+        help="Only update the metadata files of movies/galleries that have been downloaded already (with the same -d and -r). Their pages are fetched with up to --crawl-tasks workers and only the metadata files that changed are rewritten. No files are downloaded. Combine it with a --metadata-cache-ttl of 0 to bypass fresh cached metadata.",
+        action="store_true",
+        default=False,
+        dest="refresh_metadata",
+    )
+    parser.add_argument(
+        "--refresh-assets",
+        help="Revalidate existing thumbnails, subtitles, screengrabs and trailers with conditional requests and replace the ones that changed on the server. Uses the ETag/Last-Modified recorded in the --metadata-cache or else the modification time of the file. Without it, existing files are skipped without a request.",
+        action="store_true",
+        default=False,
+        dest="refresh_assets",
+    )
     parser.add_argument(
         "--download-archive",
         metavar="FILE",
         action="store",
         type=pathlib.Path,
         dest="download_archive",
-        help="Download only videos/galleries not listed in the archive file. Record the IDs of all downloaded videos/galleries in it",
+        help="Download only videos/galleries not listed in the archive file. Record the IDs of all downloaded videos/galleries in it. A file ending in .db, .sqlite or .sqlite3 is a SQLite database, which also records URL, size, host and time and can be shared by several processes and hosts",
+    )
+    parser.add_argument(
+        "--import-download-archive",
+        metavar="FILE",
+        action="store",
+        type=pathlib.Path,
+        dest="import_download_archive",
+        help="Import the IDs of the text archive FILE into the SQLite --download-archive",
+    )
+    parser.add_argument(
+        "--work-ledger",
+        metavar="FILE",
+        action="store",
+        type=pathlib.Path,
+        dest="work_ledger",
+        help="Share the downloads with other workers (processes or hosts) through the SQLite database FILE on shared storage. The resolved URLs are added to FILE and every worker claims and downloads URLs from it, until all of them are done. Combine it with a shared SQLite --download-archive. Not supported with --async.",
+    )
+    parser.add_argument(
+        "--lease",
+        metavar="SECONDS",
+        help=f"Number of seconds a URL claimed from the --work-ledger stays with a worker that stopped sending heartbeats, before other workers claim it. Defaults to {DEFAULT_LEASE:g}.",
+        type=float,
+        action="store",
+        default=DEFAULT_LEASE,
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="FILE",
+        action="store",
+        type=pathlib.Path,
+        help="Write the timings of all stages (e.g. page fetch, parse, transfer, disk write), transferred bytes, retries and HTTP status codes to FILE in the Prometheus text format, e.g. for the textfile collector of the node exporter",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        metavar="SECONDS",
+        help=f"Number of seconds between two writes of the --metrics file. Defaults to {DEFAULT_EXPORT_INTERVAL:g}.",
+        type=float,
+        action="store",
+        default=DEFAULT_EXPORT_INTERVAL,
+        dest="metrics_interval",
+    )
+    parser.add_argument(
+        "--summary",
+        help="Print a table of the timings of all stages at the end of the run",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--metadata-cache",
+        metavar="FILE",
+        action="store",
+        type=pathlib.Path,
+        dest="metadata_cache",
+        help="Cache the metadata of movies/galleries in FILE, so their pages are not fetched and parsed again on every run",
+    )
+    parser.add_argument(
+        "--metadata-cache-ttl",
+        metavar="HOURS",
+        help="Number of hours cached metadata is used before the page is fetched again (or revalidated, if the server supports it). Defaults to 24.",
+        type=int,
+        action="store",
+        default=24,
+        dest="metadata_cache_ttl",
+    )
+    parser.add_argument(
+        "--incremental",
+        metavar="FILE",
+        action="store",
+        type=pathlib.Path,
+        help="Only download movies/galleries that are newer than the newest ones of the last complete run, which are recorded in FILE. Only applies to all movies/galleries sorted by 'most_recent'",
+    )
+    parser.add_argument(
+        "--parser",
+        help=f"HTML parser backend. Defaults to the first installed one of {', '.join(PARSERS)}.",
+        choices=PARSERS,
+        action="store",
     )
 
     args = parser.parse_args()
 
+    if args.json_progress:
+        # stdout only carries the JSON lines of the progress, all messages go to stderr
+        global console
+        console = Console(stderr=True)
+
     if args.no_thumb and args.no_meta and args.no_subtitles and args.no_download:
         console.print(
             "[red]By specifying --no-thumb, --no-meta, --no-subtitles and --no-download you've essentially told the tool to do nothing. Please use a maximum of three of these options."
         )
         sys.exit(1)
 
+    if args.import_download_archive and not str(
+        args.download_archive or ""
+    ).lower().endswith(SQLITE_EXTENSIONS):
+        console.print(
+            "[red]--import-download-archive requires a SQLite --download-archive (e.g. archive.db)"
+        )
+        sys.exit(1)
+
+    if args.refresh_metadata and (args.use_async or args.work_ledger):
+        console.print(
+            "[red]--refresh-metadata is not supported with --async or --work-ledger"
+        )
+        sys.exit(1)
+
+    if args.work_ledger and args.use_async:
+        console.print("[red]--work-ledger is not supported with --async")
+        sys.exit(1)
+
+    if args.work_ledger and args.incremental:
+        console.print(
+            "[yellow]:warning: --incremental is ignored with --work-ledger, all movies/galleries will be resolved"
+        )
+
+    if args.adaptive and args.use_async:
+        console.print(
+            "[yellow]:warning: --adaptive is not supported with --async, -p downloads will run in parallel"
+        )
+
+    if args.incremental and str(args.sort) != str(SortOption.MOST_RECENT):
+        console.print(
+            "[yellow]:warning: --incremental only applies to the sorting 'most_recent', all movies/galleries will be resolved"
+        )
+
     subtitles = args.subtitles.split(",")
     subtitles = [language.lower() for language in subtitles]
 
@@ -155,6 +455,38 @@ You can specify one or more URLs that will be downloaded. The following URLs are
         resolution=args.r,
         subtitles=subtitles,
         download_archive=args.download_archive,
+        crawl_tasks=args.crawl_tasks,
+        asset_tasks=args.asset_tasks,
+        stream=args.stream,
+        use_async=args.use_async,
+        max_connections=args.max_connections
+        or max(
+            DEFAULT_MAX_CONNECTIONS,
+            args.p * args.segments + args.crawl_tasks + args.asset_tasks,
+        ),
+        http2=not args.no_http2,
+        segments=args.segments,
+        metadata_cache=args.metadata_cache,
+        metadata_cache_ttl=args.metadata_cache_ttl,
+        incremental=args.incremental,
+        parser=args.parser,
+        limit_rate=args.limit_rate,
+        limit_rate_media=args.limit_rate_media,
+        limit_rate_assets=args.limit_rate_assets,
+        limit_rate_schedule=args.limit_rate_schedule,
+        adaptive=args.adaptive,
+        min_tasks=args.min_tasks,
+        json_progress=args.json_progress,
+        import_download_archive=args.import_download_archive,
+        work_ledger=args.work_ledger,
+        lease=args.lease,
+        metrics=args.metrics,
+        metrics_interval=args.metrics_interval,
+        summary=args.summary,
+        retry_backoff=args.retry_backoff,
+        circuit_breaker=args.circuit_breaker,
+        refresh_assets=args.refresh_assets,
+        refresh_metadata=args.refresh_metadata,
     )
 
 
@@ -164,94 +496,401 @@ def login() -> None:
             hegre.login(username, password)
 
         console.print("[green]:heavy_check_mark: Login successful[/]")
-    except HegreError as e:
+    except (HegreError, HTTPError) as e:
         console.print(f"[red]:x: {e}")
         sys.exit(1)
 
 
-def download_urls(urls: list[str], configuration: Configuration) -> None:
+def finish_metrics(
+    configuration: Configuration, exporter: Optional[MetricsExporter]
+) -> None:
+    """Writes the final metrics file and prints the summary, registered to run at exit"""
+    if exporter:
+        exporter.stop()
+
+    if configuration.summary:
+        console.print(metrics.summary())
+
+
+def download_urls(
+    urls: Iterable[str], configuration: Configuration, total: Optional[int] = None
+) -> bool:
+    """Downloads the given URLs, which may also be a generator that is still resolving URLs
+
+    Pages are fetched with up to --crawl-tasks, files are downloaded with up to -p and assets with up to
+    --asset-tasks workers, see DownloadPipeline.
+
+    Args:
+        urls (Iterable[str]): URLs of single movies and galleries
+        configuration (Configuration): Download configuration
+        total (Optional[int], optional): Total number of URLs, if known in advance. Defaults to None.
+
+    Returns:
+        bool: True, if all URLs have been downloaded successfully
+    """
     if not urls:
-        return
+        return True
 
-    with Progress() as progress:
-        if configuration.parallel_tasks > 1:
-            with ThreadPoolExecutor(max_workers=configuration.parallel_tasks) as pool:
-                for count, url in enumerate(urls):
-                    try:
-                        pool.submit(
-                            download_url,
-                            url,
-                            configuration,
-                            DOWNLOAD_TASK_PREFIX.format(count + 1, len(urls)),
-                            progress,
-                        )
-                    except HegreError as e:
-                        progress.console.print(f"[red] Error downloading {url}: {e}")
-        else:
-            for count, url in enumerate(urls):
-                download_url(
-                    url,
-                    configuration,
-                    DOWNLOAD_TASK_PREFIX.format(count + 1, len(urls)),
-                    progress,
+    def task_prefix(item: PipelineItem) -> str:
+        return DOWNLOAD_TASK_PREFIX.format(item.count + 1, total or "?")
+
+    with create_progress_reporter(configuration.json_progress) as progress:
+        pipeline = DownloadPipeline(
+            fetch_object,
+            lambda item: download_media(
+                item, configuration, task_prefix(item), progress
+            ),
+            lambda item: get_sidecar_files(
+                item.hegre_object,
+                configuration,
+                get_destination_folder(item.hegre_object, configuration),
+            ),
+            lambda item, asset: hegre.download_asset(
+                *asset, configuration, progress, task_prefix(item)
+            ),
+            lambda item: complete_item(configuration, item),
+            lambda item, e: fail_item(item, e, progress),
+            metadata_workers=configuration.crawl_tasks,
+            media_workers=configuration.parallel_tasks,
+            asset_workers=configuration.asset_tasks,
+        )
+
+        return pipeline.run(urls)
+
+
+def fetch_object(item: PipelineItem) -> Optional[HegreMovie | HegreGallery]:
+    """Returns the movie/gallery of a URL, None if it has already been recorded in the archive"""
+    # skip archived items before their page is fetched, if their archive ID is already known
+    if is_archived(hegre.get_archive_id(item.url)):
+        console.print(f"{item.url} has already been recorded in the archive")
+        complete_work(item.url)
+        count_item("skipped")
+        return None
+
+    if re.match(
+        r"^https?:\/\/www\.hegre\.com\/(films|massage|sexed|orgasms)\/", item.url
+    ):
+        hegre_object = hegre.get_movie_from_url(item.url)
+        description = "Movie"
+    elif re.match(r"^https?:\/\/www\.hegre\.com\/photos\/", item.url):
+        hegre_object = hegre.get_gallery_from_url(item.url)
+        description = "Gallery"
+    else:
+        raise HegreError(f"Unsupported URL: {item.url}!")
+
+    if is_archived(hegre_object.archive_id()):
+        console.print(
+            f"{description} '{hegre_object.title}' [{hegre_object.code}] has already been recorded in the archive"
+        )
+        complete_work(item.url)
+        count_item("skipped")
+        return None
+
+    return hegre_object
+
+
+def complete_item(configuration: Configuration, item: PipelineItem) -> None:
+    record_download_archive(configuration, item.hegre_object)
+    complete_work(item.url)
+    count_item("completed")
+
+
+def fail_item(item: PipelineItem, e: Exception, progress: ProgressReporter) -> None:
+    progress.console.print(f"[red] Error downloading {item.url}: {e}")
+    count_item("failed")
+
+    if ledger:
+        ledger.release(item.url, error=str(e))
+
+
+def complete_work(url: str) -> None:
+    if ledger:
+        ledger.complete(url)
+
+
+def count_item(result: str) -> None:
+    if metrics:
+        metrics.add_item(result)
+
+
+def download_ledger_urls(configuration: Configuration) -> bool:
+    """Adds the resolved URLs to the work ledger and downloads URLs claimed from it, until all are done
+
+    URLs that another worker has already resolved into the ledger are not resolved again.
+
+    Returns:
+        bool: True, if this worker has downloaded all its claimed URLs successfully
+    """
+    for url in configuration.urls:
+        if ledger.is_resolved(url):
+            console.print(f"{url} has already been resolved into the work ledger")
+            continue
+
+        console.print(f"Resolving {url}:")
+        try:
+            urls = hegre.resolve_urls(
+                url,
+                sort=configuration.sort,
+                show_progress=True,
+                workers=configuration.crawl_tasks,
+            )
+        except (HegreError, HTTPError) as e:
+            console.print(f"[red]:x: {e}")
+            continue
+
+        added = ledger.add(urls, source=url)
+        console.print(f"Added {added} of {len(urls)} URLs to the work ledger")
+
+    console.print(f"Downloading URLs of the work ledger as {ledger.worker_id}:")
+    with ledger:
+        succeeded = download_urls(ledger.iter_claims(), configuration)
+
+    counts = ", ".join(f"{count} {state}" for state, count in ledger.counts().items())
+    console.print(f"Work ledger: {counts}")
+
+    return succeeded
+
+
+def refresh_metadata_files(configuration: Configuration) -> None:
+    """Updates the metadata files of the downloaded movies/galleries of all URLs of the configuration"""
+    for url in configuration.urls:
+        console.print(f"Refreshing the metadata of {url}:")
+        try:
+            with console.status("Fetching URLs"):
+                urls = hegre.resolve_urls(
+                    url, sort=configuration.sort, workers=configuration.crawl_tasks
                 )
+            with console.status(f"Refreshing {len(urls)} metadata files"):
+                results = refresh_metadata(hegre, urls, configuration)
+        except (HegreError, HTTPError) as e:
+            console.print(f"[red]:x: {e}")
+            continue
 
+        counts = {}
+        for result in results:
+            counts[result.status] = counts.get(result.status, 0) + 1
+            if result.error:
+                console.print(f"[red] Error refreshing {result.url}: {result.error}")
+            if metrics:
+                metrics.add_item(result.status)
 
-def download_url(
-    url: str, configuration: Configuration, task_prefix: str, progress: Progress
+        console.print(
+            ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+        )
+
+
+def download_media(
+    item: PipelineItem,
+    configuration: Configuration,
+    task_prefix: str,
+    progress: ProgressReporter,
 ) -> None:
-    if re.match(r"^https?:\/\/www\.hegre\.com\/(films|massage|sexed|orgasms)\/", url):
-        movie = hegre.get_movie_from_url(url)
-        if movie.archive_id() in archive:
-            console.print(
-                f"Movie '{movie.title}' [{movie.code}] has already been recorded in the archive"
-            )
-        else:
-            hegre.download_movie(
-                movie, configuration, progress=progress, task_prefix=task_prefix
+    with download_slot():
+        hegre.download_media(
+            item.hegre_object, configuration, progress=progress, task_prefix=task_prefix
+        )
+
+
+def download_slot() -> contextlib.AbstractContextManager:
+    """Returns the slot a download has to hold with --adaptive, a no-op otherwise"""
+    if concurrency:
+        return concurrency.semaphore
+
+    return contextlib.nullcontext()
+
+
+async def download_async(configuration: Configuration) -> None:
+    """Logs in and downloads all URLs of the configuration with the asyncio based engine"""
+    async with AsyncHegre(
+        max_connections=configuration.max_connections,
+        http2=configuration.http2,
+        metadata_cache=metadata_cache,
+        bandwidth_limiter=bandwidth_limiter,
+        metrics=metrics,
+        retry_policy=retry_policy,
+    ) as async_hegre:
+        try:
+            with console.status("Logging in"):
+                await async_hegre.login(username, password)
+
+            console.print("[green]:heavy_check_mark: Login successful[/]")
+        except (HegreError, HTTPError) as e:
+            console.print(f"[red]:x: {e}")
+            sys.exit(1)
+
+        for url in configuration.urls:
+            console.print(f"Downloading {url}:")
+            sync_key = get_sync_key(url, configuration)
+            stop_at = sync_state.get_mark(sync_key) if sync_key else None
+
+            try:
+                with console.status("Fetching URLs"):
+                    urls = await async_hegre.resolve_urls(
+                        url,
+                        sort=configuration.sort,
+                        workers=configuration.crawl_tasks,
+                        stop_at=stop_at,
+                    )
+                succeeded = await download_urls_async(async_hegre, urls, configuration)
+
+                if sync_key and succeeded:
+                    sync_state.update_mark(sync_key, urls[:MARK_SIZE])
+            except (HegreError, HTTPError) as e:
+                console.print(f"[red]:x: {e}")
+
+
+async def download_urls_async(
+    async_hegre: AsyncHegre, urls: list[str], configuration: Configuration
+) -> bool:
+    """Downloads the given URLs concurrently, with separate limits for page fetches and file downloads
+
+    A fixed pool of workers takes the URLs from a queue, so the number of coroutines does not grow with
+    the number of URLs.
+
+    Returns:
+        bool: True, if all URLs have been downloaded successfully
+    """
+    if not urls:
+        return True
+
+    failed_urls = []
+
+    page_slots = asyncio.Semaphore(configuration.crawl_tasks)
+    download_slots = asyncio.Semaphore(configuration.parallel_tasks)
+
+    async def download(count: int, url: str) -> None:
+        task_prefix = DOWNLOAD_TASK_PREFIX.format(count + 1, len(urls))
+        try:
+            await download_url_async(
+                async_hegre,
+                url,
+                configuration,
+                task_prefix,
+                progress,
+                page_slots,
+                download_slots,
             )
-            record_download_archive(configuration, movie)
+        except Exception as e:
+            # like the stages of the DownloadPipeline, a failed URL must not end the other downloads
+            failed_urls.append(url)
+            progress.console.print(f"[red] Error downloading {url}: {e}")
+            count_item("failed")
+
+    queue = asyncio.Queue()
+    for count, url in enumerate(urls):
+        queue.put_nowait((count, url))
+
+    async def worker() -> None:
+        while not queue.empty():
+            count, url = queue.get_nowait()
+            await download(count, url)
+
+    # enough workers to fill the page and the download slots, each works through the queue one URL at a time
+    workers = min(len(urls), configuration.crawl_tasks + configuration.parallel_tasks)
+
+    with create_progress_reporter(configuration.json_progress) as progress:
+        # the remaining workers work through the queue, even if one of them ends with an error
+        results = await asyncio.gather(
+            *(worker() for _ in range(workers)), return_exceptions=True
+        )
+
+    errors = [result for result in results if isinstance(result, BaseException)]
+    for error in errors:
+        console.print(f"[red]:x: {error}")
+
+    return not failed_urls and not errors
+
+
+async def download_url_async(
+    async_hegre: AsyncHegre,
+    url: str,
+    configuration: Configuration,
+    task_prefix: str,
+    progress: ProgressReporter,
+    page_slots: asyncio.Semaphore,
+    download_slots: asyncio.Semaphore,
+) -> None:
+    if is_archived(async_hegre.get_archive_id(url)):
+        console.print(f"{url} has already been recorded in the archive")
+        count_item("skipped")
+        return
+
+    if re.match(r"^https?:\/\/www\.hegre\.com\/(films|massage|sexed|orgasms)\/", url):
+        async with page_slots:
+            hegre_object = await async_hegre.get_movie_from_url(url)
+        description = "Movie"
     elif re.match(r"^https?:\/\/www\.hegre\.com\/photos\/", url):
-        gallery = hegre.get_gallery_from_url(url)
-        if gallery.archive_id() in archive:
-            console.print(
-                f"Gallery '{gallery.title}' [{gallery.code}] has already been recorded in the archive"
+        async with page_slots:
+            hegre_object = await async_hegre.get_gallery_from_url(url)
+        description = "Gallery"
+    else:
+        raise HegreError(f"Unsupported URL: {url}!")
+
+    if is_archived(hegre_object.archive_id()):
+        console.print(
+            f"{description} '{hegre_object.title}' [{hegre_object.code}] has already been recorded in the archive"
+        )
+        count_item("skipped")
+        return
+
+    async with download_slots:
+        if isinstance(hegre_object, HegreMovie):
+            await async_hegre.download_movie(
+                hegre_object, configuration, progress=progress, task_prefix=task_prefix
             )
         else:
-            hegre.download_gallery(
-                gallery, configuration, progress=progress, task_prefix=task_prefix
+            await async_hegre.download_gallery(
+                hegre_object, configuration, progress=progress, task_prefix=task_prefix
             )
-            record_download_archive(configuration, gallery)
-    else:
-        raise HegreError(f"Unsupported URL: {url}!")
 
+    record_download_archive(configuration, hegre_object)
+    count_item("completed")
 
-def load_download_archive(filename: str) -> None:
-    """Load download archive from file, if a filename is specified"""
-    if not filename or not os.path.exists(filename):
-        return
 
-    try:
-        with open(filename, "r", encoding="utf-8") as archive_file:
-            for line in archive_file:
-                archive.add(line.strip())
-    except OSError:
-        raise
+def get_sync_key(url: str, configuration: Configuration) -> Optional[str]:
+    """Returns the key of the high-water mark of the given URL, if it is downloaded incrementally"""
+    if not configuration.incremental:
+        return None
+
+    if str(configuration.sort) != str(SortOption.MOST_RECENT):
+        return None
+
+    if re.match(ALL_MOVIES_URL_PATTERN, url) or re.match(
+        ALL_GALLERIES_URL_PATTERN, url
+    ):
+        return SyncState.key(url, configuration.sort)
+
+    return None
+
+
+def remember_newest_urls(urls: Iterable[str], newest_urls: list[str]) -> Iterator[str]:
+    """Passes through the given URLs and remembers the first ones for the high-water mark"""
+    for url in urls:
+        if len(newest_urls) < MARK_SIZE:
+            newest_urls.append(url)
+
+        yield url
+
+
+def is_archived(archive_id: Optional[str]) -> bool:
+    return archive is not None and archive_id is not None and archive_id in archive
 
 
 def record_download_archive(
     configuration: Configuration,
     hegre_object: HegreMovie | HegreGallery,
 ) -> None:
-    if configuration.download_archive is None:
+    if archive is None:
         return
 
-    id = hegre_object.archive_id()
+    media_file = get_media_file(hegre_object, configuration)
+    size = os.path.getsize(media_file) if os.path.exists(media_file) else None
 
-    with open(configuration.download_archive, "a", encoding="utf-8") as archive_file:
-        archive_file.write(id + "\n")
+    checksum = hegre_object.file.sha256 if hegre_object.file else None
 
-    archive.add(id)
+    archive.add(
+        hegre_object.archive_id(), url=hegre_object.url, size=size, checksum=checksum
+    )
 
 
 if __name__ == "__main__":
@@ -259,7 +898,14 @@ if __name__ == "__main__":
     console = Console()
 
     configuration = load_config_from_args()
-    load_download_archive(configuration.download_archive)
+    if configuration.download_archive:
+        archive = open_download_archive(configuration.download_archive)
+
+    if configuration.import_download_archive:
+        imported = archive.import_text_archive(configuration.import_download_archive)
+        console.print(
+            f"Imported {imported} IDs from {configuration.import_download_archive}"
+        )
 
     username = os.environ.get("username")
     password = os.environ.get("password")
@@ -268,13 +914,120 @@ if __name__ == "__main__":
         console.print("[red]Please provide username and password!")
         sys.exit(1)
 
-    hegre = Hegre()
+    if (
+        configuration.parser
+        and set_parser(configuration.parser) != configuration.parser
+    ):
+        console.print(
+            f"[yellow]:warning: Parser '{configuration.parser}' is not installed, falling back to '{set_parser()}'"
+        )
+
+    sync_state = None
+    if configuration.incremental:
+        sync_state = SyncState(configuration.incremental)
+
+    metadata_cache = None
+    if configuration.metadata_cache:
+        metadata_cache = MetadataCache(
+            configuration.metadata_cache, ttl=configuration.metadata_cache_ttl * 3600
+        )
+
+    bandwidth_limiter = None
+    if (
+        configuration.limit_rate
+        or configuration.limit_rate_media
+        or configuration.limit_rate_assets
+        or configuration.limit_rate_schedule
+    ):
+        bandwidth_limiter = BandwidthLimiter(
+            configuration.limit_rate,
+            media_rate=configuration.limit_rate_media,
+            assets_rate=configuration.limit_rate_assets,
+            schedule=configuration.limit_rate_schedule,
+        )
+
+    concurrency = None
+    if configuration.adaptive and not configuration.use_async:
+        concurrency = AdaptiveConcurrency(
+            configuration.min_tasks, configuration.parallel_tasks
+        )
+
+    if configuration.metrics or configuration.summary:
+        metrics = Metrics()
+
+        exporter = None
+        if configuration.metrics:
+            exporter = MetricsExporter(
+                metrics, configuration.metrics, configuration.metrics_interval
+            )
+            exporter.start()
+
+        # the runs below end with sys.exit in several places
+        atexit.register(finish_metrics, configuration, exporter)
+
+    retry_policy = RetryPolicy(
+        max_attempts=configuration.retries + 1,
+        backoff=configuration.retry_backoff,
+        breaker=(
+            CircuitBreaker(configuration.circuit_breaker)
+            if configuration.circuit_breaker
+            else None
+        ),
+    )
+
+    if configuration.use_async:
+        asyncio.run(download_async(configuration))
+        sys.exit(0)
+
+    hegre = Hegre(
+        max_connections=configuration.max_connections,
+        http2=configuration.http2,
+        metadata_cache=metadata_cache,
+        bandwidth_limiter=bandwidth_limiter,
+        concurrency=concurrency,
+        metrics=metrics,
+        retry_policy=retry_policy,
+    )
     login()
 
+    if configuration.refresh_metadata:
+        refresh_metadata_files(configuration)
+        sys.exit(0)
+
+    if configuration.work_ledger:
+        ledger = WorkLedger(configuration.work_ledger, lease=configuration.lease)
+        download_ledger_urls(configuration)
+        sys.exit(0)
+
     for url in configuration.urls:
         console.print(f"Downloading {url}:")
+        sync_key = get_sync_key(url, configuration)
+        stop_at = sync_state.get_mark(sync_key) if sync_key else None
+        newest_urls = []
+
         try:
-            urls = hegre.resolve_urls(url, sort=configuration.sort, show_progress=True)
-            download_urls(urls, configuration)
-        except HegreError as e:
+            if configuration.stream:
+                urls = hegre.iter_urls(
+                    url,
+                    sort=configuration.sort,
+                    workers=configuration.crawl_tasks,
+                    stop_at=stop_at,
+                )
+                succeeded = download_urls(
+                    remember_newest_urls(urls, newest_urls), configuration
+                )
+            else:
+                urls = hegre.resolve_urls(
+                    url,
+                    sort=configuration.sort,
+                    show_progress=True,
+                    workers=configuration.crawl_tasks,
+                    stop_at=stop_at,
+                )
+                newest_urls = urls[:MARK_SIZE]
+                succeeded = download_urls(urls, configuration, total=len(urls))
+
+            if sync_key and succeeded:
+                sync_state.update_mark(sync_key, newest_urls)
+        except (HegreError, HTTPError) as e:
             console.print(f"[red]:x: {e}")
@@ -5,3 +5,17 @@ class HegreError(Exception):
 
 class MovieAlreadyDownloaded(HegreError):
     """The movie has already been downloaded"""
+
+
+class CircuitOpenError(HegreError):
+    """Requests to a host are suspended after too many consecutive failures, see CircuitBreaker"""
+
+    retry_after: float
+
+    def __init__(self, message, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PartialFileMismatch(HegreError):
+    """A partially downloaded file does not match the file on the server and has to be downloaded again"""
@@ -3,24 +3,78 @@ from __future__ import annotations
 import os
 import re
 import json
+import math
+import time
 import httpx
+import hashlib
+import threading
+import importlib.util
 
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Tag
+from bs4.builder import builder_registry
 from rich.progress import Progress, TaskID
 from urllib.parse import urlparse
+from email.utils import formatdate
 from httpx import HTTPError, StreamError
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, BinaryIO, Callable, Iterator, Mapping, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import takewhile
+from collections import deque
 
 from model.movie import HegreMovie
 from model.gallery import HegreGallery
+from model.object_type import ObjectType
+from model.media_file import MediaFile
 from sort_option import SortOption
-from exceptions import HegreError, MovieAlreadyDownloaded
+from exceptions import (
+    HegreError,
+    MovieAlreadyDownloaded,
+    CircuitOpenError,
+    PartialFileMismatch,
+)
 from configuration import Configuration
-
-
-PARSER = "html.parser"
+from metadata_cache import MetadataCache
+from rate_limiter import BandwidthLimiter
+from concurrency import AdaptiveConcurrency
+from helper import CHECKSUM_ALGORITHM, hash_file
+from metrics import Metrics, stage
+from retry import RetryPolicy
+
+
+# parser backends of BeautifulSoup, in the order of preference
+PARSERS = ("lxml", "html.parser")
+PARSER = next(parser for parser in PARSERS if builder_registry.lookup(parser))
+DEFAULT_MAX_CONNECTIONS = 10
+MIN_SEGMENT_SIZE = 1024 * 1024
+# number of listing pages per worker that are fetched ahead of the consumer of the listing
+LISTING_PAGES_PER_WORKER = 2
+# number of bytes a download reads before it advances its progress task
+PROGRESS_BATCH_SIZE = 4 * 1024 * 1024
+# suffix of the file next to a partially downloaded file that stores its ETag/Last-Modified (as JSON)
+VALIDATOR_SUFFIX = ".validator"
+# suffix of the file next to a partial segmented download that records its segments and their state
+SEGMENTS_SUFFIX = ".segments"
+LOGIN_URL = "https://www.hegre.com/login"
+LOGIN_HEADERS = {
+    "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+    "X-Requested-With": "XMLHttpRequest",
+}
+ALL_MOVIES_URL_PATTERN = r"^https?:\/\/www\.hegre\.com\/movies\/?$"
+ALL_GALLERIES_URL_PATTERN = r"^https?:\/\/www\.hegre\.com\/photos\/?$"
+MODEL_URL_PATTERN = r"^https?:\/\/www\.hegre\.com\/models\/[a-z-]+\/?$"
+SINGLE_URL_PATTERN = (
+    r"^https?:\/\/www\.hegre\.com\/(photos|films|massage|sexed|orgasms)\/"
+)
+MOVIES_TOTAL_URL = "https://www.hegre.com/movies?films_page=1"
+GALLERIES_TOTAL_URL = "https://www.hegre.com/photos?galleries_page=1"
+MOVIES_LISTING_URL = "https://www.hegre.com/movies?films_sort={sort}&films_page={page}"
+MOVIES_LISTING_SELECTOR = "#films-listing .item"
+GALLERIES_LISTING_URL = (
+    "https://www.hegre.com/photos?galleries_sort={sort}&galleries_page={page}"
+)
+GALLERIES_LISTING_SELECTOR = "#galleries-listing .item"
 MOVIE_PROGRESS = "[green] [{:>4} / {:>4}] Fetching movie URLs"
 GALLERY_PROGRESS = "[green] [{:>4} / {:>4}] Fetching gallery URLs"
 
@@ -28,15 +82,56 @@ GALLERY_PROGRESS = "[green] [{:>4} / {:>4}] Fetching gallery URLs"
 class Hegre:
     _session: httpx.Client
     _cookies: dict[str, str]
+    _metadata_cache: Optional[MetadataCache]
+    _bandwidth_limiter: Optional[BandwidthLimiter]
+    _concurrency: Optional[AdaptiveConcurrency]
+    _metrics: Optional[Metrics]
+    _retry_policy: RetryPolicy
+    _listing_codes: dict[str, int]
 
     def __init__(
-        self, locale: str = "en", country: str = "US", width: int = 3840
+        self,
+        locale: str = "en",
+        country: str = "US",
+        width: int = 3840,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        http2: bool = True,
+        transport: Optional[httpx.BaseTransport] = None,
+        metadata_cache: Optional[MetadataCache] = None,
+        bandwidth_limiter: Optional[BandwidthLimiter] = None,
+        concurrency: Optional[AdaptiveConcurrency] = None,
+        metrics: Optional[Metrics] = None,
+        retry_policy: Optional[RetryPolicy] = None,
     ) -> None:
-        self._session = httpx.Client()
-        self._cookies = {"locale": locale, "country": country, "_width": str(width)}
+        """Creates a client whose requests all share one pool of keep-alive connections
 
-        for k, v in self._cookies.items():
-            self._session.cookies.set(k, v)
+        Args:
+            locale (str, optional): Locale of the pages. Defaults to "en".
+            country (str, optional): Country of the pages. Defaults to "US".
+            width (int, optional): Screen width reported to hegre.com. Defaults to 3840.
+            max_connections (int, optional): Maximum number of (keep-alive) connections of the pool shared by all requests. Defaults to DEFAULT_MAX_CONNECTIONS.
+            http2 (bool, optional): Use HTTP/2 where the server supports it, if the h2 package is installed. Defaults to True.
+            transport (Optional[httpx.BaseTransport], optional): Custom transport, e.g. for testing. Defaults to None.
+            metadata_cache (Optional[MetadataCache], optional): Cache of parsed movies and galleries. Defaults to None.
+            bandwidth_limiter (Optional[BandwidthLimiter], optional): Limits the bandwidth of all downloads. Defaults to None.
+            concurrency (Optional[AdaptiveConcurrency], optional): Controller that all downloads report their responses and bytes to. Defaults to None.
+            metrics (Optional[Metrics], optional): Records the timings of all stages and the status codes of all responses. Defaults to None.
+            retry_policy (Optional[RetryPolicy], optional): Backoff and circuit breaker of failed page fetches and downloads. Defaults to a RetryPolicy without circuit breaker.
+        """
+        self._cookies = {"locale": locale, "country": country, "_width": str(width)}
+        self._session = httpx.Client(
+            cookies=self._cookies,
+            limits=create_limits(max_connections),
+            http2=http2 and http2_available(),
+            transport=transport,
+            event_hooks={"response": [metrics.record_response]} if metrics else None,
+        )
+        self._metadata_cache = metadata_cache
+        self._bandwidth_limiter = bandwidth_limiter
+        self._concurrency = concurrency
+        self._metrics = metrics
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._listing_codes = {}
 
     def login(self, username: str, password: str) -> None:
         """Starts a session with the given credentials
@@ -48,44 +143,31 @@ class Hegre:
         Raises:
             HegreError: If the authenticity_token could not be extracted or the login failed
         """
-        raw_login_page = self._session.get("https://www.hegre.com/login")
-        login_page = BeautifulSoup(raw_login_page.text, PARSER)
-        find_token = login_page.select('input[name="authenticity_token"]')
-
-        if token_input := find_token[0]:
-            token = token_input.attrs["value"]
-
-            data = {
-                "authenticity_token": token,
-                "username": username,
-                "password": password,
-            }
+        with stage(self._metrics, "login"):
+            raw_login_page = self._get(LOGIN_URL)
+            token = parse_authenticity_token(raw_login_page.text)
 
             r = self._session.post(
-                "https://www.hegre.com/login",
-                data=data,
-                headers={
-                    "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-                    "X-Requested-With": "XMLHttpRequest",
+                LOGIN_URL,
+                data={
+                    "authenticity_token": token,
+                    "username": username,
+                    "password": password,
                 },
+                headers=LOGIN_HEADERS,
             )
 
-            if r.status_code != 200:
-                raise HegreError(f"Failed to login (HTTP {r.status_code}): {r.text}")
-
-            login = json.loads(r.text)
-            if "status" not in login or login["status"] != "success":
-                raise HegreError(f"Failed to login (HTTP {r.status_code}): {r.text}")
-        else:
-            raise HegreError("Could not extract authenticity_token from login page!")
+            check_login_response(r)
 
     def resolve_urls(
         self,
         url: str,
         sort: SortOption = SortOption.MOST_RECENT,
         show_progress: Optional[bool] = False,
+        workers: int = 1,
+        stop_at: Optional[set[str]] = None,
     ) -> list[str]:
-        if re.match(r"^https?:\/\/www\.hegre\.com\/movies\/?$", url):
+        if re.match(ALL_MOVIES_URL_PATTERN, url):
             total = self.get_total_movie_count()
             urls = []
 
@@ -95,13 +177,20 @@ class Hegre:
                         MOVIE_PROGRESS.format(0, total), total=total
                     )
                     urls = self.get_movie_urls(
-                        total, sort, progress=progress, task_id=task_id
+                        total,
+                        sort,
+                        progress=progress,
+                        task_id=task_id,
+                        workers=workers,
+                        stop_at=stop_at,
                     )
             else:
-                urls = self.get_movie_urls(total, sort)
+                urls = self.get_movie_urls(
+                    total, sort, workers=workers, stop_at=stop_at
+                )
 
             return urls
-        elif re.match(r"^https?:\/\/www\.hegre\.com\/photos\/?$", url):
+        elif re.match(ALL_GALLERIES_URL_PATTERN, url):
             total = self.get_total_gallery_count()
             urls = []
 
@@ -111,38 +200,83 @@ class Hegre:
                         GALLERY_PROGRESS.format(0, total), total=total
                     )
                     urls = self.get_gallery_urls(
-                        total, sort, progress=progress, task_id=task_id
+                        total,
+                        sort,
+                        progress=progress,
+                        task_id=task_id,
+                        workers=workers,
+                        stop_at=stop_at,
                     )
             else:
-                urls = self.get_gallery_urls(total, sort)
+                urls = self.get_gallery_urls(
+                    total, sort, workers=workers, stop_at=stop_at
+                )
 
             return urls
-        elif re.match(r"^https?:\/\/www\.hegre\.com\/models\/[a-z-]+\/?$", url):
+        elif re.match(MODEL_URL_PATTERN, url):
             return self.get_model_urls(url)
-        elif re.match(
-            r"^https?:\/\/www\.hegre\.com\/(photos|films|massage|sexed|orgasms)\/", url
-        ):
+        elif re.match(SINGLE_URL_PATTERN, url):
             return [url]
         else:
             raise HegreError(
                 "Unsupported URL! Only galleries, movies, films, massage, sexed and orgasms are supported."
             )
 
-    def get_model_urls(self, url: str) -> list[str]:
-        urls = []
+    def iter_urls(
+        self,
+        url: str,
+        sort: SortOption = SortOption.MOST_RECENT,
+        workers: int = 1,
+        stop_at: Optional[set[str]] = None,
+    ) -> Iterator[str]:
+        """Resolves the given URL like resolve_urls(), but yields the URLs as soon as a listing page has been parsed
 
-        model_page_res = httpx.get(url, cookies=self._cookies)
-        model_page = BeautifulSoup(model_page_res.text, PARSER)
+        This allows to start downloading the first items while the remaining listing pages are still being fetched.
+        Listing pages are only fetched a few pages ahead of the consumer (see _fetch_listing_pages()), so the
+        memory of a slow consumer does not grow with the size of the listing.
 
-        for item in model_page.select("#galleries-listing .item"):
-            url = "https://www.hegre.com" + item.select_one("a").attrs["href"]
-            urls.append(url)
+        Args:
+            url (str): Hegre URL
+            sort (SortOption, optional): Sorting of all movies/galleries. Defaults to SortOption.MOST_RECENT.
+            workers (int, optional): Number of listing pages fetched concurrently. Defaults to 1.
+            stop_at (Optional[set[str]], optional): URLs at which a listing is cut off, see _iter_listing_pages(). Defaults to None.
 
-        for item in model_page.select("#films-listing .item"):
-            url = "https://www.hegre.com" + item.select_one("a").attrs["href"]
-            urls.append(url)
+        Raises:
+            HegreError: If the URL is not supported
 
-        return urls
+        Yields:
+            Iterator[str]: URLs of single movies and galleries
+        """
+        if re.match(ALL_MOVIES_URL_PATTERN, url):
+            total = self.get_total_movie_count()
+            for urls_on_page in self._iter_listing_pages(
+                MOVIES_LISTING_URL,
+                MOVIES_LISTING_SELECTOR,
+                total,
+                sort,
+                workers,
+                stop_at,
+            ):
+                yield from urls_on_page
+        elif re.match(ALL_GALLERIES_URL_PATTERN, url):
+            total = self.get_total_gallery_count()
+            for urls_on_page in self._iter_listing_pages(
+                GALLERIES_LISTING_URL,
+                GALLERIES_LISTING_SELECTOR,
+                total,
+                sort,
+                workers,
+                stop_at,
+            ):
+                yield from urls_on_page
+        else:
+            yield from self.resolve_urls(
+                url, sort=sort, workers=workers, stop_at=stop_at
+            )
+
+    def get_model_urls(self, url: str) -> list[str]:
+        model_page_res = self._get(url)
+        return self._remember_codes(parse_model_page(model_page_res.text))
 
     def get_movie_urls(
         self,
@@ -150,35 +284,27 @@ class Hegre:
         sort: SortOption,
         progress: Optional[Progress] = None,
         task_id: Optional[TaskID] = None,
+        workers: int = 1,
+        stop_at: Optional[set[str]] = None,
     ) -> list[str]:
         urls = []
-        page = 1
-
-        while True:
-            movies_page_res = httpx.get(
-                f"https://www.hegre.com/movies?films_sort={str(sort)}&films_page={page}",
-                cookies=self._cookies,
-            )
-            movies_page = BeautifulSoup(movies_page_res.text, PARSER)
-
-            if len(movies_page.select(".hint")) < 1:
-                urls_on_page = []
-                for item in movies_page.select("#films-listing .item"):
-                    url = "https://www.hegre.com" + item.select_one("a").attrs["href"]
-                    urls_on_page.append(url)
 
-                urls.extend(urls_on_page)
-
-                if progress != None and task_id != None:
-                    progress.update(
-                        task_id,
-                        advance=len(urls_on_page),
-                        description=MOVIE_PROGRESS.format(len(urls), total),
-                    )
+        for urls_on_page in self._iter_listing_pages(
+            MOVIES_LISTING_URL,
+            MOVIES_LISTING_SELECTOR,
+            total,
+            sort,
+            workers,
+            stop_at,
+        ):
+            urls.extend(urls_on_page)
 
-                page += 1
-            else:
-                break
+            if progress != None and task_id != None:
+                progress.update(
+                    task_id,
+                    advance=len(urls_on_page),
+                    description=MOVIE_PROGRESS.format(len(urls), total),
+                )
 
         return urls
 
@@ -188,70 +314,275 @@ class Hegre:
         sort: SortOption,
         progress: Optional[Progress] = None,
         task_id: Optional[TaskID] = None,
+        workers: int = 1,
+        stop_at: Optional[set[str]] = None,
     ) -> list[str]:
         urls = []
+
+        for urls_on_page in self._iter_listing_pages(
+            GALLERIES_LISTING_URL,
+            GALLERIES_LISTING_SELECTOR,
+            total,
+            sort,
+            workers,
+            stop_at,
+        ):
+            urls.extend(urls_on_page)
+
+            if progress != None and task_id != None:
+                progress.update(
+                    task_id,
+                    advance=len(urls_on_page),
+                    description=GALLERY_PROGRESS.format(len(urls), total),
+                )
+
+        return urls
+
+    def _iter_listing_pages(
+        self,
+        page_url: str,
+        selector: str,
+        total: int,
+        sort: SortOption,
+        workers: int = 1,
+        stop_at: Optional[set[str]] = None,
+    ) -> Iterator[list[str]]:
+        """Yields the item URLs of a listing page by page, until one of the URLs in stop_at is reached
+
+        This allows incremental runs to stop paging once they reach the items seen by a previous run.
+        Since only the first pages are expected to contain new items, they are fetched sequentially.
+
+        Args:
+            page_url (str): URL of a listing page with the placeholders {sort} and {page}
+            selector (str): CSS selector of the items on the listing page
+            total (int): Total number of items in the listing
+            sort (SortOption): Sorting of the listing
+            workers (int, optional): Number of listing pages fetched concurrently, if stop_at is empty. Defaults to 1.
+            stop_at (Optional[set[str]], optional): URLs at which the listing is cut off (exclusive). Defaults to None.
+
+        Yields:
+            Iterator[list[str]]: URLs of the items on each page
+        """
+        if not stop_at:
+            yield from self._fetch_listing_pages(
+                page_url, selector, total, sort, workers
+            )
+            return
+
+        for urls_on_page in self._fetch_listing_pages(page_url, selector, total, sort):
+            new_urls = list(takewhile(lambda url: url not in stop_at, urls_on_page))
+            yield new_urls
+
+            if len(new_urls) < len(urls_on_page):
+                return
+
+    def _fetch_listing_pages(
+        self,
+        page_url: str,
+        selector: str,
+        total: int,
+        sort: SortOption,
+        workers: int = 1,
+    ) -> Iterator[list[str]]:
+        """Yields the item URLs of a listing (movies or photos) page by page, in the order of the listing
+
+        With more than one worker, the number of pages is derived from the total and the number of
+        items on the first page, and the remaining pages are fetched concurrently, at most
+        LISTING_PAGES_PER_WORKER pages per worker ahead of the consumer. Pages beyond the derived count
+        (e.g. if items were added in the meantime) are fetched sequentially afterwards.
+
+        Args:
+            page_url (str): URL of a listing page with the placeholders {sort} and {page}
+            selector (str): CSS selector of the items on the listing page
+            total (int): Total number of items in the listing
+            sort (SortOption): Sorting of the listing
+            workers (int, optional): Number of listing pages fetched concurrently. Defaults to 1.
+
+        Yields:
+            Iterator[list[str]]: URLs of the items on each page
+        """
         page = 1
 
+        if workers > 1:
+            urls_on_page = self._get_listing_page_urls(
+                page_url.format(sort=str(sort), page=page), selector
+            )
+            if urls_on_page is None:
+                return
+
+            yield urls_on_page
+            page += 1
+
+            if len(urls_on_page) < 1:
+                return
+
+            page_count = math.ceil(total / len(urls_on_page))
+
+            def fetch(p: int) -> Optional[list[str]]:
+                return self._get_listing_page_urls(
+                    page_url.format(sort=str(sort), page=p), selector
+                )
+
+            # only a few pages per worker are fetched ahead of the consumer, so a consumer that stops
+            # (or is slow) does not leave the rest of the listing to be fetched and buffered
+            pool = ThreadPoolExecutor(max_workers=workers)
+            pending = deque()
+            next_page = page
+            try:
+                while True:
+                    while (
+                        next_page <= page_count
+                        and len(pending) < workers * LISTING_PAGES_PER_WORKER
+                    ):
+                        pending.append(pool.submit(fetch, next_page))
+                        next_page += 1
+
+                    if not pending:
+                        break
+
+                    # the pages are yielded in their order, not in the order of completion
+                    urls_on_page = pending.popleft().result()
+                    if urls_on_page is None:
+                        return
+
+                    yield urls_on_page
+                    page += 1
+            finally:
+                pool.shutdown(cancel_futures=True)
+
         while True:
-            galleries_page_res = httpx.get(
-                f"https://www.hegre.com/photos?galleries_sort={str(sort)}&galleries_page={page}",
-                cookies=self._cookies,
+            urls_on_page = self._get_listing_page_urls(
+                page_url.format(sort=str(sort), page=page), selector
             )
-            galleries_page = BeautifulSoup(galleries_page_res.text, PARSER)
+            if urls_on_page is None:
+                return
 
-            if len(galleries_page.select(".hint")) < 1:
-                urls_on_page = []
-                for item in galleries_page.select("#galleries-listing .item"):
-                    url = "https://www.hegre.com" + item.select_one("a").attrs["href"]
-                    urls_on_page.append(url)
+            yield urls_on_page
+            page += 1
 
-                urls.extend(urls_on_page)
+    def _get_listing_page_urls(self, url: str, selector: str) -> Optional[list[str]]:
+        """Returns the item URLs of a single listing page or None, if the page is past the end of the listing"""
+        listing_page_res = self._get(url, "listing_fetch")
+        with stage(self._metrics, "listing_parse"):
+            items = parse_listing_page(listing_page_res.text, selector)
 
-                if progress != None and task_id != None:
-                    progress.update(
-                        task_id,
-                        advance=len(urls_on_page),
-                        description=GALLERY_PROGRESS.format(len(urls), total),
-                    )
+        return self._remember_codes(items) if items is not None else None
 
-                page += 1
-            else:
-                break
+    def _remember_codes(self, items: dict[str, Optional[int]]) -> list[str]:
+        """Remembers the codes of listing items for get_archive_id() and returns their URLs"""
+        for url, code in items.items():
+            if code is not None:
+                self._listing_codes[url] = code
 
-        return urls
+        return list(items)
 
-    def get_total_movie_count(self) -> int:
-        movies_page_res = httpx.get(
-            f"https://www.hegre.com/movies?films_page=1",
-            cookies=self._cookies,
-        )
+    def get_archive_id(self, url: str) -> Optional[str]:
+        """Returns the archive ID of a movie or gallery without fetching its page, if the code is known
+        from a listing page or the metadata cache
 
-        movies_page = BeautifulSoup(movies_page_res.text, PARSER)
-        return int(movies_page.select_one("h2 strong").text)
+        The code from a listing page is forgotten once it has been used, so the codes of a streamed
+        listing do not pile up over the run.
 
-    def get_total_gallery_count(self) -> int:
-        galleries_page_res = httpx.get(
-            f"https://www.hegre.com/photos?galleries_page=1",
-            cookies=self._cookies,
-        )
+        Args:
+            url (str): URL of a movie or gallery
 
-        galleries_page = BeautifulSoup(galleries_page_res.text, PARSER)
-        return int(galleries_page.select_one("h2 strong").text)
+        Returns:
+            Optional[str]: Archive ID or None, if it is unknown
+        """
+        if code := self._listing_codes.pop(url, None):
+            return archive_id_from_url(url, code)
+
+        if self._metadata_cache:
+            return self._metadata_cache.get_archive_id(url)
+
+        return None
+
+    def get_total_movie_count(self) -> int:
+        movies_page_res = self._get(MOVIES_TOTAL_URL)
+        return parse_total_count(movies_page_res.text)
 
-    def get_movie_from_url(self, url: str) -> HegreMovie:
+    def get_total_gallery_count(self) -> int:
+        galleries_page_res = self._get(GALLERIES_TOTAL_URL)
+        return parse_total_count(galleries_page_res.text)
+
+    def get_movie_from_url(self, url: str, revalidate: bool = False) -> HegreMovie:
         if "login" not in self._session.cookies:
             raise HegreError("No active session detected, please login first!")
 
-        film_page_res = self._session.get(url)
-        film_page = BeautifulSoup(film_page_res.text, PARSER)
+        return self._get_object(url, parse_film_page, revalidate)
+
+    def get_gallery_from_url(self, url: str, revalidate: bool = False) -> HegreGallery:
+        return self._get_object(url, parse_gallery_page, revalidate)
+
+    def _get_object(
+        self,
+        url: str,
+        parse: Callable[[str, str], HegreMovie | HegreGallery],
+        revalidate: bool = False,
+    ) -> HegreMovie | HegreGallery:
+        """Fetches and parses the page of a movie or gallery, unless it is available in the metadata cache
+
+        Args:
+            url (str): URL of the page
+            parse (Callable[[str, str], HegreMovie | HegreGallery]): Parses the URL and HTML of the page
+            revalidate (bool, optional): Revalidate a cached object with a conditional request, even if it is within its TTL. Defaults to False.
+
+        Returns:
+            HegreMovie | HegreGallery: Movie or gallery of the page
+        """
+        cached = self._metadata_cache.get(url) if self._metadata_cache else None
+        if cached and not revalidate and cached.is_fresh(self._metadata_cache.ttl):
+            return cached.hegre_object
+
+        page_res = self._get(
+            url, "page_fetch", headers=cached.validators() if cached else None
+        )
+        if cached and page_res.status_code == 304:
+            self._metadata_cache.touch(url)
+            return cached.hegre_object
+
+        with stage(self._metrics, "page_parse"):
+            hegre_object = parse(url, page_res.text)
+
+        if self._metadata_cache:
+            self._metadata_cache.put(
+                hegre_object,
+                page_res.headers.get("ETag"),
+                page_res.headers.get("Last-Modified"),
+            )
+
+        return hegre_object
+
+    def _get(
+        self,
+        url: str,
+        stage_name: Optional[str] = None,
+        headers: Optional[dict[str, str]] = None,
+    ) -> httpx.Response:
+        """Fetches a page, repeating failed requests according to the retry policy
+
+        Args:
+            url (str): URL of the page
+            stage_name (Optional[str], optional): Stage the request is timed as, see Metrics. Defaults to None.
+            headers (Optional[dict[str, str]], optional): Additional request headers. Defaults to None.
+
+        Raises:
+            HTTPError: If the last attempt failed or the response has a status that is not worth retrying (e.g. 404)
+        """
+
+        def get() -> httpx.Response:
+            with stage(self._metrics, stage_name):
+                response = self._session.get(url, headers=headers)
+                if response.is_error:
+                    response.raise_for_status()
 
-        return HegreMovie.from_film_page(url, film_page)
+            return response
 
-    def get_gallery_from_url(self, url: str) -> HegreGallery:
-        gallery_page_res = httpx.get(url, cookies=self._cookies)
-        gallery_page = BeautifulSoup(gallery_page_res.text, PARSER)
+        def count_retry(*_) -> None:
+            if self._metrics and stage_name:
+                self._metrics.add_retry(stage_name)
 
-        return HegreGallery.from_gallery_page(url, gallery_page)
+        return self._retry_policy.call(url, get, on_retry=count_retry)
 
     def download_movie(
         self,
@@ -260,121 +591,179 @@ class Hegre:
         progress: Optional[Progress] = None,
         task_prefix: str = "",
     ) -> None:
-        if "login" not in self._session.cookies:
-            raise HegreError("No active session detected, please login first!")
-
-        # create subfolder for each year, if the movie has a date
-        if movie.date:
-            dest_folder = os.path.join(
-                configuration.destination_folder, str(movie.date.year)
-            )
-        else:
-            dest_folder = configuration.destination_folder
-
-        if not os.path.exists(dest_folder):
-            os.makedirs(dest_folder, exist_ok=True)
-
-        _, url = movie.get_download_url_for_res(configuration.resolution)
+        self._download_object(movie, configuration, progress, task_prefix)
 
-        filename, metadata_filename = generate_filename(url, movie)
-        thumbnail, _ = generate_filename(movie.cover_url, movie)
+    def download_gallery(
+        self,
+        gallery: HegreGallery,
+        configuration: Configuration,
+        progress: Optional[Progress] = None,
+        task_prefix: str = "",
+    ) -> None:
+        self._download_object(gallery, configuration, progress, task_prefix)
 
-        try:
-            if not configuration.no_download:
-                self._download_with_retries(
-                    url,
-                    dest_folder,
-                    filename,
+    def _download_object(
+        self,
+        hegre_object: HegreMovie | HegreGallery,
+        configuration: Configuration,
+        progress: Optional[Progress] = None,
+        task_prefix: str = "",
+    ) -> None:
+        """Downloads the file of a movie/gallery and its assets, which are downloaded in parallel to the file"""
+        dest_folder = get_destination_folder(hegre_object, configuration)
+
+        with ThreadPoolExecutor(max_workers=configuration.asset_tasks) as pool:
+            assets = [
+                pool.submit(
+                    self.download_asset,
+                    asset_url,
+                    asset_file,
+                    configuration,
                     progress,
                     task_prefix,
-                    max_attempts=configuration.retries + 1,
-                )
-
-            if not configuration.no_meta:
-                movie.write_metadata_file(dest_folder, metadata_filename)
-
-            if not configuration.no_thumb:
-                self._download_file(
-                    movie.cover_url, os.path.join(dest_folder, thumbnail)
-                )
-
-            if not configuration.no_subtitles:
-                subtitle_urls = movie.get_subtitle_download_urls(
-                    configuration.subtitles
                 )
-                for url in subtitle_urls:
-                    sub_filename, _ = generate_filename(url, movie)
-                    self._download_file(url, os.path.join(dest_folder, sub_filename))
-
-            if configuration.screengrabs and movie.screengrabs_url:
-                screengrab_file, _ = generate_filename(movie.screengrabs_url, movie)
-                self._download_file(
-                    movie.screengrabs_url, os.path.join(dest_folder, screengrab_file)
+                for asset_url, asset_file in get_sidecar_files(
+                    hegre_object, configuration, dest_folder
                 )
+            ]
 
-            if configuration.trailer:
-                _, url = movie.get_trailer_download_url_for_res(
-                    configuration.resolution
-                )
-                trailer_file, _ = generate_filename(url, movie)
-                self._download_file(url, os.path.join(dest_folder, trailer_file))
+            self.download_media(hegre_object, configuration, progress, task_prefix)
 
-        except MovieAlreadyDownloaded as e:
-            if progress:
-                progress.console.print(f"{task_prefix}Skipping '{movie.title}': {e}")
-            else:
-                raise e
+            for asset in assets:
+                asset.result()
 
-    def download_gallery(
+    def download_media(
         self,
-        gallery: HegreGallery,
+        hegre_object: HegreMovie | HegreGallery,
         configuration: Configuration,
         progress: Optional[Progress] = None,
         task_prefix: str = "",
     ) -> None:
+        """Downloads the movie/gallery file and writes the metadata file
+
+        Args:
+            hegre_object (HegreMovie | HegreGallery): Movie or gallery to download
+            configuration (Configuration): Download configuration
+            progress (Optional[Progress], optional): Progress to report to. Defaults to None.
+            task_prefix (str, optional): Prefix of the progress task. Defaults to "".
+
+        Raises:
+            HegreError: If there is no active session
+            MovieAlreadyDownloaded: If the file exists already and there is no progress to report it to
+        """
         if "login" not in self._session.cookies:
             raise HegreError("No active session detected, please login first!")
 
-        # create subfolder for each year, if the movie has a date
-        if gallery.date:
-            dest_folder = os.path.join(
-                configuration.destination_folder, str(gallery.date.year)
-            )
-        else:
-            dest_folder = configuration.destination_folder
-
-        if not os.path.exists(dest_folder):
-            os.makedirs(dest_folder, exist_ok=True)
+        dest_folder = get_destination_folder(hegre_object, configuration)
 
-        _, url = gallery.get_download_url_for_res(configuration.resolution)
+        _, url = hegre_object.get_download_url_for_res(configuration.resolution)
 
-        filename, metadata_filename = generate_filename(url, gallery)
-        thumbnail, _ = generate_filename(gallery.cover_url, gallery)
+        filename, metadata_filename = generate_filename(url, hegre_object)
 
         try:
             if not configuration.no_download:
-                self._download_with_retries(
+                checksum = self._download_with_retries(
                     url,
                     dest_folder,
                     filename,
                     progress,
                     task_prefix,
                     max_attempts=configuration.retries + 1,
+                    segments=configuration.segments,
+                    checksum=True,
                 )
-
-            if not configuration.no_meta:
-                gallery.write_metadata_file(dest_folder, metadata_filename)
-
-            if not configuration.no_thumb:
-                self._download_file(
-                    gallery.cover_url, os.path.join(dest_folder, thumbnail)
+                hegre_object.file = MediaFile(
+                    filename,
+                    os.path.getsize(os.path.join(dest_folder, filename)),
+                    checksum,
                 )
         except MovieAlreadyDownloaded as e:
             if progress:
-                progress.console.print(f"{task_prefix}Skipping '{gallery.title}': {e}")
+                progress.console.print(
+                    f"{task_prefix}Skipping '{hegre_object.title}': {e}"
+                )
+                return
             else:
                 raise e
 
+        if not configuration.no_meta:
+            with stage(self._metrics, "metadata_write"):
+                hegre_object.write_metadata_file(dest_folder, metadata_filename)
+
+    def download_asset(
+        self,
+        url: str,
+        dest_file: str,
+        configuration: Configuration,
+        progress: Optional[Progress] = None,
+        task_prefix: str = "",
+    ) -> None:
+        """Downloads an additional file of a movie/gallery (see get_sidecar_files()), unless it exists already
+
+        With configuration.refresh_assets, an existing file is revalidated with a conditional request and
+        replaced, if it has changed on the server.
+
+        Args:
+            url (str): URL of the asset
+            dest_file (str): Destination file
+            configuration (Configuration): Download configuration
+            progress (Optional[Progress], optional): Progress to report to. Defaults to None.
+            task_prefix (str, optional): Prefix of the progress task. Defaults to "".
+        """
+        try:
+            self._download_with_retries(
+                url,
+                os.path.dirname(dest_file),
+                os.path.basename(dest_file),
+                progress,
+                task_prefix,
+                max_attempts=configuration.retries + 1,
+                asset=True,
+            )
+        except MovieAlreadyDownloaded:
+            if configuration.refresh_assets and self._refresh_asset(url, dest_file):
+                if progress:
+                    progress.console.print(
+                        f"{task_prefix}Updated '{os.path.basename(dest_file)}'"
+                    )
+
+    def _refresh_asset(self, url: str, dest_file: str) -> bool:
+        """Revalidates an existing asset with a conditional GET and replaces it, if it has changed on the server
+
+        Returns:
+            bool: True, if the asset has been replaced
+        """
+        temp_file = f"{dest_file}.temp"
+
+        def refresh() -> bool:
+            started = time.monotonic()
+            with self._session.stream(
+                "GET",
+                url,
+                headers=get_asset_validators(dest_file, self._metadata_cache),
+            ) as stream:
+                self._record_response(stream, started)
+                if stream.status_code == 304:
+                    return False
+
+                stream.raise_for_status()
+                with open(temp_file, "wb") as file:
+                    self._write_body(stream, file, asset=True)
+                    check_body_length(stream, file.tell())
+
+            os.replace(temp_file, dest_file)
+            if self._metadata_cache:
+                self._metadata_cache.put_asset_validators(
+                    dest_file,
+                    stream.headers.get("ETag"),
+                    stream.headers.get("Last-Modified"),
+                )
+
+            return True
+
+        with stage(self._metrics, "asset_revalidate"):
+            return self._retry_policy.call(url, refresh)
+
     def _download_with_retries(
         self,
         url: str,
@@ -383,46 +772,96 @@ class Hegre:
         progress: Optional[Progress] = None,
         task_prefix: str = "",
         max_attempts: int = 3,
-    ):
+        segments: int = 1,
+        asset: bool = False,
+        checksum: bool = False,
+    ) -> Optional[str]:
+        """Downloads a file into <filename>.temp, retrying failed attempts, and renames it once it is complete
+
+        Returns:
+            Optional[str]: Hex digest (see CHECKSUM_ALGORITHM) of the file, if checksum is set
+        """
         dest_file = os.path.join(destination_folder, filename)
         temp_file = os.path.join(destination_folder, f"{filename}.temp")
 
         if os.path.exists(dest_file):
             raise MovieAlreadyDownloaded(f"{filename} exists already!")
 
+        task_id = None
         if progress:
             task_id = progress.add_task(task_prefix + filename, start=False)
 
+        transfer_stage = "asset_transfer" if asset else "transfer"
         attempt = 1
         failed = True
         while failed and attempt <= max_attempts:
             try:
-                self._download_file(url, temp_file, progress, task_id)
+                self._retry_policy.check(url)
+                with stage(self._metrics, transfer_stage):
+                    # a temp file left behind by a failed attempt or a previous run is resumed
+                    if segments > 1 and not os.path.exists(temp_file):
+                        digest = self._download_file_segmented(
+                            url,
+                            temp_file,
+                            segments,
+                            progress,
+                            task_id,
+                            checksum=checksum,
+                        )
+                    else:
+                        digest = self._download_file(
+                            url,
+                            temp_file,
+                            progress,
+                            task_id,
+                            resume=True,
+                            asset=asset,
+                            checksum=checksum,
+                        )
+                self._retry_policy.record(url)
                 failed = False
-            except (HTTPError, StreamError) as e:
-                os.remove(temp_file)
+            except (HTTPError, StreamError, CircuitOpenError) as e:
+                self._retry_policy.record(url, e)
+                delay = self._retry_policy.get_delay(attempt, e)
 
-                if attempt + 1 > max_attempts:
+                if delay is None or attempt + 1 > max_attempts:
                     raise e
                 elif progress:
                     progress.console.print(
-                        f"[yellow]:warning: Failed attempt {attempt} to download '{filename}': {e}"
+                        f"[yellow]:warning: Failed attempt {attempt} to download '{filename}', retrying in {delay:.1f} s: {e}"
                     )
                 else:
                     raise HegreError(
                         f"Failed attempt {attempt} to download {filename}: {e}"
                     )
+            except BaseException:
+                # e.g. a full disk or a missing header, which says nothing about the health of the host
+                self._retry_policy.release(url)
+                raise
 
-            if failed:
+            if failed and progress:
                 attempt += 1
+                if self._metrics:
+                    self._metrics.add_retry(transfer_stage)
                 progress.update(
                     task_id, description=f"[red strike]{task_prefix}{filename}[/]"
                 )
                 progress.stop_task(task_id)
+                self._retry_policy.sleep(delay)
                 task_id = progress.add_task(task_prefix + filename, start=False)
 
         # we can assume a successful download here
-        os.rename(temp_file, dest_file)
+        with stage(self._metrics, "rename"):
+            validators = load_resume_validators(temp_file)
+            os.rename(temp_file, dest_file)
+            store_resume_validators(temp_file, {})
+
+        if asset and self._metadata_cache and validators:
+            self._metadata_cache.put_asset_validators(
+                dest_file, validators.get("ETag"), validators.get("Last-Modified")
+            )
+
+        return digest
 
     def _download_file(
         self,
@@ -430,22 +869,295 @@ class Hegre:
         dest_file: str,
         progress: Optional[Progress] = None,
         task_id: Optional[TaskID] = None,
-        chunk_size: int = 16 * 1024,
-    ):
-        with self._session.stream("GET", url) as stream:
-            stream.raise_for_status()
+        chunk_size: Optional[int] = None,
+        resume: bool = False,
+        asset: bool = False,
+        checksum: bool = False,
+    ) -> Optional[str]:
+        """Downloads a file, optionally resuming a partially downloaded file with a HTTP range request
 
-            with open(dest_file, "wb") as file:
-                content_length = int(stream.headers["Content-Length"])
+        The file is hashed while it is written, so computing its checksum costs no extra reads (except
+        for the already downloaded part of a resumed file).
+
+        Args:
+            url (str): URL of the file
+            dest_file (str): Destination file
+            progress (Optional[Progress], optional): Progress to report to. Defaults to None.
+            task_id (Optional[TaskID], optional): Progress task of the download. Defaults to None.
+            chunk_size (Optional[int], optional): Size of the chunks that are written. Defaults to the size of the reads from the connection.
+            resume (bool, optional): Continue an existing destination file instead of overwriting it. Defaults to False.
+            asset (bool, optional): The file is an asset (thumbnail, subtitles, ...) rather than a media file, which matters for the bandwidth limits. Defaults to False.
+            checksum (bool, optional): Compute the checksum of the file. Defaults to False.
+
+        Raises:
+            StreamError: If the body ended before Content-Length bytes have been read
+
+        Returns:
+            Optional[str]: Hex digest (see CHECKSUM_ALGORITHM) of the file, if checksum is set
+        """
+        offset, headers = get_resume_request(dest_file) if resume else (0, {})
 
-                if progress and task_id != None:
-                    progress.update(task_id, total=content_length)
-                    progress.start_task(task_id)
+        started = time.monotonic()
+        try:
+            with self._session.stream("GET", url, headers=headers) as stream:
+                self._record_response(stream, started)
+                offset = check_range_response(stream, dest_file, offset)
+                if offset is None:
+                    if progress and task_id != None:
+                        size = get_resume_offset(dest_file)
+                        progress.update(task_id, total=size, completed=size)
+                    return hash_file(dest_file).hexdigest() if checksum else None
+
+                if offset == 0:
+                    store_resume_validators(dest_file, get_validators(stream.headers))
+
+                digest = None
+                if checksum:
+                    digest = (
+                        hash_file(dest_file, size=offset)
+                        if offset > 0
+                        else hashlib.new(CHECKSUM_ALGORITHM)
+                    )
 
-                for chunk in stream.iter_bytes(chunk_size=chunk_size):
-                    file.write(chunk)
+                with open(dest_file, "ab" if offset > 0 else "wb") as file:
                     if progress and task_id != None:
-                        progress.update(task_id, advance=chunk_size)
+                        content_length = stream.headers.get("Content-Length")
+                        progress.update(
+                            task_id,
+                            total=offset + int(content_length)
+                            if content_length
+                            else None,
+                            completed=offset,
+                        )
+                        progress.start_task(task_id)
+
+                    self._write_body(
+                        stream, file, chunk_size, progress, task_id, asset, digest
+                    )
+                    check_body_length(stream, file.tell() - offset)
+        except PartialFileMismatch:
+            # the partial file has been removed, so the file is downloaded from the start
+            return self._download_file(
+                url, dest_file, progress, task_id, chunk_size, False, asset, checksum
+            )
+
+        return digest.hexdigest() if digest else None
+
+    def _download_file_segmented(
+        self,
+        url: str,
+        dest_file: str,
+        segments: int,
+        progress: Optional[Progress] = None,
+        task_id: Optional[TaskID] = None,
+        chunk_size: Optional[int] = None,
+        checksum: bool = False,
+    ) -> Optional[str]:
+        """Downloads a file over several parallel connections, each fetching a byte range of the file
+
+        The segments are written at their offsets into a preallocated <dest_file>.part, which is renamed
+        to dest_file once all segments are complete. Completed segments are recorded in
+        <dest_file>.part.segments, so a later attempt only downloads the missing segments, as long as the
+        file on the server still has the same validator. If a segment fails, the other segments stop.
+        Servers that do not support range requests and small files are downloaded over a single
+        connection. As the segments arrive out of order, the checksum is computed from the complete file,
+        which is usually still in the page cache.
+
+        Args:
+            url (str): URL of the file
+            dest_file (str): Destination file
+            segments (int): Number of segments (and connections)
+            progress (Optional[Progress], optional): Progress to report to. Defaults to None.
+            task_id (Optional[TaskID], optional): Progress task of the download. Defaults to None.
+            chunk_size (Optional[int], optional): Size of the chunks that are written. Defaults to the size of the reads from the connection.
+            checksum (bool, optional): Compute the checksum of the file. Defaults to False.
+
+        Returns:
+            Optional[str]: Hex digest (see CHECKSUM_ALGORITHM) of the file, if checksum is set
+        """
+        # request the first byte only to learn the size of the file and whether ranges are supported
+        with self._session.stream("GET", url, headers={"Range": "bytes=0-0"}) as probe:
+            probe.raise_for_status()
+            _, _, length = parse_content_range(probe.headers.get("Content-Range", ""))
+            validator = get_if_range(probe.headers)
+
+        part_file = f"{dest_file}.part"
+        segment_map = load_segment_map(part_file)
+
+        if segment_map and (
+            segment_map["length"] != length
+            or not validator
+            or segment_map["validator"] != validator
+            or get_resume_offset(part_file) != length
+        ):
+            # the file has changed on the server since the part file has been started
+            segment_map = None
+            for stale_file in (part_file, f"{part_file}{SEGMENTS_SUFFIX}"):
+                if os.path.exists(stale_file):
+                    os.remove(stale_file)
+
+        if not segment_map and (
+            probe.status_code != 206
+            or not length
+            or length < segments * MIN_SEGMENT_SIZE
+        ):
+            return self._download_file(
+                url, dest_file, progress, task_id, chunk_size, checksum=checksum
+            )
+
+        if not segment_map:
+            segment_size = math.ceil(length / segments)
+            segment_map = {
+                "length": length,
+                "validator": validator,
+                "segments": [
+                    [first_byte, min(first_byte + segment_size, length) - 1, False]
+                    for first_byte in range(0, length, segment_size)
+                ],
+            }
+
+            with open(part_file, "wb") as file:
+                preallocate(file, length)
+            store_segment_map(part_file, segment_map)
+
+        missing = [segment for segment in segment_map["segments"] if not segment[2]]
+
+        if progress and task_id != None:
+            progress.update(
+                task_id,
+                total=length,
+                completed=sum(
+                    last - first + 1
+                    for first, last, done in segment_map["segments"]
+                    if done
+                ),
+            )
+            progress.start_task(task_id)
+
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def download_segment(segment: list) -> None:
+            first_byte, last_byte, _ = segment
+            headers = {"Range": f"bytes={first_byte}-{last_byte}"}
+            if validator:
+                headers["If-Range"] = validator
+
+            started = time.monotonic()
+            with self._session.stream("GET", url, headers=headers) as stream:
+                self._record_response(stream, started)
+                stream.raise_for_status()
+
+                if (
+                    stream.status_code != 206
+                    or parse_content_range(stream.headers.get("Content-Range", ""))[0]
+                    != first_byte
+                ):
+                    raise HTTPError(
+                        f"Server did not respond with the requested range {first_byte}-{last_byte}"
+                    )
+
+                with open(part_file, "r+b") as file:
+                    file.seek(first_byte)
+
+                    self._write_body(
+                        stream, file, chunk_size, progress, task_id, stop=stop
+                    )
+
+                    if file.tell() != last_byte + 1:
+                        raise StreamError(
+                            f"Segment {first_byte}-{last_byte} ended after {file.tell() - first_byte} bytes"
+                        )
+
+            with lock:
+                segment[2] = True
+                store_segment_map(part_file, segment_map)
+
+        pool = ThreadPoolExecutor(max_workers=max(len(missing), 1))
+        try:
+            futures = [pool.submit(download_segment, segment) for segment in missing]
+
+            for future in as_completed(futures):
+                future.result()
+        except BaseException:
+            # the other segments stop after their current chunk, the completed ones are resumed later
+            stop.set()
+            raise
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+        os.rename(part_file, dest_file)
+        os.remove(f"{part_file}{SEGMENTS_SUFFIX}")
+
+        return hash_file(dest_file).hexdigest() if checksum else None
+
+    def _write_body(
+        self,
+        stream: httpx.Response,
+        file: BinaryIO,
+        chunk_size: Optional[int] = None,
+        progress: Optional[Progress] = None,
+        task_id: Optional[TaskID] = None,
+        asset: bool = False,
+        digest: Optional["hashlib._Hash"] = None,
+        stop: Optional[threading.Event] = None,
+    ) -> None:
+        """Writes the body of a response to a file, advancing the progress task in batches of PROGRESS_BATCH_SIZE
+        and updating the digest with every chunk
+
+        Raises:
+            StreamError: If the stop event is set before the body has been written
+        """
+        unreported = 0
+        written = 0
+        write_seconds = 0.0
+
+        try:
+            for chunk in iter_body(stream, chunk_size):
+                if stop and stop.is_set():
+                    raise StreamError("Download has been stopped")
+
+                self._transfer_chunk(len(chunk), asset)
+
+                write_started = time.perf_counter()
+                file.write(chunk)
+                write_seconds += time.perf_counter() - write_started
+
+                if digest:
+                    digest.update(chunk)
+
+                written += len(chunk)
+                unreported += len(chunk)
+                if unreported >= PROGRESS_BATCH_SIZE and progress and task_id != None:
+                    progress.update(task_id, advance=unreported)
+                    unreported = 0
+        finally:
+            if self._metrics:
+                self._metrics.add_bytes(
+                    "asset_transfer" if asset else "transfer", written
+                )
+                self._metrics.observe("disk_write", write_seconds)
+
+        if unreported and progress and task_id != None:
+            progress.update(task_id, advance=unreported)
+
+    def _record_response(self, response: httpx.Response, started: float) -> None:
+        """Reports the status and the latency of a download response to the concurrency controller and the metrics"""
+        latency = time.monotonic() - started
+
+        if self._concurrency:
+            self._concurrency.record_response(response.status_code, latency)
+
+        if self._metrics:
+            self._metrics.observe("first_byte", latency)
+
+    def _transfer_chunk(self, size: int, asset: bool = False) -> None:
+        """Waits until the bandwidth limiter allows a chunk and reports it to the concurrency controller"""
+        if self._bandwidth_limiter:
+            self._bandwidth_limiter.consume(size, asset)
+
+        if self._concurrency:
+            self._concurrency.record_bytes(size)
 
 
 def generate_filename(
@@ -466,3 +1178,427 @@ def generate_filename(
             f"{hegre_object.code}-{original_name}",
             f"{hegre_object.code}-{name}.json",
         )
+
+
+def parser_available(parser: str) -> bool:
+    return builder_registry.lookup(parser) is not None
+
+
+def select_parser(preferred: Optional[str] = None) -> str:
+    """Returns the preferred parser backend, if it is installed, or else the first installed one of PARSERS
+
+    lxml parses pages several times faster than Python's html.parser, but is an optional dependency.
+    """
+    if preferred and parser_available(preferred):
+        return preferred
+
+    return next(parser for parser in PARSERS if parser_available(parser))
+
+
+def set_parser(preferred: Optional[str] = None) -> str:
+    """Sets the parser backend used for all pages, see select_parser()
+
+    Returns:
+        str: Parser backend that is actually used
+    """
+    global PARSER
+    PARSER = select_parser(preferred)
+
+    return PARSER
+
+
+def http2_available() -> bool:
+    """HTTP/2 support of httpx requires the optional h2 package (pip install httpx[http2])"""
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_limits(max_connections: int) -> httpx.Limits:
+    """Returns the connection limits for a pool that keeps all of its connections alive"""
+    return httpx.Limits(
+        max_connections=max_connections, max_keepalive_connections=max_connections
+    )
+
+
+def can_read_raw(response: httpx.Response) -> bool:
+    """Returns True, if the body of a response can be read without decoding and has not been read already"""
+    return (
+        response.headers.get("Content-Encoding", "identity").lower() == "identity"
+        and not response.is_stream_consumed
+    )
+
+
+def iter_body(
+    response: httpx.Response, chunk_size: Optional[int] = None
+) -> Iterator[bytes]:
+    """Iterates over the body of a response, skipping the decoder if the body is not encoded
+
+    Without a chunk size, the chunks are yielded as they are read from the connection, which avoids
+    copying them into chunks of a fixed size.
+    """
+    if can_read_raw(response):
+        return response.iter_raw(chunk_size=chunk_size)
+
+    return response.iter_bytes(chunk_size=chunk_size)
+
+
+def aiter_body(
+    response: httpx.Response, chunk_size: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """Asynchronous counterpart of iter_body()"""
+    if can_read_raw(response):
+        return response.aiter_raw(chunk_size=chunk_size)
+
+    return response.aiter_bytes(chunk_size=chunk_size)
+
+
+def preallocate(file: BinaryIO, size: int) -> None:
+    """Sets the size of a file and reserves its disk space, if the platform and the file system support it"""
+    file.truncate(size)
+
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(file.fileno(), 0, size)
+        except OSError:
+            # the file stays sparse
+            pass
+
+
+def get_asset_validators(
+    dest_file: str, metadata_cache: Optional[MetadataCache] = None
+) -> dict[str, str]:
+    """Returns the headers of a conditional request for an existing asset
+
+    These are the ETag/Last-Modified stored in the metadata cache or, if there are none, the modification
+    time of the file: the asset has not changed, unless the server modified it after it has been written.
+    """
+    if metadata_cache and (
+        validators := metadata_cache.get_asset_validators(dest_file)
+    ):
+        return validators
+
+    return {"If-Modified-Since": formatdate(os.path.getmtime(dest_file), usegmt=True)}
+
+
+def check_body_length(response: httpx.Response, size: int) -> None:
+    """Checks that a complete body of the given size has been read
+
+    Raises:
+        StreamError: If the body ended before Content-Length bytes have been read
+    """
+    # the Content-Length of an encoded body is the length of the encoded bytes
+    if (
+        response.headers.get("Content-Encoding", "identity") == "identity"
+        and "Content-Length" in response.headers
+        and size != int(response.headers["Content-Length"])
+    ):
+        raise StreamError(
+            f"Download ended after {size} of {response.headers['Content-Length']} bytes"
+        )
+
+
+def get_resume_offset(dest_file: str) -> int:
+    """Returns the number of bytes of a partially downloaded file or 0, if there is none"""
+    if os.path.exists(dest_file):
+        return os.path.getsize(dest_file)
+
+    return 0
+
+
+def parse_content_range(
+    content_range: str,
+) -> tuple[Optional[int], Optional[int], Optional[int]]:
+    """Parses a Content-Range header (e.g. "bytes 100-199/200" or "bytes */200")
+
+    Returns:
+        tuple[Optional[int], Optional[int], Optional[int]]: First byte, last byte and complete length; None for each unknown value
+    """
+    match = re.match(r"^bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)$", content_range.strip())
+    if not match:
+        return None, None, None
+
+    return tuple(
+        int(value) if value and value != "*" else None for value in match.groups()
+    )
+
+
+def get_validators(headers: Mapping[str, str]) -> dict[str, str]:
+    """Returns the ETag and Last-Modified of the headers of a response, as far as they are present"""
+    return {
+        name: headers[name] for name in ("ETag", "Last-Modified") if headers.get(name)
+    }
+
+
+def get_if_range(validators: Mapping[str, str]) -> Optional[str]:
+    """Returns the validator an If-Range request can use: the strong ETag or else the Last-Modified"""
+    etag = validators.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+
+    return validators.get("Last-Modified")
+
+
+def load_resume_validators(dest_file: str) -> dict[str, str]:
+    """Returns the ETag/Last-Modified stored when a partially downloaded file has been started, if any"""
+    try:
+        with open(f"{dest_file}{VALIDATOR_SUFFIX}", "r", encoding="utf-8") as file:
+            validators = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+    # a plain validator of a previous version is no dict, its partial file is downloaded again
+    return validators if isinstance(validators, dict) else {}
+
+
+def store_resume_validators(dest_file: str, validators: dict[str, str]) -> None:
+    """Stores the ETag/Last-Modified of a partially downloaded file, or removes them if there are none"""
+    validator_file = f"{dest_file}{VALIDATOR_SUFFIX}"
+
+    if validators:
+        with open(validator_file, "w", encoding="utf-8") as file:
+            json.dump(validators, file)
+    elif os.path.exists(validator_file):
+        os.remove(validator_file)
+
+
+def load_segment_map(part_file: str) -> Optional[dict]:
+    """Returns the length, validator and segments (first byte, last byte, completed) of a partial segmented download, if any"""
+    try:
+        with open(f"{part_file}{SEGMENTS_SUFFIX}", "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def store_segment_map(part_file: str, segment_map: dict) -> None:
+    """Records the segments of a partial segmented download, replacing the previous record atomically"""
+    segments_file = f"{part_file}{SEGMENTS_SUFFIX}"
+
+    with open(f"{segments_file}.temp", "w", encoding="utf-8") as file:
+        json.dump(segment_map, file)
+    os.replace(f"{segments_file}.temp", segments_file)
+
+
+def get_resume_request(dest_file: str) -> tuple[int, dict[str, str]]:
+    """Returns the offset and the headers of a request that resumes a partially downloaded file
+
+    The range is requested with If-Range and the validator stored when the file has been started, so
+    the server sends the complete file instead, if it has changed since. A partial file without a
+    validator may belong to an older version of the file and is downloaded from the start.
+    """
+    offset = get_resume_offset(dest_file)
+    validator = get_if_range(load_resume_validators(dest_file))
+
+    if offset == 0 or validator is None:
+        return 0, {}
+
+    return offset, {"Range": f"bytes={offset}-", "If-Range": validator}
+
+
+def check_range_response(
+    response: httpx.Response, dest_file: str, offset: int
+) -> Optional[int]:
+    """Checks the response to a (range) request of a download that starts at the given offset
+
+    Args:
+        response (httpx.Response): Response of the download request
+        dest_file (str): Partially downloaded destination file
+        offset (int): Number of bytes that have already been downloaded
+
+    Raises:
+        HTTPStatusError: If the request failed
+        PartialFileMismatch: If the partial file does not match the file on the server, it has been removed
+
+    Returns:
+        Optional[int]: Offset at which the response body has to be written or None, if the file is already complete
+    """
+    if offset > 0 and response.status_code == 416:
+        _, _, length = parse_content_range(response.headers.get("Content-Range", ""))
+        if length == offset:
+            # If-Range matched, so the partial file is the complete current file
+            return None
+
+        os.remove(dest_file)
+        store_resume_validators(dest_file, {})
+        raise PartialFileMismatch(
+            f"Partial file of {offset} bytes does not match the file of {length} bytes on the server"
+        )
+
+    response.raise_for_status()
+
+    if offset > 0:
+        first_byte, _, _ = parse_content_range(
+            response.headers.get("Content-Range", "")
+        )
+        if response.status_code != 206 or first_byte != offset:
+            # the file has changed (If-Range did not match) or the server ignores range requests
+            return 0
+
+    return offset
+
+
+def get_destination_folder(
+    hegre_object: HegreMovie | HegreGallery,
+    configuration: Configuration,
+    create: bool = True,
+) -> str:
+    """Returns (and creates, unless create is False) the folder an object is downloaded to, with a subfolder
+    for each year if the object has a date"""
+    if hegre_object.date:
+        dest_folder = os.path.join(
+            configuration.destination_folder, str(hegre_object.date.year)
+        )
+    else:
+        dest_folder = configuration.destination_folder
+
+    if create and not os.path.exists(dest_folder):
+        os.makedirs(dest_folder, exist_ok=True)
+
+    return dest_folder
+
+
+def get_media_file(
+    hegre_object: HegreMovie | HegreGallery, configuration: Configuration
+) -> str:
+    """Returns the path the movie/gallery file of an object is downloaded to"""
+    _, url = hegre_object.get_download_url_for_res(configuration.resolution)
+    filename, _ = generate_filename(url, hegre_object)
+
+    return os.path.join(get_destination_folder(hegre_object, configuration), filename)
+
+
+def get_sidecar_files(
+    hegre_object: HegreMovie | HegreGallery,
+    configuration: Configuration,
+    dest_folder: str,
+) -> list[tuple[str, str]]:
+    """Returns the URLs and destination files of all additional files (thumbnail, subtitles, screengrabs, trailer)
+    that should be downloaded for an object according to the configuration
+    """
+    sidecars = []
+
+    if not configuration.no_thumb:
+        thumbnail, _ = generate_filename(hegre_object.cover_url, hegre_object)
+        sidecars.append((hegre_object.cover_url, os.path.join(dest_folder, thumbnail)))
+
+    if not isinstance(hegre_object, HegreMovie):
+        return sidecars
+
+    if not configuration.no_subtitles:
+        for url in hegre_object.get_subtitle_download_urls(configuration.subtitles):
+            sub_filename, _ = generate_filename(url, hegre_object)
+            sidecars.append((url, os.path.join(dest_folder, sub_filename)))
+
+    if configuration.screengrabs and hegre_object.screengrabs_url:
+        screengrab_file, _ = generate_filename(
+            hegre_object.screengrabs_url, hegre_object
+        )
+        sidecars.append(
+            (hegre_object.screengrabs_url, os.path.join(dest_folder, screengrab_file))
+        )
+
+    if configuration.trailer:
+        _, url = hegre_object.get_trailer_download_url_for_res(configuration.resolution)
+        trailer_file, _ = generate_filename(url, hegre_object)
+        sidecars.append((url, os.path.join(dest_folder, trailer_file)))
+
+    return sidecars
+
+
+def parse_film_page(url: str, film_page_html: str) -> HegreMovie:
+    return HegreMovie.from_film_page_html(url, film_page_html, PARSER)
+
+
+def parse_gallery_page(url: str, gallery_page_html: str) -> HegreGallery:
+    return HegreGallery.from_gallery_page(url, BeautifulSoup(gallery_page_html, PARSER))
+
+
+def parse_authenticity_token(login_page_html: str) -> str:
+    """Extracts the authenticity_token from the login page
+
+    Raises:
+        HegreError: If the authenticity_token could not be extracted
+    """
+    login_page = BeautifulSoup(login_page_html, PARSER)
+
+    if token_input := login_page.select_one('input[name="authenticity_token"]'):
+        return token_input.attrs["value"]
+
+    raise HegreError("Could not extract authenticity_token from login page!")
+
+
+def check_login_response(r: httpx.Response) -> None:
+    """Checks the response of the login request
+
+    Raises:
+        HegreError: If the login failed
+    """
+    if r.status_code != 200:
+        raise HegreError(f"Failed to login (HTTP {r.status_code}): {r.text}")
+
+    login = json.loads(r.text)
+    if "status" not in login or login["status"] != "success":
+        raise HegreError(f"Failed to login (HTTP {r.status_code}): {r.text}")
+
+
+def parse_listing_page(
+    listing_page_html: str, selector: str
+) -> Optional[dict[str, Optional[int]]]:
+    """Returns the items of a listing page or None, if the page is past the end of the listing
+
+    Returns:
+        Optional[dict[str, Optional[int]]]: URLs of the items (in the order of the listing) and their codes, if available
+    """
+    listing_page = BeautifulSoup(listing_page_html, PARSER)
+
+    if len(listing_page.select(".hint")) > 0:
+        return None
+
+    items = {}
+    for item in listing_page.select(selector):
+        url = "https://www.hegre.com" + item.select_one("a").attrs["href"]
+        items[url] = parse_listing_item_code(item)
+
+    return items
+
+
+def parse_listing_item_code(item: Tag) -> Optional[int]:
+    """Returns the code of a listing item (data-id of the item or of its link), if available
+
+    Other elements of the item (e.g. model links or favorite buttons) are ignored, as their data-id may
+    be the ID of something else, which could skip an item that has never been downloaded as archived.
+    """
+    if "data-id" in item.attrs:
+        data_id = item.attrs["data-id"]
+    elif (link := item.select_one("a")) and "data-id" in link.attrs:
+        data_id = link.attrs["data-id"]
+    else:
+        return None
+
+    return int(data_id) if data_id.isdigit() else None
+
+
+def archive_id_from_url(url: str, code: int) -> Optional[str]:
+    """Returns the archive ID of a movie or gallery with the given URL and code, see HegreObject.archive_id()"""
+    if match := re.match(SINGLE_URL_PATTERN, url):
+        return f"{ObjectType.from_str(match.group(1))} {code}"
+
+    return None
+
+
+def parse_total_count(listing_page_html: str) -> int:
+    """Returns the total number of items of a listing page"""
+    listing_page = BeautifulSoup(listing_page_html, PARSER)
+    return int(listing_page.select_one("h2 strong").text)
+
+
+def parse_model_page(model_page_html: str) -> dict[str, Optional[int]]:
+    """Returns the URLs of all galleries and movies of a model page and their codes, if available"""
+    model_page = BeautifulSoup(model_page_html, PARSER)
+    items = {}
+
+    for selector in (GALLERIES_LISTING_SELECTOR, MOVIES_LISTING_SELECTOR):
+        for item in model_page.select(selector):
+            url = "https://www.hegre.com" + item.select_one("a").attrs["href"]
+            items[url] = parse_listing_item_code(item)
+
+    return items
@@ -1,4 +1,16 @@
+import re
 import math
+import sqlite3
+import hashlib
+
+from typing import Optional
+
+# algorithm of the checksums of downloaded files
+CHECKSUM_ALGORITHM = "sha256"
+# size of the buffer files are read into for hashing
+HASH_BUFFER_SIZE = 1024 * 1024
+# milliseconds a writer waits for another process that holds the SQLite write lock
+BUSY_TIMEOUT = 30000
 
 
 def duration_to_seconds(duration: str, delimiter: str = ":") -> int:
@@ -45,3 +57,77 @@ def convert_size(size_bytes: int) -> str:
     s = round(size_bytes / p, 2)
 
     return "%s %s" % (s, size_name[i])
+
+
+def parse_size(size: str) -> int:
+    """Converts a human readable size into bytes, the inverse of convert_size
+
+    Args:
+        size (str): Size in the form of "1048576", "512K", "1.5M", "2 GB" (units are powers of 1024)
+
+    Raises:
+        ValueError: If the size string is in an invalid format
+
+    Returns:
+        int: Number of bytes
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*", size, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Could not parse size '{size}' into bytes")
+
+    exponent = " KMGT".index(match.group(2).upper() or " ")
+
+    return int(float(match.group(1)) * math.pow(1024, exponent))
+
+
+def hash_file(
+    filename: str, size: Optional[int] = None, digest: Optional["hashlib._Hash"] = None
+) -> "hashlib._Hash":
+    """Hashes a file by reading it into a reused buffer, which avoids allocating a bytes object per read
+
+    Args:
+        filename (str): File to hash
+        size (Optional[int], optional): Number of bytes from the start of the file to hash. Defaults to the whole file.
+        digest (Optional[hashlib._Hash], optional): Digest to update. Defaults to a new CHECKSUM_ALGORITHM digest.
+
+    Returns:
+        hashlib._Hash: Updated digest
+    """
+    digest = digest or hashlib.new(CHECKSUM_ALGORITHM)
+    buffer = memoryview(bytearray(HASH_BUFFER_SIZE))
+    remaining = size
+
+    with open(filename, "rb", buffering=0) as file:
+        while remaining is None or remaining > 0:
+            read = file.readinto(buffer if remaining is None else buffer[:remaining])
+            if not read:
+                break
+
+            digest.update(buffer[:read])
+            if remaining is not None:
+                remaining -= read
+
+    return digest
+
+
+def connect_shared_sqlite(filename: str) -> sqlite3.Connection:
+    """Opens a SQLite database that several threads and processes, possibly on several hosts, write to
+
+    The database uses a rollback journal instead of WAL: a WAL database shares its index in memory, so all
+    its connections have to be on one host, which breaks on a network file system.
+
+    Args:
+        filename (str): SQLite database
+
+    Returns:
+        sqlite3.Connection: Connection, which can be used from several threads (with a lock)
+    """
+    connection = sqlite3.connect(
+        filename, timeout=BUSY_TIMEOUT / 1000, check_same_thread=False
+    )
+
+    with connection:
+        connection.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT}")
+        connection.execute("PRAGMA journal_mode=DELETE")
+
+    return connection
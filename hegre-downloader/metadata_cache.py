@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from typing import Optional
+
+from model.movie import HegreMovie
+from model.gallery import HegreGallery
+from model.object_type import ObjectType
+
+DEFAULT_TTL = 24 * 60 * 60
+
+
+class CachedObject:
+    hegre_object: HegreMovie | HegreGallery
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+    def __init__(
+        self,
+        hegre_object: HegreMovie | HegreGallery,
+        etag: Optional[str],
+        last_modified: Optional[str],
+        fetched_at: float,
+    ) -> None:
+        self.hegre_object = hegre_object
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+    def is_fresh(self, ttl: int) -> bool:
+        return time.time() - self.fetched_at < ttl
+
+    def validators(self) -> dict[str, str]:
+        """Returns the headers for a conditional request that revalidates the cached page"""
+        headers = {}
+
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+
+        return headers
+
+
+class MetadataCache:
+    """Persistent cache of parsed movies and galleries, stored in a SQLite database
+
+    Objects are keyed by the URL of their page and can be shared by several threads. The cache also keeps
+    the validators (ETag/Last-Modified) of downloaded assets, keyed by their destination file, as asset URLs
+    carry expiring tokens.
+    """
+
+    ttl: int
+    _connection: sqlite3.Connection
+    _lock: threading.Lock
+
+    def __init__(self, filename: str, ttl: int = DEFAULT_TTL) -> None:
+        """Opens the cache, creating the database if it does not exist
+
+        Args:
+            filename (str): SQLite database file, created if it does not exist
+            ttl (int, optional): Number of seconds a cached object is used without revalidation. Defaults to DEFAULT_TTL.
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS objects (
+                    url TEXT PRIMARY KEY,
+                    type TEXT,
+                    code INTEGER,
+                    data TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL NOT NULL
+                )"""
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS objects_code ON objects (type, code)"
+            )
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS assets (
+                    file TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT
+                )"""
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def get(self, url: str) -> Optional[CachedObject]:
+        """Returns the cached object of the given page URL, regardless of its age"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT type, data, etag, last_modified, fetched_at FROM objects WHERE url = ?",
+                (url,),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        type, data, etag, last_modified, fetched_at = row
+        if type == str(ObjectType.PHOTOS):
+            hegre_object = HegreGallery.from_dict(json.loads(data))
+        else:
+            hegre_object = HegreMovie.from_dict(json.loads(data))
+
+        return CachedObject(hegre_object, etag, last_modified, fetched_at)
+
+    def put(
+        self,
+        hegre_object: HegreMovie | HegreGallery,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        """Stores (or replaces) the object of a freshly fetched page"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    hegre_object.url,
+                    str(hegre_object.type),
+                    hegre_object.code,
+                    hegre_object.to_json(),
+                    etag,
+                    last_modified,
+                    time.time(),
+                ),
+            )
+
+    def touch(self, url: str) -> None:
+        """Marks the cached object of the given page URL as fresh, e.g. after a successful revalidation"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE objects SET fetched_at = ? WHERE url = ?", (time.time(), url)
+            )
+
+    def get_archive_id(self, url: str) -> Optional[str]:
+        """Returns the archive ID of the cached object of the given page URL, regardless of its age"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT type, code FROM objects WHERE url = ?", (url,)
+            ).fetchone()
+
+        if row is None or row[1] is None:
+            return None
+
+        return f"{row[0]} {row[1]}"
+
+    def get_asset_validators(self, file: str) -> dict[str, str]:
+        """Returns the headers for a conditional request that revalidates a downloaded asset, empty if unknown"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT etag, last_modified FROM assets WHERE file = ?",
+                (os.path.abspath(file),),
+            ).fetchone()
+
+        headers = {}
+        if row and row[0]:
+            headers["If-None-Match"] = row[0]
+        if row and row[1]:
+            headers["If-Modified-Since"] = row[1]
+
+        return headers
+
+    def put_asset_validators(
+        self, file: str, etag: Optional[str], last_modified: Optional[str]
+    ) -> None:
+        """Stores (or replaces) the validators of a freshly downloaded asset"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO assets VALUES (?, ?, ?)",
+                (os.path.abspath(file), etag, last_modified),
+            )
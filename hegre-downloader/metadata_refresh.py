@@ -0,0 +1,147 @@
+import os
+import re
+import json
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from hegre import Hegre, generate_filename, get_destination_folder
+from model.movie import HegreMovie
+from model.gallery import HegreGallery
+from model.media_file import MediaFile
+from configuration import Configuration
+
+UNCHANGED = "unchanged"
+UPDATED = "updated"
+CREATED = "created"
+NOT_DOWNLOADED = "not downloaded"
+FAILED = "failed"
+
+
+class RefreshResult:
+    """Result of the metadata refresh of a movie/gallery"""
+
+    url: str
+    status: str
+    error: Optional[str]
+
+    def __init__(self, url: str, status: str, error: Optional[str] = None) -> None:
+        self.url = url
+        self.status = status
+        self.error = error
+
+
+def load_metadata(metadata_file: str) -> Optional[dict[str, Any]]:
+    """Returns the content of a metadata file, None if it does not exist (or is no valid metadata file)"""
+    try:
+        with open(metadata_file, "r", encoding="utf-8") as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    return data if isinstance(data, dict) else None
+
+
+def find_metadata_file(
+    hegre_object: HegreMovie | HegreGallery, dest_folder: str
+) -> Optional[str]:
+    """Returns the existing metadata file of a movie/gallery, whatever resolution it has been downloaded in
+
+    Metadata files are named after the code and the downloaded file (see generate_filename()), a matching
+    file only belongs to the object, if it records the URL of the object.
+    """
+    if not os.path.isdir(dest_folder):
+        return None
+
+    pattern = re.compile(
+        rf"^(?:\d{{4}}\.\d{{2}}\.\d{{2}}-)?{hegre_object.code}-.+\.json$"
+    )
+    for name in sorted(os.listdir(dest_folder)):
+        if not pattern.match(name):
+            continue
+
+        metadata_file = os.path.join(dest_folder, name)
+        if (data := load_metadata(metadata_file)) and data.get(
+            "url"
+        ) == hegre_object.url:
+            return metadata_file
+
+    return None
+
+
+def find_downloaded_url(
+    hegre_object: HegreMovie | HegreGallery, dest_folder: str
+) -> Optional[str]:
+    """Returns the download URL of the resolution whose movie/gallery file exists, if any"""
+    for _, url in sorted(hegre_object.downloads.items(), reverse=True):
+        filename, _ = generate_filename(url, hegre_object)
+        if os.path.exists(os.path.join(dest_folder, filename)):
+            return url
+
+    return None
+
+
+def refresh_metadata_file(
+    hegre_object: HegreMovie | HegreGallery, configuration: Configuration
+) -> str:
+    """Rewrites the metadata file of a downloaded movie/gallery, if the freshly parsed object differs from it
+
+    The existing metadata file is found regardless of the resolution it has been downloaded in. The record
+    of the downloaded file (see MediaFile) is taken over from it. A missing metadata file is only created,
+    if the movie/gallery file has been downloaded (in any resolution).
+
+    Returns:
+        str: UNCHANGED, UPDATED, CREATED or NOT_DOWNLOADED
+    """
+    dest_folder = get_destination_folder(hegre_object, configuration, create=False)
+    metadata_file = find_metadata_file(hegre_object, dest_folder)
+
+    if metadata_file is None:
+        url = find_downloaded_url(hegre_object, dest_folder)
+        if url is None:
+            return NOT_DOWNLOADED
+
+        _, metadata_filename = generate_filename(url, hegre_object)
+        metadata_file = os.path.join(dest_folder, metadata_filename)
+
+    existing = load_metadata(metadata_file)
+    if existing and isinstance(existing.get("file"), dict):
+        hegre_object.file = MediaFile.from_dict(existing["file"])
+
+    if existing == json.loads(hegre_object.to_json()):
+        return UNCHANGED
+
+    hegre_object.write_metadata_file(dest_folder, os.path.basename(metadata_file))
+
+    return UPDATED if existing is not None else CREATED
+
+
+def refresh_metadata(
+    hegre: Hegre, urls: list[str], configuration: Configuration
+) -> list[RefreshResult]:
+    """Refreshes the metadata files of the given movies/galleries, fetching their pages with up to
+    configuration.crawl_tasks workers
+
+    Nothing but the pages is downloaded and no progress tasks are created, so a large library is
+    refreshed at the speed of the page fetches. Cached objects are revalidated with the server, even
+    within the TTL of the metadata cache.
+
+    Returns:
+        list[RefreshResult]: Results of all URLs, in the order of the URLs
+    """
+
+    def refresh(url: str) -> RefreshResult:
+        try:
+            if re.match(r"^https?:\/\/www\.hegre\.com\/photos\/", url):
+                hegre_object = hegre.get_gallery_from_url(url, revalidate=True)
+            else:
+                hegre_object = hegre.get_movie_from_url(url, revalidate=True)
+
+            return RefreshResult(
+                url, refresh_metadata_file(hegre_object, configuration)
+            )
+        except Exception as e:
+            return RefreshResult(url, FAILED, str(e))
+
+    with ThreadPoolExecutor(max_workers=configuration.crawl_tasks) as pool:
+        return list(pool.map(refresh, urls))
@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import os
+import time
+import bisect
+import threading
+import contextlib
+
+from typing import Iterator, Optional
+
+import httpx
+
+from rich.table import Table
+
+from helper import convert_size
+
+# upper bounds (in seconds) of the buckets of the stage duration histograms
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0, 600.0)
+# seconds between two writes of the metrics file
+DEFAULT_EXPORT_INTERVAL = 15.0
+PREFIX = "hegre"
+
+
+class StageMetrics:
+    """Durations, bytes, retries and errors of one stage of a run (e.g. page_parse or transfer)"""
+
+    count: int
+    seconds: float
+    max_seconds: float
+    bytes: int
+    retries: int
+    errors: int
+    buckets: list[int]
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes = 0
+        self.retries = 0
+        self.errors = 0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+        # buckets are not cumulative here, they are summed up when they are rendered
+        bucket = bisect.bisect_left(DURATION_BUCKETS, seconds)
+        if bucket < len(DURATION_BUCKETS):
+            self.buckets[bucket] += 1
+
+
+class Metrics:
+    """Timings, byte counts, retries and HTTP status codes of all stages of a run, shared by all threads
+
+    The stages are
+    - login, listing_fetch, listing_parse: the session and the crawl of listings,
+    - page_fetch, page_parse: the pages of movies/galleries,
+    - transfer, asset_transfer: attempts to download a movie/gallery file or an asset,
+    - asset_revalidate: conditional requests for existing assets (see Configuration.refresh_assets),
+    - first_byte: time to the response headers of a download, i.e. the latency of the CDN,
+    - disk_write, rename, metadata_write: the time spent writing to disk.
+    """
+
+    started: float
+    _stages: dict[str, StageMetrics]
+    _responses: dict[tuple[str, int], int]
+    _items: dict[str, int]
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self._stages = {}
+        self._responses = {}
+        self._items = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Times the enclosed block as the given stage and counts it as an error, if it raises"""
+        started = time.perf_counter()
+
+        try:
+            yield
+        except BaseException:
+            with self._lock:
+                self._stage(name).errors += 1
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._stage(name).observe(seconds)
+
+    def add_bytes(self, name: str, size: int) -> None:
+        with self._lock:
+            self._stage(name).bytes += size
+
+    def add_retry(self, name: str) -> None:
+        with self._lock:
+            self._stage(name).retries += 1
+
+    def add_item(self, result: str) -> None:
+        """Counts a movie/gallery by its result, e.g. completed, skipped or failed"""
+        with self._lock:
+            self._items[result] = self._items.get(result, 0) + 1
+
+    def record_response(self, response: httpx.Response) -> None:
+        """Counts a response by host and status code, to be used as response event hook of a client"""
+        key = (response.request.url.host, response.status_code)
+
+        with self._lock:
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def to_prometheus(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            stages = sorted(self._stages.items())
+            responses = sorted(self._responses.items())
+            items = sorted(self._items.items())
+
+        lines = [
+            f"# TYPE {PREFIX}_run_seconds gauge",
+            f"{PREFIX}_run_seconds {time.monotonic() - self.started:.3f}",
+            f"# TYPE {PREFIX}_stage_duration_seconds histogram",
+        ]
+        for name, stage in stages:
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS, stage.buckets):
+                cumulative += count
+                lines.append(
+                    f'{PREFIX}_stage_duration_seconds_bucket{{stage="{name}",le="{bound:g}"}} {cumulative}'
+                )
+            lines += [
+                f'{PREFIX}_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {stage.count}',
+                f'{PREFIX}_stage_duration_seconds_sum{{stage="{name}"}} {stage.seconds:.6f}',
+                f'{PREFIX}_stage_duration_seconds_count{{stage="{name}"}} {stage.count}',
+            ]
+
+        for metric, attribute in (
+            ("bytes", "bytes"),
+            ("retries", "retries"),
+            ("errors", "errors"),
+        ):
+            lines.append(f"# TYPE {PREFIX}_stage_{metric}_total counter")
+            lines += [
+                f'{PREFIX}_stage_{metric}_total{{stage="{name}"}} {getattr(stage, attribute)}'
+                for name, stage in stages
+            ]
+
+        lines.append(f"# TYPE {PREFIX}_http_responses_total counter")
+        lines += [
+            f'{PREFIX}_http_responses_total{{host="{host}",status="{status}"}} {count}'
+            for (host, status), count in responses
+        ]
+
+        lines.append(f"# TYPE {PREFIX}_items_total counter")
+        lines += [
+            f'{PREFIX}_items_total{{result="{result}"}} {count}'
+            for result, count in items
+        ]
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, filename: str) -> None:
+        """Writes all metrics to a file, e.g. for the textfile collector of the node exporter"""
+        # write to a temporary file first, so a scrape never reads a partially written file
+        temp_file = f"{filename}.temp"
+        with open(temp_file, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(self.to_prometheus())
+
+        os.replace(temp_file, filename)
+
+    def summary(self) -> Table:
+        """Returns a table of all stages and HTTP status codes for the end of a run"""
+        with self._lock:
+            stages = sorted(self._stages.items())
+            responses = sorted(self._responses.items())
+            items = sorted(self._items.items())
+
+        table = Table(
+            title=f"Run of {time.monotonic() - self.started:.1f} s",
+            caption=" ".join(
+                [f"{result}: {count}" for result, count in items]
+                + [f"{host} {status}: {count}" for (host, status), count in responses]
+            ),
+        )
+        for column in ("Stage", "Count", "Total s", "Avg s", "Max s", "Bytes", "MB/s"):
+            table.add_column(column, justify="left" if column == "Stage" else "right")
+        table.add_column("Retries / errors", justify="right")
+
+        for name, stage in stages:
+            table.add_row(
+                name,
+                str(stage.count),
+                f"{stage.seconds:.2f}",
+                f"{stage.seconds / stage.count:.3f}" if stage.count else "-",
+                f"{stage.max_seconds:.3f}",
+                convert_size(stage.bytes) if stage.bytes else "-",
+                (
+                    f"{stage.bytes / stage.seconds / 1e6:.1f}"
+                    if stage.bytes and stage.seconds
+                    else "-"
+                ),
+                f"{stage.retries} / {stage.errors}",
+            )
+
+        return table
+
+    def _stage(self, name: str) -> StageMetrics:
+        if name not in self._stages:
+            self._stages[name] = StageMetrics()
+
+        return self._stages[name]
+
+
+class MetricsExporter:
+    """Writes the metrics to a file in the Prometheus text format at a fixed interval"""
+
+    metrics: Metrics
+    filename: str
+    interval: float
+    _stop: threading.Event
+    _writer: Optional[threading.Thread]
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        filename: str,
+        interval: float = DEFAULT_EXPORT_INTERVAL,
+    ) -> None:
+        self.metrics = metrics
+        self.filename = filename
+        self.interval = interval
+        self._stop = threading.Event()
+        self._writer = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def stop(self) -> None:
+        """Stops the writer and writes the final metrics"""
+        if self._writer:
+            self._stop.set()
+            self._writer.join()
+            self._writer = None
+
+        self.metrics.write_prometheus(self.filename)
+
+    def _write_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.metrics.write_prometheus(self.filename)
+
+
+def stage(
+    metrics: Optional[Metrics], name: Optional[str]
+) -> contextlib.AbstractContextManager:
+    """Returns the timer of a stage, a no-op without metrics or stage"""
+    if metrics and name:
+        return metrics.stage(name)
+
+    return contextlib.nullcontext()
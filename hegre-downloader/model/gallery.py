@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime
+from typing import Any
 import re
 
 from bs4 import BeautifulSoup
@@ -24,6 +25,7 @@ class HegreGallery(HegreObject):
         self.tags = list()
         self.models = list()
         self.downloads = dict()
+        self.file = None
 
     @staticmethod
     def from_gallery_page(url: str, gallery_page: BeautifulSoup) -> HegreGallery:
@@ -36,6 +38,14 @@ class HegreGallery(HegreObject):
 
         return hg
 
+    @staticmethod
+    def from_dict(data: dict[str, Any]) -> HegreGallery:
+        """Restores a gallery from a dict created by the HegreJSONEncoder (e.g. a metadata file)"""
+        hg = HegreGallery(data["url"])
+        hg._load_dict(data)
+
+        return hg
+
     def _parse_details_from_gallery_page(self, gallery_page: BeautifulSoup) -> None:
         self.title = gallery_page.select_one("h1.translated-text").text.strip()
         self.code = int(gallery_page.select_one(".comments-wrapper").attrs["data-id"])
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Any, Optional
 from datetime import date
 import json
 import os
@@ -6,6 +6,7 @@ import os
 from model.object_type import ObjectType
 from hegre_json_encoder import HegreJSONEncoder
 from model.model import HegreModel
+from model.media_file import MediaFile
 
 
 class HegreObject:
@@ -19,6 +20,7 @@ class HegreObject:
     tags: list[str]
     models: list[HegreModel]
     downloads: dict[int, str]
+    file: Optional[MediaFile]
 
     def __init__(self, url: str, type: ObjectType) -> None:
         self.url = url
@@ -27,6 +29,7 @@ class HegreObject:
         self.tags = list()
         self.models = list()
         self.downloads = dict()
+        self.file = None
 
     def __str__(self) -> str:
         return f"{self.date} {self.title} [{self.code}]"
@@ -50,8 +53,30 @@ class HegreObject:
 
         return res, url
 
+    def to_json(self) -> str:
+        return json.dumps(self, sort_keys=True, indent=4, cls=HegreJSONEncoder)
+
     def write_metadata_file(self, destination_folder: str, filename: str) -> None:
         metadata_file = os.path.join(destination_folder, filename)
 
         with open(metadata_file, "w") as file:
-            file.write(json.dumps(self, sort_keys=True, indent=4, cls=HegreJSONEncoder))
+            file.write(self.to_json())
+
+    def _load_dict(self, data: dict[str, Any]) -> None:
+        """Restores the common fields from a dict created by the HegreJSONEncoder (e.g. a metadata file)"""
+        self.url = data["url"]
+        self.type = ObjectType.from_str(data["type"]) if data.get("type") else None
+        self.title = data.get("title")
+        self.code = data.get("code")
+        self.date = date.fromisoformat(data["date"]) if data.get("date") else None
+        self.cover_url = data.get("cover_url")
+
+        self.tags = list(data.get("tags", []))
+        self.models = [
+            HegreModel(model["name"], model["url"]) for model in data.get("models", [])
+        ]
+        # JSON object keys are always strings
+        self.downloads = {
+            int(res): url for res, url in data.get("downloads", {}).items()
+        }
+        self.file = MediaFile.from_dict(data["file"]) if data.get("file") else None
@@ -0,0 +1,20 @@
+from __future__ import annotations
+
+from typing import Any
+
+
+class MediaFile:
+    """Downloaded movie/gallery file, recorded in the metadata file to verify the file later"""
+
+    name: str
+    size: int
+    sha256: str
+
+    def __init__(self, name: str, size: int, sha256: str) -> None:
+        self.name = name
+        self.size = size
+        self.sha256 = sha256
+
+    @staticmethod
+    def from_dict(data: dict[str, Any]) -> MediaFile:
+        return MediaFile(data["name"], data["size"], data["sha256"])
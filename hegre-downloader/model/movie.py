@@ -1,9 +1,9 @@
 from __future__ import annotations
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
 from datetime import datetime
-from typing import Optional
+from typing import Any, Optional
 
 import re
 import json
@@ -14,6 +14,54 @@ from model.hegre_object import HegreObject
 from helper import duration_to_seconds
 from exceptions import HegreError
 
+# classes of the elements that contain all details of film, massage, orgasms and sexed pages
+FILM_PAGE_CLASSES = {
+    "title",
+    "comments-wrapper",
+    "format-details",
+    "massage-copy",
+    "date",
+    "video-player-wrapper",
+    "video-stills",
+    "models",
+    "record-model",
+    "video-inner",
+    "approved-tags",
+    "trailer",
+    "film-header",
+    "top",
+}
+
+
+def _is_film_page_element(class_attr: Optional[str]) -> bool:
+    return class_attr is not None and any(
+        class_name in FILM_PAGE_CLASSES for class_name in class_attr.split()
+    )
+
+
+FILM_PAGE_STRAINER = SoupStrainer(class_=_is_film_page_element)
+
+# elements every film, massage and orgasms page has, even if the lists in them (e.g. the tags) are empty
+FILM_PAGE_NODES = (
+    ".title",
+    ".comments-wrapper",
+    ".format-details",
+    ".massage-copy",
+    ".date",
+    ".video-player-wrapper",
+    ".video-inner",
+    ".models",
+    ".approved-tags",
+)
+# elements every sexed page has (sexed pages have no date and models)
+SEXED_PAGE_NODES = (
+    ".film-header",
+    ".comments-wrapper",
+    ".video-player-wrapper",
+    ".top",
+    ".approved-tags",
+)
+
 
 class HegreMovie(HegreObject):
     duration: Optional[int]
@@ -38,6 +86,7 @@ class HegreMovie(HegreObject):
         self.tags = list()
         self.models = list()
         self.downloads = dict()
+        self.file = None
         self.subtitles = dict()
         self.trailers = dict()
 
@@ -57,6 +106,53 @@ class HegreMovie(HegreObject):
 
         return hm
 
+    @staticmethod
+    def from_film_page_html(url: str, film_page_html: str, parser: str) -> HegreMovie:
+        """Parses a film page, building a tree of the relevant elements only (see FILM_PAGE_CLASSES)
+
+        Falls back to parsing the complete page, if an element of FILM_PAGE_NODES (or SEXED_PAGE_NODES) is
+        missing in the partial tree, so a page whose layout has changed does not silently lose details. A
+        movie without e.g. tags or trailers is parsed only once.
+
+        Args:
+            url (str): URL of the film page
+            film_page_html (str): HTML of the film page
+            parser (str): Parser backend of BeautifulSoup
+
+        Raises:
+            HegreError: If the URL is not supported
+
+        Returns:
+            HegreMovie: Movie of the film page
+        """
+        try:
+            partial_page = BeautifulSoup(
+                film_page_html, parser, parse_only=FILM_PAGE_STRAINER
+            )
+            hm = HegreMovie.from_film_page(url, partial_page)
+
+            nodes = SEXED_PAGE_NODES if hm.type == ObjectType.SEXED else FILM_PAGE_NODES
+            if all(partial_page.select_one(node) is not None for node in nodes):
+                return hm
+        except (AttributeError, KeyError, IndexError, ValueError):
+            pass
+
+        return HegreMovie.from_film_page(url, BeautifulSoup(film_page_html, parser))
+
+    @staticmethod
+    def from_dict(data: dict[str, Any]) -> HegreMovie:
+        """Restores a movie from a dict created by the HegreJSONEncoder (e.g. a metadata file)"""
+        hm = HegreMovie(data["url"])
+        hm._load_dict(data)
+
+        hm.duration = data.get("duration")
+        hm.screengrabs_url = data.get("screengrabs_url")
+        hm.description = data.get("description")
+        hm.subtitles = dict(data.get("subtitles", {}))
+        hm.trailers = {int(res): url for res, url in data.get("trailers", {}).items()}
+
+        return hm
+
     def parse_details_from_sexed_page(self, film_page: BeautifulSoup) -> None:
         self.title = film_page.select_one(".film-header > h1").text.strip()
         self.code = int(film_page.select_one(".comments-wrapper").attrs["data-id"])
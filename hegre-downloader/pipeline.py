@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import queue
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+
+from model.movie import HegreMovie
+from model.gallery import HegreGallery
+
+
+# URL and destination file of an asset
+Asset = tuple[str, str]
+
+
+class PipelineItem:
+    """A URL passing through the pipeline, with the movie/gallery of its page once it has been fetched"""
+
+    count: int
+    url: str
+    hegre_object: Optional[HegreMovie | HegreGallery]
+    pending: int
+    error: Optional[Exception]
+
+    def __init__(self, count: int, url: str) -> None:
+        self.count = count
+        self.url = url
+        self.hegre_object = None
+        self.pending = 0
+        self.error = None
+
+
+class DownloadPipeline:
+    """Downloads URLs in three stages, each with its own pool of workers
+
+    1. Metadata: fetches and parses the page of a URL
+    2. Media: downloads the movie/gallery file
+    3. Assets: downloads the thumbnail, subtitles, screengrabs and trailer, each on its own
+
+    A bounded queue between the metadata and the media stage keeps the media workers fed, while
+    the metadata stage does not run arbitrarily far ahead. The assets of an item are downloaded
+    alongside its file and do not hold up the next file. An item is complete once its file and
+    all its assets have been downloaded.
+    """
+
+    fetch: Callable[[PipelineItem], Optional[HegreMovie | HegreGallery]]
+    download_media: Callable[[PipelineItem], None]
+    list_assets: Callable[[PipelineItem], list[Asset]]
+    download_asset: Callable[[PipelineItem, Asset], None]
+    on_complete: Callable[[PipelineItem], None]
+    on_error: Callable[[PipelineItem, Exception], None]
+    metadata_workers: int
+    media_workers: int
+    asset_workers: int
+    queue_size: int
+    _failed: bool
+    _lock: threading.Lock
+
+    def __init__(
+        self,
+        fetch: Callable[[PipelineItem], Optional[HegreMovie | HegreGallery]],
+        download_media: Callable[[PipelineItem], None],
+        list_assets: Callable[[PipelineItem], list[Asset]],
+        download_asset: Callable[[PipelineItem, Asset], None],
+        on_complete: Callable[[PipelineItem], None],
+        on_error: Callable[[PipelineItem, Exception], None],
+        metadata_workers: int = 1,
+        media_workers: int = 1,
+        asset_workers: int = 1,
+        queue_size: Optional[int] = None,
+    ) -> None:
+        """Creates the pipeline
+
+        Args:
+            fetch (Callable[[PipelineItem], Optional[HegreMovie | HegreGallery]]): Returns the movie/gallery of an item, None to skip it
+            download_media (Callable[[PipelineItem], None]): Downloads the file of an item
+            list_assets (Callable[[PipelineItem], list[Asset]]): Returns the assets of an item
+            download_asset (Callable[[PipelineItem, Asset], None]): Downloads an asset of an item
+            on_complete (Callable[[PipelineItem], None]): Called once an item has passed all stages
+            on_error (Callable[[PipelineItem, Exception], None]): Called if a stage of an item failed, which ends the item
+            metadata_workers (int, optional): Number of pages fetched in parallel. Defaults to 1.
+            media_workers (int, optional): Number of files downloaded in parallel. Defaults to 1.
+            asset_workers (int, optional): Number of assets downloaded in parallel. Defaults to 1.
+            queue_size (Optional[int], optional): Number of fetched items waiting for a media worker. Defaults to media_workers.
+        """
+        self.fetch = fetch
+        self.download_media = download_media
+        self.list_assets = list_assets
+        self.download_asset = download_asset
+        self.on_complete = on_complete
+        self.on_error = on_error
+        self.metadata_workers = metadata_workers
+        self.media_workers = media_workers
+        self.asset_workers = asset_workers
+        self.queue_size = queue_size or media_workers
+        self._failed = False
+        self._lock = threading.Lock()
+
+    def run(self, urls: Iterable[str]) -> bool:
+        """Passes the given URLs through all stages, which may also be a generator that is still resolving URLs
+
+        Returns:
+            bool: True, if all URLs have passed all stages without an error
+        """
+        self._failed = False
+        media_queue: queue.Queue[Optional[PipelineItem]] = queue.Queue(self.queue_size)
+
+        with ThreadPoolExecutor(max_workers=self.asset_workers) as asset_pool:
+            media_threads = [
+                threading.Thread(
+                    target=self._transfer_media, args=(media_queue, asset_pool)
+                )
+                for _ in range(self.media_workers)
+            ]
+            for thread in media_threads:
+                thread.start()
+
+            try:
+                self._fetch_all(urls, media_queue)
+            finally:
+                for _ in media_threads:
+                    media_queue.put(None)
+
+                for thread in media_threads:
+                    thread.join()
+
+        return not self._failed
+
+    def _fetch_all(
+        self, urls: Iterable[str], media_queue: queue.Queue[Optional[PipelineItem]]
+    ) -> None:
+        # limit the number of queued fetches, so a generator is only consumed as fast as the pipeline progresses
+        slots = threading.BoundedSemaphore(self.metadata_workers * 2)
+
+        with ThreadPoolExecutor(max_workers=self.metadata_workers) as metadata_pool:
+            for count, url in enumerate(urls):
+                slots.acquire()
+                future = metadata_pool.submit(
+                    self._fetch, PipelineItem(count, url), media_queue
+                )
+                future.add_done_callback(lambda _: slots.release())
+
+    def _fetch(
+        self, item: PipelineItem, media_queue: queue.Queue[Optional[PipelineItem]]
+    ) -> None:
+        try:
+            item.hegre_object = self.fetch(item)
+        except Exception as e:
+            self._fail(item, e)
+            return
+
+        if item.hegre_object:
+            # blocks while the media workers are busy, which holds back the metadata stage
+            media_queue.put(item)
+
+    def _transfer_media(
+        self,
+        media_queue: queue.Queue[Optional[PipelineItem]],
+        asset_pool: ThreadPoolExecutor,
+    ) -> None:
+        while item := media_queue.get():
+            try:
+                assets = self.list_assets(item)
+            except Exception as e:
+                self._fail(item, e)
+                continue
+
+            item.pending = len(assets) + 1
+            for asset in assets:
+                asset_pool.submit(self._transfer_asset, item, asset)
+
+            try:
+                self.download_media(item)
+            except Exception as e:
+                self._finish(item, e)
+            else:
+                self._finish(item)
+
+    def _transfer_asset(self, item: PipelineItem, asset: Asset) -> None:
+        try:
+            self.download_asset(item, asset)
+        except Exception as e:
+            self._finish(item, e)
+        else:
+            self._finish(item)
+
+    def _finish(self, item: PipelineItem, e: Optional[Exception] = None) -> None:
+        """Marks the file or an asset of an item as done, completing the item once all of them are done"""
+        with self._lock:
+            item.pending -= 1
+            first_error = e is not None and item.error is None
+            if first_error:
+                item.error = e
+            complete = item.pending == 0 and item.error is None
+
+        if first_error:
+            self._fail(item, e)
+        elif complete:
+            self.on_complete(item)
+
+    def _fail(self, item: PipelineItem, e: Exception) -> None:
+        self._failed = True
+        self.on_error(item, e)
@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import sys
+import json
+import time
+import itertools
+import threading
+
+from datetime import datetime, timezone
+from typing import Optional, TextIO
+
+from rich.console import Console
+from rich.progress import Progress, TaskID
+from rich.text import Text
+
+# seconds between two samples of the progress bars
+DEFAULT_INTERVAL = 0.1
+# seconds between two JSON lines in headless mode
+DEFAULT_JSON_INTERVAL = 10.0
+
+
+class TaskCounter:
+    """Progress of a single task, which worker threads advance without taking a lock
+
+    Every thread adds to its own slot, so concurrent advances (e.g. of the segments of a download) are
+    never lost. The renderer sums the slots of a copy, which is atomic in CPython.
+    """
+
+    description: str
+    total: Optional[float]
+    started: bool
+    stopped: bool
+    _completed: float
+    _advanced: dict[int, float]
+
+    def __init__(self, description: str, total: Optional[float], started: bool) -> None:
+        self.description = description
+        self.total = total
+        self.started = started
+        self.stopped = False
+        self._completed = 0
+        self._advanced = {}
+
+    @property
+    def completed(self) -> float:
+        return self._completed + sum(self._advanced.copy().values())
+
+    def set_completed(self, completed: float) -> None:
+        self._advanced = {}
+        self._completed = completed
+
+    def advance(self, advance: float) -> None:
+        thread = threading.get_ident()
+        self._advanced[thread] = self._advanced.get(thread, 0) + advance
+
+    def is_finished(self) -> bool:
+        return self.stopped or (self.total is not None and self.completed >= self.total)
+
+
+class ProgressReporter:
+    """Drop-in replacement of rich's Progress for workers, which only bump counters
+
+    A single renderer thread samples the counters at a fixed rate and either draws them as progress bars
+    or, in headless mode, writes them as JSON lines. Workers never wait for the console.
+    """
+
+    console: Console
+    interval: float
+    _progress: Optional[Progress]
+    _json_file: Optional[TextIO]
+    _tasks: dict[int, TaskCounter]
+    _progress_task_ids: dict[int, TaskID]
+    _started_task_ids: set[int]
+    _stopped_task_ids: set[int]
+    _task_ids: itertools.count
+    _stop: threading.Event
+    _renderer: Optional[threading.Thread]
+    _last_sample: Optional[tuple[float, float]]
+
+    def __init__(
+        self,
+        progress: Optional[Progress] = None,
+        json_file: Optional[TextIO] = None,
+        interval: Optional[float] = None,
+    ) -> None:
+        """Creates the reporter, which renders to progress bars, JSON lines or nothing
+
+        Args:
+            progress (Optional[Progress], optional): Progress bars to draw, created with auto_refresh=False. Defaults to None.
+            json_file (Optional[TextIO], optional): File the JSON lines are written to, if there are no progress bars. Defaults to None.
+            interval (Optional[float], optional): Seconds between two samples. Defaults to DEFAULT_INTERVAL for progress bars and DEFAULT_JSON_INTERVAL for JSON lines.
+        """
+        self._progress = progress
+        self._json_file = json_file if progress is None else None
+        self.console = progress.console if progress else Console(stderr=True)
+        self.interval = interval or (
+            DEFAULT_INTERVAL if progress else DEFAULT_JSON_INTERVAL
+        )
+        self._tasks = {}
+        self._progress_task_ids = {}
+        self._started_task_ids = set()
+        self._stopped_task_ids = set()
+        self._task_ids = itertools.count()
+        self._stop = threading.Event()
+        self._renderer = None
+        self._last_sample = None
+
+    def __enter__(self) -> ProgressReporter:
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        if self._progress:
+            self._progress.start()
+
+        if self._progress or self._json_file:
+            self._stop.clear()
+            self._renderer = threading.Thread(target=self._render_loop, daemon=True)
+            self._renderer.start()
+
+    def stop(self) -> None:
+        if self._renderer:
+            self._stop.set()
+            self._renderer.join()
+            self._renderer = None
+
+        # render the final state
+        self.render()
+
+        if self._progress:
+            self._progress.stop()
+
+    def add_task(
+        self,
+        description: str,
+        start: bool = True,
+        total: Optional[float] = None,
+        **kwargs,
+    ) -> TaskID:
+        task_id = TaskID(next(self._task_ids))
+        self._tasks[task_id] = TaskCounter(description, total, start)
+
+        return task_id
+
+    def update(
+        self,
+        task_id: TaskID,
+        total: Optional[float] = None,
+        completed: Optional[float] = None,
+        advance: Optional[float] = None,
+        description: Optional[str] = None,
+        **kwargs,
+    ) -> None:
+        task = self._tasks[task_id]
+
+        if total is not None:
+            task.total = total
+        if completed is not None:
+            task.set_completed(completed)
+        if advance is not None:
+            task.advance(advance)
+        if description is not None:
+            task.description = description
+
+    def start_task(self, task_id: TaskID) -> None:
+        self._tasks[task_id].started = True
+
+    def stop_task(self, task_id: TaskID) -> None:
+        self._tasks[task_id].stopped = True
+
+    def render(self) -> None:
+        """Samples all counters and draws them to the progress bars or writes them as a JSON line"""
+        if self._progress:
+            self._render_progress()
+        elif self._json_file:
+            self._write_json_line()
+
+    def _render_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.render()
+
+    def _render_progress(self) -> None:
+        for task_id, task in list(self._tasks.items()):
+            if task_id not in self._progress_task_ids:
+                self._progress_task_ids[task_id] = self._progress.add_task(
+                    task.description, start=False, total=task.total
+                )
+
+            progress_task_id = self._progress_task_ids[task_id]
+            self._progress.update(
+                progress_task_id,
+                description=task.description,
+                total=task.total,
+                completed=task.completed,
+            )
+
+            if task.started and task_id not in self._started_task_ids:
+                self._started_task_ids.add(task_id)
+                self._progress.start_task(progress_task_id)
+            if task.stopped and task_id not in self._stopped_task_ids:
+                self._stopped_task_ids.add(task_id)
+                self._progress.stop_task(progress_task_id)
+
+        self._progress.refresh()
+
+    def _write_json_line(self) -> None:
+        tasks = list(self._tasks.values())
+        completed = sum(task.completed for task in tasks)
+        now = time.monotonic()
+
+        rate = None
+        if self._last_sample:
+            last_time, last_completed = self._last_sample
+            rate = (completed - last_completed) / max(now - last_time, 1e-9)
+        self._last_sample = (now, completed)
+
+        line = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "completed": completed,
+            "rate": rate,
+            "finished_tasks": sum(1 for task in tasks if task.is_finished()),
+            "tasks": [
+                {
+                    "description": Text.from_markup(task.description).plain,
+                    "completed": task.completed,
+                    "total": task.total,
+                }
+                for task in tasks
+                if task.started and not task.is_finished()
+            ],
+        }
+
+        self._json_file.write(json.dumps(line) + "\n")
+        self._json_file.flush()
+
+
+def create_progress_reporter(
+    json_interval: Optional[float] = None,
+) -> ProgressReporter:
+    """Creates a reporter that draws progress bars or, with a JSON interval, writes JSON lines to stdout"""
+    if json_interval:
+        return ProgressReporter(json_file=sys.stdout, interval=json_interval)
+
+    return ProgressReporter(Progress(auto_refresh=False))
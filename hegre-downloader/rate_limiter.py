@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import re
+import time
+import threading
+
+from datetime import datetime, time as time_of_day
+from typing import Callable, Optional
+
+from helper import parse_size
+
+# how often (in seconds) the schedule is checked for a different rate
+SCHEDULE_CHECK_INTERVAL = 1.0
+
+
+class TokenBucket:
+    """Token bucket of bytes, refilled at a fixed rate
+
+    Callers reserve the bytes they are about to transfer and wait for the returned delay. The bucket may
+    go into debt, so every reservation waits for all earlier ones: concurrent transfers are served in the
+    order of their reservations, which shares the rate fairly between transfers reading equally sized chunks.
+    """
+
+    rate: int
+    burst: int
+    _tokens: float
+    _updated: float
+    _clock: Callable[[], float]
+    _lock: threading.Lock
+
+    def __init__(
+        self,
+        rate: int,
+        burst: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Creates a full bucket
+
+        Args:
+            rate (int): Bytes per second, 0 for no limit
+            burst (Optional[int], optional): Capacity of the bucket in bytes. Defaults to one second worth of bytes.
+            clock (Callable[[], float], optional): Monotonic clock in seconds. Defaults to time.monotonic.
+        """
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._updated = clock()
+        self.set_rate(rate, burst)
+        self._tokens = self.burst
+
+    def set_rate(self, rate: int, burst: Optional[int] = None) -> None:
+        """Changes the rate, keeping the tokens (or debt) accumulated so far"""
+        self.rate = rate
+        self.burst = burst or rate
+
+    def reserve(self, size: int) -> float:
+        """Takes the given number of bytes from the bucket
+
+        Returns:
+            float: Number of seconds to wait before the bytes may be transferred
+        """
+        with self._lock:
+            now = self._clock()
+
+            if not self.rate:
+                self._updated = now
+                return 0.0
+
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= size
+
+            return max(0.0, -self._tokens / self.rate)
+
+
+class RateWindow:
+    """Time of day window with its own global rate, e.g. 09:00-18:00=1M"""
+
+    start: time_of_day
+    end: time_of_day
+    rate: int
+
+    def __init__(self, start: time_of_day, end: time_of_day, rate: int) -> None:
+        self.start = start
+        self.end = end
+        self.rate = rate
+
+    def contains(self, moment: time_of_day) -> bool:
+        if self.start <= self.end:
+            return self.start <= moment < self.end
+
+        # the window wraps around midnight
+        return moment >= self.start or moment < self.end
+
+
+class BandwidthLimiter:
+    """Limits the bandwidth of all downloads of a process
+
+    Every chunk is taken from a global bucket and from the bucket of its kind: media files (movies,
+    galleries) or assets (thumbnails, subtitles, screengrabs, trailers). A schedule may change the
+    global rate depending on the time of day. A rate of 0 means no limit.
+    """
+
+    rate: int
+    schedule: list[RateWindow]
+    _global: TokenBucket
+    _media: TokenBucket
+    _assets: TokenBucket
+    _now: Callable[[], datetime]
+    _clock: Callable[[], float]
+    _schedule_checked: Optional[float]
+
+    def __init__(
+        self,
+        rate: int = 0,
+        media_rate: int = 0,
+        assets_rate: int = 0,
+        schedule: Optional[list[RateWindow]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        now: Callable[[], datetime] = datetime.now,
+    ) -> None:
+        """Creates the limiter
+
+        Args:
+            rate (int, optional): Global bytes per second outside of the scheduled windows. Defaults to 0.
+            media_rate (int, optional): Bytes per second of all media files. Defaults to 0.
+            assets_rate (int, optional): Bytes per second of all assets. Defaults to 0.
+            schedule (Optional[list[RateWindow]], optional): Windows with a different global rate, the first matching window applies. Defaults to None.
+            clock (Callable[[], float], optional): Monotonic clock in seconds. Defaults to time.monotonic.
+            now (Callable[[], datetime], optional): Wall clock used for the schedule. Defaults to datetime.now.
+        """
+        self.rate = rate
+        self.schedule = schedule or []
+        self._clock = clock
+        self._now = now
+        self._schedule_checked = None
+
+        self._global = TokenBucket(rate, clock=clock)
+        self._media = TokenBucket(media_rate, clock=clock)
+        self._assets = TokenBucket(assets_rate, clock=clock)
+
+    def rate_at(self, moment: time_of_day) -> int:
+        """Returns the global rate at the given time of day"""
+        for window in self.schedule:
+            if window.contains(moment):
+                return window.rate
+
+        return self.rate
+
+    def reserve(self, size: int, asset: bool = False) -> float:
+        """Takes the given number of bytes from the global bucket and the bucket of their kind
+
+        Returns:
+            float: Number of seconds to wait before the bytes may be transferred
+        """
+        if self.schedule:
+            self._apply_schedule()
+
+        bucket = self._assets if asset else self._media
+
+        return max(self._global.reserve(size), bucket.reserve(size))
+
+    def consume(self, size: int, asset: bool = False) -> None:
+        """Blocks until the given number of bytes may be transferred"""
+        if delay := self.reserve(size, asset):
+            time.sleep(delay)
+
+    def _apply_schedule(self) -> None:
+        checked = self._clock()
+        if (
+            self._schedule_checked is not None
+            and checked - self._schedule_checked < SCHEDULE_CHECK_INTERVAL
+        ):
+            return
+
+        self._schedule_checked = checked
+
+        rate = self.rate_at(self._now().time())
+        if rate != self._global.rate:
+            self._global.set_rate(rate)
+
+
+def parse_schedule(schedule: str) -> list[RateWindow]:
+    """Parses a comma separated list of time of day windows and their rates
+
+    Args:
+        schedule (str): Windows in the form of "HH:MM-HH:MM=RATE", e.g. "09:00-18:00=1M,18:00-09:00=0"
+
+    Raises:
+        ValueError: If a window is in an invalid format
+
+    Returns:
+        list[RateWindow]: Windows in the given order
+    """
+    windows = []
+
+    for window in schedule.split(","):
+        match = re.fullmatch(
+            r"\s*(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})\s*=\s*(\S+)\s*", window
+        )
+        if not match:
+            raise ValueError(f"Invalid schedule window '{window}'")
+
+        start = datetime.strptime(match.group(1), "%H:%M").time()
+        end = datetime.strptime(match.group(2), "%H:%M").time()
+        windows.append(RateWindow(start, end, parse_size(match.group(3))))
+
+    return windows
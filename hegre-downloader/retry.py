@@ -0,0 +1,317 @@
+from __future__ import annotations
+
+import time
+import random
+import asyncio
+import threading
+
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+
+from httpx import HTTPError, StreamError
+
+from exceptions import CircuitOpenError
+
+T = TypeVar("T")
+
+# base delay (in seconds) of the exponential backoff, doubled with every failed attempt
+DEFAULT_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 60.0
+# longest Retry-After (in seconds) that is honored, longer ones are cut to it
+MAX_RETRY_AFTER = 300.0
+# number of consecutive failures of a host that open its circuit
+DEFAULT_FAILURE_THRESHOLD = 5
+# seconds a circuit stays open before a single probe request is let through
+DEFAULT_RESET_TIMEOUT = 30.0
+# status codes of temporary conditions (timeouts, throttling, overloaded or restarting servers)
+RETRYABLE_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+# errors that will not go away by repeating the request
+FATAL_ERRORS = (httpx.UnsupportedProtocol, httpx.DecodingError, httpx.TooManyRedirects)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """Suspends the requests to a host after too many consecutive failures
+
+    Once a host has failed failure_threshold times in a row, its circuit opens and all requests to it
+    fail fast with CircuitOpenError for reset_timeout seconds. After that a single probe request is let
+    through (half-open): its success closes the circuit again, its failure opens it for another
+    reset_timeout. This keeps many workers from hammering a host that is throttling or down.
+    """
+
+    failure_threshold: int
+    reset_timeout: float
+    _failures: dict[str, int]
+    _opened: dict[str, float]
+    _probing: set[str]
+    _clock: Callable[[], float]
+    _lock: threading.Lock
+
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = {}
+        self._opened = {}
+        self._probing = set()
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def state(self, host: str) -> str:
+        with self._lock:
+            if host not in self._opened:
+                return CLOSED
+
+            if host in self._probing or self._remaining(host) <= 0:
+                return HALF_OPEN
+
+            return OPEN
+
+    def check(self, host: str) -> None:
+        """Lets a request to the host through, unless its circuit is open
+
+        Raises:
+            CircuitOpenError: If the circuit of the host is open or its probe request is still running
+        """
+        with self._lock:
+            if host not in self._opened:
+                return
+
+            remaining = self._remaining(host)
+            if remaining <= 0 and host not in self._probing:
+                self._probing.add(host)
+                return
+
+            raise CircuitOpenError(
+                f"Requests to {host} are suspended after {self._failures[host]} consecutive failures",
+                max(remaining, 0.0) or self.reset_timeout,
+            )
+
+    def record_success(self, host: str) -> None:
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened.pop(host, None)
+            self._probing.discard(host)
+
+    def record_failure(self, host: str) -> None:
+        with self._lock:
+            self._failures[host] = self._failures.get(host, 0) + 1
+            self._probing.discard(host)
+
+            if self._failures[host] >= self.failure_threshold:
+                self._opened[host] = self._clock()
+
+    def release_probe(self, host: str) -> None:
+        """Lets another probe through, if the probe request of the host failed without telling anything about the host"""
+        with self._lock:
+            self._probing.discard(host)
+
+    def _remaining(self, host: str) -> float:
+        return self._opened[host] + self.reset_timeout - self._clock()
+
+
+class RetryPolicy:
+    """Decides whether and when a failed request is repeated, shared by all requests of a client
+
+    Retryable errors (network errors, truncated bodies, throttling and server errors) are repeated after
+    an exponential backoff with full jitter, i.e. a random delay between 0 and backoff * 2^(attempt - 1),
+    so workers that failed at the same moment do not retry at the same moment. A Retry-After header of
+    the response takes precedence. Fatal errors (e.g. HTTP 404) are raised right away.
+    """
+
+    max_attempts: int
+    backoff: float
+    max_backoff: float
+    breaker: Optional[CircuitBreaker]
+    _random: random.Random
+    _sleep: Callable[[float], None]
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        backoff: float = DEFAULT_BACKOFF,
+        max_backoff: float = DEFAULT_MAX_BACKOFF,
+        breaker: Optional[CircuitBreaker] = None,
+        seed: Optional[int] = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """Creates a policy
+
+        Args:
+            max_attempts (int, optional): Number of attempts of a request made with call(). Defaults to 3.
+            backoff (float, optional): Base delay in seconds, 0 to retry immediately. Defaults to DEFAULT_BACKOFF.
+            max_backoff (float, optional): Longest delay in seconds, not counting Retry-After. Defaults to DEFAULT_MAX_BACKOFF.
+            breaker (Optional[CircuitBreaker], optional): Circuit breaker of the hosts. Defaults to None.
+            seed (Optional[int], optional): Seed of the jitter, e.g. for testing. Defaults to None.
+            sleep (Callable[[float], None], optional): Waits the given seconds in call(). Defaults to time.sleep.
+        """
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker
+        self._random = random.Random(seed)
+        self._sleep = sleep
+
+    def check(self, url: str) -> None:
+        """Raises CircuitOpenError, if the circuit of the host of the URL is open"""
+        if self.breaker:
+            self.breaker.check(get_host(url))
+
+    def record(self, url: str, error: Optional[BaseException] = None) -> None:
+        """Reports the outcome of a request to the circuit breaker
+
+        Only retryable errors count as failures of the host, a missing page says nothing about its health.
+        """
+        if not self.breaker or isinstance(error, CircuitOpenError):
+            return
+
+        if error is not None and is_retryable(error):
+            self.breaker.record_failure(get_host(url))
+        else:
+            self.breaker.record_success(get_host(url))
+
+    def release(self, url: str) -> None:
+        """Releases the probe of the host of the URL after an error that is neither a success nor a failure
+        of the host (e.g. a full disk), so its circuit is not stuck half-open"""
+        if self.breaker:
+            self.breaker.release_probe(get_host(url))
+
+    def sleep(self, seconds: float) -> None:
+        """Waits before the next attempt of a synchronous request"""
+        self._sleep(seconds)
+
+    def get_delay(self, attempt: int, error: BaseException) -> Optional[float]:
+        """Returns the seconds to wait before the next attempt or None, if the error is not worth retrying
+
+        Args:
+            attempt (int): Number of the failed attempt, starting at 1
+            error (BaseException): Error of the failed attempt
+        """
+        if not is_retryable(error):
+            return None
+
+        if isinstance(error, CircuitOpenError):
+            return error.retry_after
+
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, MAX_RETRY_AFTER)
+
+        return self._random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        )
+
+    def call(
+        self,
+        url: str,
+        request: Callable[[], T],
+        on_retry: Optional[Callable[[int, BaseException, float], None]] = None,
+    ) -> T:
+        """Makes a request to the URL, repeating it up to max_attempts times while it fails with a retryable error
+
+        Args:
+            url (str): URL of the request, whose host the circuit breaker keeps track of
+            request (Callable[[], T]): Makes the request, raising an error if it failed
+            on_retry (Optional[Callable[[int, BaseException, float], None]], optional): Called with the attempt, error and delay before every retry. Defaults to None.
+
+        Returns:
+            T: Result of the first successful attempt
+        """
+        attempt = 1
+        while True:
+            try:
+                self.check(url)
+                result = request()
+            except (HTTPError, StreamError, CircuitOpenError) as e:
+                self.record(url, e)
+                delay = self.get_delay(attempt, e)
+                if delay is None or attempt >= self.max_attempts:
+                    raise
+
+                if on_retry:
+                    on_retry(attempt, e, delay)
+                self.sleep(delay)
+                attempt += 1
+            except BaseException:
+                self.release(url)
+                raise
+            else:
+                self.record(url)
+                return result
+
+    async def call_async(
+        self,
+        url: str,
+        request: Callable[[], Awaitable[T]],
+        on_retry: Optional[Callable[[int, BaseException, float], None]] = None,
+    ) -> T:
+        """Asynchronous counterpart of call(), waiting with asyncio.sleep"""
+        attempt = 1
+        while True:
+            try:
+                self.check(url)
+                result = await request()
+            except (HTTPError, StreamError, CircuitOpenError) as e:
+                self.record(url, e)
+                delay = self.get_delay(attempt, e)
+                if delay is None or attempt >= self.max_attempts:
+                    raise
+
+                if on_retry:
+                    on_retry(attempt, e, delay)
+                await asyncio.sleep(delay)
+                attempt += 1
+            except BaseException:
+                self.release(url)
+                raise
+            else:
+                self.record(url)
+                return result
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Returns True, if repeating the failed request may succeed"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+
+    if isinstance(error, FATAL_ERRORS):
+        return False
+
+    return isinstance(error, (HTTPError, StreamError, CircuitOpenError))
+
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    """Returns the seconds of the Retry-After header (delay or HTTP date) of a failed response, if any"""
+    if not isinstance(error, httpx.HTTPStatusError):
+        return None
+
+    value = error.response.headers.get("Retry-After", "").strip()
+    if not value:
+        return None
+
+    if value.isdigit():
+        return float(value)
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+def get_host(url: str) -> str:
+    return httpx.URL(url).host
@@ -0,0 +1,51 @@
+import os
+import json
+
+from sort_option import SortOption
+
+MARK_SIZE = 5
+
+
+class SyncState:
+    """High-water marks of incremental runs, stored in a JSON file
+
+    The mark of a listing (e.g. all movies, sorted by most recent) consists of the URLs of the newest
+    items of the last complete run. Several URLs are kept, so the mark stays usable if one of these
+    items is removed from the listing.
+    """
+
+    filename: str
+    _marks: dict[str, list[str]]
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self._marks = {}
+
+        if os.path.exists(filename):
+            with open(filename, "r", encoding="utf-8") as state_file:
+                self._marks = json.load(state_file)
+
+    @staticmethod
+    def key(url: str, sort: SortOption) -> str:
+        return f"{url.rstrip('/')} {sort}"
+
+    def get_mark(self, key: str) -> set[str]:
+        """Returns the URLs of the newest items of the last complete run"""
+        return set(self._marks.get(key, []))
+
+    def update_mark(self, key: str, newest_urls: list[str]) -> None:
+        """Prepends the newest URLs of a complete run to the mark and writes the state file
+
+        Args:
+            key (str): Key of the listing, see key()
+            newest_urls (list[str]): URLs of the newest items of the run, in the order of the listing
+        """
+        urls = newest_urls + self._marks.get(key, [])
+        self._marks[key] = list(dict.fromkeys(urls))[:MARK_SIZE]
+
+        # write to a temporary file first, so an interrupted write does not lose all marks
+        temp_file = f"{self.filename}.temp"
+        with open(temp_file, "w", encoding="utf-8") as state_file:
+            json.dump(self._marks, state_file, indent=4)
+
+        os.replace(temp_file, self.filename)
@@ -0,0 +1,110 @@
+import os
+import re
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from hegre import PARSERS, parser_available
+from model import movie
+from model.movie import HegreMovie
+
+import pytest
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+FILM_URL = "https://www.hegre.com/films/title-of-the-film"
+SEXED_URL = "https://www.hegre.com/sexed/title-of-the-sexed-film"
+
+AVAILABLE_PARSERS = [parser for parser in PARSERS if parser_available(parser)]
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), "r", encoding="utf-8") as fixture:
+        return fixture.read()
+
+
+@pytest.mark.parametrize("parser", AVAILABLE_PARSERS)
+@pytest.mark.parametrize(
+    "url,fixture", [(FILM_URL, "film_page.html"), (SEXED_URL, "sexed_page.html")]
+)
+def test_partial_parse_equals_full_parse(parser, url, fixture):
+    """Tests that parsing only the relevant elements of a film page yields the same movie as parsing the complete page"""
+    html = read_fixture(fixture)
+
+    partial = HegreMovie.from_film_page_html(url, html, parser)
+    full = HegreMovie.from_film_page(url, BeautifulSoup(html, parser))
+
+    assert partial.to_json() == full.to_json()
+
+
+def test_film_page_without_lists_is_parsed_once(monkeypatch):
+    """Tests that a film page without tags, models, trailers and screengrabs is not parsed a second time"""
+    html = read_fixture("film_page.html")
+    html = re.sub(r'<a class="(tag|record-model)".*?</a>', "", html)
+    html = re.sub(
+        r'<div class="(trailer|video-stills)">.*?</div>', "", html, flags=re.S
+    )
+    from_film_page = HegreMovie.from_film_page
+    parsed_pages = []
+
+    def count_parses(url: str, film_page: BeautifulSoup) -> HegreMovie:
+        parsed_pages.append(film_page)
+        return from_film_page(url, film_page)
+
+    monkeypatch.setattr(HegreMovie, "from_film_page", staticmethod(count_parses))
+
+    hm = HegreMovie.from_film_page_html(FILM_URL, html, AVAILABLE_PARSERS[0])
+
+    assert len(parsed_pages) == 1
+    assert hm.code == 12345
+    assert (hm.tags, hm.models, hm.trailers, hm.screengrabs_url) == ([], [], {}, None)
+
+
+def test_film_page_details():
+    """Tests the details parsed from a saved film page"""
+    hm = HegreMovie.from_film_page_html(
+        FILM_URL, read_fixture("film_page.html"), AVAILABLE_PARSERS[0]
+    )
+
+    assert hm.title == "Title of the Film"
+    assert hm.code == 12345
+    assert hm.duration == 25 * 60 + 13
+    assert [model.name for model in hm.models] == ["First Model", "Second Model"]
+    assert sorted(hm.downloads) == [1080, 2160]
+    assert sorted(hm.subtitles) == ["english", "german"]
+    assert hm.trailers[1080].endswith("trailer-1080p.mp4")
+
+
+def test_partial_parse_falls_back_to_full_parse(monkeypatch):
+    """Tests the fallback to the complete page, if the partial tree misses details"""
+    monkeypatch.setattr(movie, "FILM_PAGE_STRAINER", SoupStrainer(class_="title"))
+
+    hm = HegreMovie.from_film_page_html(
+        FILM_URL, read_fixture("film_page.html"), AVAILABLE_PARSERS[0]
+    )
+
+    assert hm.code == 12345
+    assert sorted(hm.downloads) == [1080, 2160]
+
+
+@pytest.mark.parametrize("missing_class", ["approved-tags", "record-model", "date"])
+def test_partial_parse_falls_back_if_optional_details_are_missing(
+    monkeypatch, missing_class
+):
+    """Tests the fallback to the complete page, if the partial tree only misses details like tags, models or date"""
+    classes = movie.FILM_PAGE_CLASSES - {missing_class}
+    monkeypatch.setattr(
+        movie,
+        "FILM_PAGE_STRAINER",
+        SoupStrainer(
+            class_=lambda attr: attr is not None
+            and any(name in classes for name in attr.split())
+        ),
+    )
+    html = read_fixture("film_page.html")
+
+    partial = HegreMovie.from_film_page_html(FILM_URL, html, AVAILABLE_PARSERS[0])
+    full = HegreMovie.from_film_page(
+        FILM_URL, BeautifulSoup(html, AVAILABLE_PARSERS[0])
+    )
+
+    assert partial.to_json() == full.to_json()
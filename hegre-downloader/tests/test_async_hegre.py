@@ -0,0 +1,124 @@
+from async_hegre import AsyncHegre
+from hegre import LISTING_PAGES_PER_WORKER
+from sort_option import SortOption
+
+import asyncio
+import hashlib
+import httpx
+import pytest
+
+ITEMS_PER_PAGE = 3
+TOTAL = 10
+
+
+def mock_listing_handler(request: httpx.Request) -> httpx.Response:
+    """Serves a movie listing of TOTAL items with ITEMS_PER_PAGE items per page"""
+    page = int(request.url.params.get("films_page", 1))
+    start = (page - 1) * ITEMS_PER_PAGE
+
+    if start >= TOTAL:
+        return httpx.Response(200, text='<p class="hint">No more films</p>')
+
+    items = "".join(
+        f'<div class="item"><a href="/films/film-{i}">Film {i}</a></div>'
+        for i in range(start, min(start + ITEMS_PER_PAGE, TOTAL))
+    )
+    return httpx.Response(
+        200,
+        text=f'<h2><strong>{TOTAL}</strong> films</h2><div id="films-listing">{items}</div>',
+    )
+
+
+def test_resolve_urls_keeps_listing_order():
+    """Test that all movie URLs are resolved concurrently in the order of the listing"""
+
+    async def resolve() -> list[str]:
+        async with AsyncHegre(
+            transport=httpx.MockTransport(mock_listing_handler)
+        ) as hegre:
+            return await hegre.resolve_urls(
+                "https://www.hegre.com/movies", SortOption.MOST_RECENT, workers=4
+            )
+
+    urls = asyncio.run(resolve())
+
+    assert urls == [f"https://www.hegre.com/films/film-{i}" for i in range(TOTAL)]
+
+
+def test_failed_listing_page_cancels_the_other_fetches():
+    """Test that only a window of listing pages is fetched ahead, whose fetches are cancelled once a page fails"""
+    total = ITEMS_PER_PAGE * 20
+    requested_pages = []
+    finished_pages = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if "films_sort" not in request.url.params:
+            return httpx.Response(200, text=f"<h2><strong>{total}</strong> films</h2>")
+
+        page = int(request.url.params["films_page"])
+        requested_pages.append(page)
+        if page == 2:
+            return httpx.Response(404)
+        if page > 2:
+            await asyncio.sleep(0.1)
+
+        finished_pages.append(page)
+        items = "".join(
+            f'<div class="item"><a href="/films/film-{page}-{i}">Film</a></div>'
+            for i in range(ITEMS_PER_PAGE)
+        )
+        return httpx.Response(200, text=f'<div id="films-listing">{items}</div>')
+
+    async def resolve() -> None:
+        async with AsyncHegre(transport=httpx.MockTransport(handler)) as hegre:
+            try:
+                await hegre.resolve_urls(
+                    "https://www.hegre.com/movies", SortOption.MOST_RECENT, workers=2
+                )
+            finally:
+                # cancelled fetches would finish during this time
+                await asyncio.sleep(0.2)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(resolve())
+
+    assert max(requested_pages) <= 1 + 2 * LISTING_PAGES_PER_WORKER
+    assert finished_pages == [1]
+
+
+def test_refresh_asset_replaces_changed_file(tmp_path):
+    """Test that an existing asset is kept on HTTP 304 and replaced, if it has changed"""
+    responses = [httpx.Response(304), httpx.Response(200, content=b"new")]
+    (tmp_path / "thumb.jpg").write_bytes(b"old")
+
+    async def refresh() -> list[bool]:
+        async with AsyncHegre(
+            transport=httpx.MockTransport(lambda _: responses.pop(0))
+        ) as hegre:
+            return [
+                await hegre._refresh_asset(
+                    "https://c.hegre.com/thumb.jpg", str(tmp_path / "thumb.jpg")
+                )
+                for _ in range(2)
+            ]
+
+    assert asyncio.run(refresh()) == [False, True]
+    assert (tmp_path / "thumb.jpg").read_bytes() == b"new"
+
+
+def test_download_writes_file_off_the_event_loop(tmp_path):
+    """Test that a download, whose writes run in a worker thread, is complete and can be checksummed"""
+    content = bytes(range(256)) * 1024
+
+    async def download() -> str:
+        async with AsyncHegre(
+            transport=httpx.MockTransport(
+                lambda _: httpx.Response(200, content=content)
+            )
+        ) as hegre:
+            return await hegre._download_with_retries(
+                "https://c.hegre.com/movie.mp4", tmp_path, "movie.mp4", checksum=True
+            )
+
+    assert asyncio.run(download()) == hashlib.sha256(content).hexdigest()
+    assert (tmp_path / "movie.mp4").read_bytes() == content
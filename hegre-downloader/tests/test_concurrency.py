@@ -0,0 +1,91 @@
+import threading
+
+from concurrency import HOLD_WINDOWS, AdaptiveConcurrency, ResizableSemaphore
+
+INTERVAL = 10.0
+MAX_TASKS = 4
+
+
+class FakeClock:
+    """Monotonic clock that only advances when told to"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def run_window(
+    controller: AdaptiveConcurrency,
+    clock: FakeClock,
+    throughput: int,
+    status_code: int = 206,
+    latency: float = 0.1,
+) -> int:
+    """Reports one window with the given throughput and returns the resulting limit"""
+    controller.record_response(status_code, latency)
+    clock.now += INTERVAL
+    controller.record_bytes(int(throughput * INTERVAL))
+
+    return controller.limit
+
+
+def test_grows_while_throughput_increases():
+    """Test that the limit grows by one per window up to the maximum, as long as the throughput increases"""
+    clock = FakeClock()
+    controller = AdaptiveConcurrency(1, MAX_TASKS, interval=INTERVAL, clock=clock)
+
+    limits = [run_window(controller, clock, 1000 * (i + 1)) for i in range(5)]
+
+    assert limits == [2, 3, 4, 4, 4]
+
+
+def test_halves_on_throttling():
+    """Test that the limit is halved, if the server responds with HTTP 429"""
+    clock = FakeClock()
+    controller = AdaptiveConcurrency(1, MAX_TASKS, interval=INTERVAL, clock=clock)
+    for i in range(3):
+        run_window(controller, clock, 1000 * (i + 1))
+
+    assert run_window(controller, clock, 4000, status_code=429) == MAX_TASKS // 2
+
+
+def test_steps_back_and_holds_without_gain():
+    """Test that an increase without throughput gain is undone and not retried for a few windows"""
+    clock = FakeClock()
+    controller = AdaptiveConcurrency(1, MAX_TASKS, interval=INTERVAL, clock=clock)
+    run_window(controller, clock, 1000)
+    run_window(controller, clock, 2000)
+
+    limits = [run_window(controller, clock, 2000) for _ in range(HOLD_WINDOWS + 2)]
+
+    assert limits == [2] * (HOLD_WINDOWS + 1) + [3]
+
+
+def test_shrinks_on_rising_latency():
+    """Test that the limit shrinks, if the latency to the first byte rises sharply"""
+    clock = FakeClock()
+    controller = AdaptiveConcurrency(1, MAX_TASKS, interval=INTERVAL, clock=clock)
+    run_window(controller, clock, 1000)
+    run_window(controller, clock, 2000)
+
+    assert run_window(controller, clock, 3000, latency=1.0) == 2
+
+
+def test_resizable_semaphore_admits_waiters_when_raised():
+    """Test that a waiting acquisition proceeds once the limit is raised"""
+    semaphore = ResizableSemaphore(1)
+    semaphore.acquire()
+    acquired = threading.Event()
+
+    def acquire():
+        semaphore.acquire()
+        acquired.set()
+
+    threading.Thread(target=acquire, daemon=True).start()
+    assert not acquired.wait(0.1)
+
+    semaphore.set_limit(2)
+    assert acquired.wait(1)
+    assert semaphore.active == 2
@@ -0,0 +1,97 @@
+import threading
+
+from download_archive import (
+    SqliteArchive,
+    TextArchive,
+    open_download_archive,
+)
+
+import pytest
+
+THREADS = 4
+IDS_PER_THREAD = 50
+
+
+def test_text_archive_reads_lines_of_other_writers(tmp_path):
+    """Test that a text archive sees IDs appended by another process after it has been opened"""
+    filename = tmp_path / "archive.txt"
+    filename.write_text("films 1\n")
+    archive = TextArchive(filename)
+    other_process = TextArchive(filename)
+
+    other_process.add("films 2")
+
+    assert "films 1" in archive
+    assert "films 2" in archive
+    assert "films 3" not in archive
+
+
+def test_text_archive_skips_incomplete_last_line(tmp_path):
+    """Test that a line that is still being written is read once it is complete"""
+    filename = tmp_path / "archive.txt"
+    filename.write_text("films 1\nfilms 2")
+    archive = TextArchive(filename)
+
+    assert "films 2" not in archive
+
+    with open(filename, "a") as archive_file:
+        archive_file.write("0\n")
+
+    assert "films 20" in archive
+
+
+def test_sqlite_archive_records_extra_fields(tmp_path):
+    """Test that a SQLite archive records the URL, size and checksum of an ID"""
+    archive = SqliteArchive(tmp_path / "archive.db")
+
+    archive.add(
+        "films 1", url="https://www.hegre.com/films/film", size=42, checksum="abc"
+    )
+
+    assert "films 1" in archive
+    assert "films 2" not in archive
+    assert archive.get("films 1")["size"] == 42
+    assert archive.get("films 1")["checksum"] == "abc"
+    assert archive.get("films 1")["recorded_at"] > 0
+
+
+def test_sqlite_archive_does_not_use_wal(tmp_path):
+    """Test that a SQLite archive uses a rollback journal, as WAL does not work on network storage"""
+    archive = SqliteArchive(tmp_path / "archive.db")
+
+    assert archive._connection.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    assert not (tmp_path / "archive.db-wal").exists()
+
+
+def test_sqlite_archive_imports_text_archive(tmp_path):
+    """Test the migration of a text archive, which skips IDs that are recorded already"""
+    text_archive = tmp_path / "archive.txt"
+    text_archive.write_text("films 1\nphotos 2\n\n")
+    archive = SqliteArchive(tmp_path / "archive.db")
+    archive.add("films 1", size=42)
+
+    assert archive.import_text_archive(text_archive) == 1
+    assert "photos 2" in archive
+    assert archive.get("films 1")["size"] == 42
+
+
+@pytest.mark.parametrize("filename", ["archive.txt", "archive.db"])
+def test_concurrent_writers(tmp_path, filename):
+    """Test that the IDs of several writers, each with its own archive instance, are all recorded"""
+
+    def write(thread: int) -> None:
+        archive = open_download_archive(tmp_path / filename)
+        for i in range(IDS_PER_THREAD):
+            archive.add(f"films {thread}-{i}")
+        archive.close()
+
+    threads = [threading.Thread(target=write, args=(t,)) for t in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    archive = open_download_archive(tmp_path / filename)
+    for t in range(THREADS):
+        for i in range(IDS_PER_THREAD):
+            assert f"films {t}-{i}" in archive
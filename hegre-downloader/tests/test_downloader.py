@@ -0,0 +1,42 @@
+import downloader
+
+from async_hegre import AsyncHegre
+from configuration import Configuration
+from sort_option import SortOption
+
+import asyncio
+import httpx
+
+
+def test_async_download_continues_after_unexpected_error(tmp_path, monkeypatch):
+    """Test that an unexpected error of one URL is counted as failure, without ending the downloads of the other URLs"""
+    downloaded = []
+
+    async def download_url_async(async_hegre, url, *args) -> None:
+        if url.endswith("broken"):
+            raise AttributeError("'NoneType' object has no attribute 'text'")
+        if url.endswith("truncated"):
+            raise httpx.StreamError("Download ended after 100 of 200 bytes")
+
+        await asyncio.sleep(0)
+        downloaded.append(url)
+
+    monkeypatch.setattr(downloader, "download_url_async", download_url_async)
+    urls = [f"https://www.hegre.com/films/film-{i}" for i in range(4)]
+    urls[1:1] = [
+        "https://www.hegre.com/films/broken",
+        "https://www.hegre.com/films/truncated",
+    ]
+
+    async def download() -> bool:
+        async with AsyncHegre(
+            transport=httpx.MockTransport(lambda _: httpx.Response(404))
+        ) as hegre:
+            return await downloader.download_urls_async(
+                hegre,
+                urls,
+                Configuration([], tmp_path, 0, 1, SortOption.MOST_RECENT),
+            )
+
+    assert not asyncio.run(download())
+    assert downloaded == [url for url in urls if "film-" in url]
@@ -0,0 +1,531 @@
+from hegre import (
+    Hegre,
+    MOVIES_LISTING_URL,
+    PARSERS,
+    parse_content_range,
+    parse_listing_page,
+    select_parser,
+)
+from sort_option import SortOption
+from configuration import Configuration
+from retry import RetryPolicy
+from rich.progress import Progress
+
+import hegre as hegre_module
+import gzip
+import json
+import math
+import time
+import hashlib
+import httpx
+import pytest
+
+ITEMS_PER_PAGE = 3
+TOTAL = 10
+
+
+def mock_listing_page_urls(url: str, selector: str) -> list[str] | None:
+    """Serves a listing of TOTAL items with ITEMS_PER_PAGE items per page"""
+    page = int(url.split("page=")[-1])
+    start = (page - 1) * ITEMS_PER_PAGE
+
+    if start >= TOTAL:
+        return None
+
+    end = min(start + ITEMS_PER_PAGE, TOTAL)
+    return [f"https://www.hegre.com/films/film-{i}" for i in range(start, end)]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_get_movie_urls_keeps_listing_order(monkeypatch, workers):
+    """Test that all movie URLs are returned in the order of the listing, regardless of the number of workers"""
+    hegre = Hegre()
+    monkeypatch.setattr(hegre, "_get_listing_page_urls", mock_listing_page_urls)
+
+    urls = hegre.get_movie_urls(TOTAL, SortOption.MOST_RECENT, workers=workers)
+
+    assert urls == [f"https://www.hegre.com/films/film-{i}" for i in range(TOTAL)]
+
+
+def test_get_gallery_urls_continues_after_outdated_total(monkeypatch):
+    """Test that pages beyond the derived page count are fetched, if the total is outdated"""
+    hegre = Hegre()
+    monkeypatch.setattr(hegre, "_get_listing_page_urls", mock_listing_page_urls)
+
+    urls = hegre.get_gallery_urls(TOTAL - 5, SortOption.MOST_RECENT, workers=4)
+
+    assert len(urls) == TOTAL
+
+
+def test_iter_urls_yields_before_listing_is_complete(monkeypatch):
+    """Test that iter_urls() yields the first URLs before all listing pages have been fetched"""
+    hegre = Hegre()
+    fetched_pages = []
+
+    def mock_tracking_listing_page_urls(url: str, selector: str) -> list[str] | None:
+        fetched_pages.append(url)
+        return mock_listing_page_urls(url, selector)
+
+    monkeypatch.setattr(hegre, "get_total_movie_count", lambda: TOTAL)
+    monkeypatch.setattr(
+        hegre, "_get_listing_page_urls", mock_tracking_listing_page_urls
+    )
+
+    urls = hegre.iter_urls("https://www.hegre.com/movies")
+
+    assert next(urls) == "https://www.hegre.com/films/film-0"
+    assert len(fetched_pages) == 1
+    assert len(list(urls)) == TOTAL - 1
+
+
+def test_stopped_listing_cancels_pending_pages(monkeypatch):
+    """Test that pages are fetched in a bounded window, so a consumer that stops does not fetch the rest of the listing"""
+    workers = 2
+    hegre = Hegre()
+    fetched_pages = []
+
+    def mock_endless_listing_page_urls(url: str, selector: str) -> list[str]:
+        fetched_pages.append(url)
+        return [url]
+
+    monkeypatch.setattr(hegre, "_get_listing_page_urls", mock_endless_listing_page_urls)
+
+    pages = hegre._fetch_listing_pages(
+        MOVIES_LISTING_URL, "", 1000, SortOption.MOST_RECENT, workers
+    )
+    next(pages)
+    next(pages)
+    pages.close()
+
+    assert len(fetched_pages) <= 2 + workers * hegre_module.LISTING_PAGES_PER_WORKER
+
+
+def test_slow_consumer_bounds_fetched_pages(monkeypatch):
+    """Test that streamed URLs are not buffered ahead of a slow consumer beyond the window of pages"""
+    workers = 2
+    window = workers * hegre_module.LISTING_PAGES_PER_WORKER
+    total = 20 * ITEMS_PER_PAGE
+    hegre = Hegre()
+    fetched_pages = []
+
+    def mock_long_listing_page_urls(url: str, selector: str) -> list[str] | None:
+        fetched_pages.append(url)
+        page = int(url.split("page=")[-1])
+        if page > total // ITEMS_PER_PAGE:
+            return None
+
+        return [f"{url}&item={i}" for i in range(ITEMS_PER_PAGE)]
+
+    monkeypatch.setattr(hegre, "get_total_movie_count", lambda: total)
+    monkeypatch.setattr(hegre, "_get_listing_page_urls", mock_long_listing_page_urls)
+
+    for consumed, _ in enumerate(
+        hegre.iter_urls("https://www.hegre.com/movies", workers=workers), start=1
+    ):
+        # give the workers time to fetch as far ahead as they are allowed to
+        time.sleep(0.005)
+        consumed_pages = math.ceil(consumed / ITEMS_PER_PAGE)
+        assert len(fetched_pages) <= consumed_pages + window
+
+    assert consumed == total
+
+
+def test_requests_share_session():
+    """Test that page requests are sent through the shared client instead of separate connections"""
+    requested_urls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested_urls.append(str(request.url))
+        return httpx.Response(200, text="<h2><strong>42</strong> films</h2>")
+
+    hegre = Hegre(transport=httpx.MockTransport(handler))
+
+    assert hegre.get_total_movie_count() == 42
+    assert requested_urls == ["https://www.hegre.com/movies?films_page=1"]
+
+
+MOCK_FILE = bytes(range(256)) * 64
+MOCK_ETAG = '"v1"'
+
+
+def mock_range_handler(request: httpx.Request) -> httpx.Response:
+    """Serves MOCK_FILE and supports range requests of the form 'bytes=<first>-[<last>]' with an optional If-Range"""
+    range_header = request.headers.get("Range")
+    if range_header and request.headers.get("If-Range", MOCK_ETAG) == MOCK_ETAG:
+        first, last = range_header.removeprefix("bytes=").split("-")
+        first = int(first)
+        last = int(last) if last else len(MOCK_FILE) - 1
+
+        if first >= len(MOCK_FILE):
+            return httpx.Response(
+                416, headers={"Content-Range": f"bytes */{len(MOCK_FILE)}"}
+            )
+
+        return httpx.Response(
+            206,
+            content=MOCK_FILE[first : last + 1],
+            headers={
+                "Content-Range": f"bytes {first}-{last}/{len(MOCK_FILE)}",
+                "ETag": MOCK_ETAG,
+            },
+        )
+
+    return httpx.Response(200, content=MOCK_FILE, headers={"ETag": MOCK_ETAG})
+
+
+@pytest.mark.parametrize("partial_size", [0, 1000, len(MOCK_FILE)])
+def test_download_resumes_temp_file(tmp_path, partial_size):
+    """Test that a temp file left behind by a previous attempt is resumed instead of downloaded again"""
+    requested_ranges = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested_ranges.append(request.headers.get("Range"))
+        return mock_range_handler(request)
+
+    hegre = Hegre(transport=httpx.MockTransport(handler))
+    (tmp_path / "movie.mp4.temp").write_bytes(MOCK_FILE[:partial_size])
+    (tmp_path / "movie.mp4.temp.validator").write_text(json.dumps({"ETag": MOCK_ETAG}))
+
+    hegre._download_with_retries("https://c.hegre.com/movie.mp4", tmp_path, "movie.mp4")
+
+    assert (tmp_path / "movie.mp4").read_bytes() == MOCK_FILE
+    assert requested_ranges == [f"bytes={partial_size}-" if partial_size else None]
+    assert not (tmp_path / "movie.mp4.temp.validator").exists()
+
+
+@pytest.mark.parametrize(
+    "partial,validator",
+    [
+        # the file has changed on the server since the partial file has been started
+        (MOCK_FILE[:1000], json.dumps({"ETag": '"v0"'})),
+        # a partial file longer than the file on the server
+        (MOCK_FILE + b"stale", json.dumps({"ETag": MOCK_ETAG})),
+        # a partial file of a previous version, which did not store validators
+        (b"stale", None),
+        # a partial file of a previous version, which stored the plain ETag
+        (MOCK_FILE[:1000] + b"stale", MOCK_ETAG),
+    ],
+)
+def test_download_restarts_stale_temp_file(tmp_path, partial, validator):
+    """Test that a temp file that does not match the file on the server is downloaded again instead of resumed"""
+    hegre = Hegre(transport=httpx.MockTransport(mock_range_handler))
+    (tmp_path / "movie.mp4.temp").write_bytes(partial)
+    if validator:
+        (tmp_path / "movie.mp4.temp.validator").write_text(validator)
+
+    hegre._download_with_retries(
+        "https://c.hegre.com/movie.mp4", tmp_path, "movie.mp4", max_attempts=1
+    )
+
+    assert (tmp_path / "movie.mp4").read_bytes() == MOCK_FILE
+
+
+def test_download_stores_validator_of_temp_file(tmp_path):
+    """Test that the ETag of a download is stored next to its temp file, so an interrupted download can be resumed"""
+    hegre = Hegre(
+        transport=httpx.MockTransport(
+            lambda _: httpx.Response(
+                200,
+                headers={"Content-Length": str(len(MOCK_FILE)), "ETag": MOCK_ETAG},
+                stream=ChunkedStream(MOCK_FILE[:-100]),
+            )
+        )
+    )
+
+    with pytest.raises(httpx.StreamError):
+        hegre._download_with_retries(
+            "https://c.hegre.com/movie.mp4", tmp_path, "movie.mp4", max_attempts=1
+        )
+
+    assert json.loads((tmp_path / "movie.mp4.temp.validator").read_text()) == {
+        "ETag": MOCK_ETAG
+    }
+
+
+def test_download_restarts_if_range_is_ignored(tmp_path):
+    """Test that a partial file is overwritten, if the server ignores the range request"""
+    hegre = Hegre(
+        transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, content=MOCK_FILE)
+        )
+    )
+    (tmp_path / "movie.mp4.temp").write_bytes(b"partial")
+
+    hegre._download_with_retries("https://c.hegre.com/movie.mp4", tmp_path, "movie.mp4")
+
+    assert (tmp_path / "movie.mp4").read_bytes() == MOCK_FILE
+
+
+@pytest.mark.parametrize(
+    "content_range,expected",
+    [
+        ("bytes 100-199/200", (100, 199, 200)),
+        ("bytes 100-199/*", (100, 199, None)),
+        ("bytes */200", (None, None, 200)),
+        ("invalid", (None, None, None)),
+    ],
+)
+def test_parse_content_range(content_range, expected):
+    """Test parsing of Content-Range headers"""
+    assert parse_content_range(content_range) == expected
+
+
+def test_segmented_download(monkeypatch, tmp_path):
+    """Test that a file downloaded in segments over parallel connections is assembled correctly"""
+    requested_ranges = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested_ranges.append(request.headers.get("Range"))
+        return mock_range_handler(request)
+
+    monkeypatch.setattr(hegre_module, "MIN_SEGMENT_SIZE", 1024)
+    hegre = Hegre(transport=httpx.MockTransport(handler))
+
+    hegre._download_with_retries(
+        "https://c.hegre.com/movie.mp4", tmp_path, "movie.mp4", segments=3
+    )
+
+    assert (tmp_path / "movie.mp4").read_bytes() == MOCK_FILE
+    assert sorted(requested_ranges[1:]) == [
+        "bytes=0-5461",
+        "bytes=10924-16383",
+        "bytes=5462-10923",
+    ]
+
+
+def test_segmented_download_resumes_missing_segments(monkeypatch, tmp_path):
+    """Test that a failed segment keeps the completed segments and only the missing one is downloaded again"""
+    requested_ranges = []
+    failing_range = "bytes=5462-10923"
+    failures = [httpx.Response(503)]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested_ranges.append(request.headers.get("Range"))
+        if request.headers.get("Range") == failing_range and failures:
+            # fails after the other segments have completed
+            time.sleep(0.2)
+            return failures.pop()
+        return mock_range_handler(request)
+
+    monkeypatch.setattr(hegre_module, "MIN_SEGMENT_SIZE", 1024)
+    hegre = Hegre(transport=httpx.MockTransport(handler))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        hegre._download_with_retries(
+            "https://c.hegre.com/movie.mp4",
+            tmp_path,
+            "movie.mp4",
+            max_attempts=1,
+            segments=3,
+        )
+
+    segment_map = json.loads((tmp_path / "movie.mp4.temp.part.segments").read_text())
+    assert [done for _, _, done in segment_map["segments"]] == [True, False, True]
+    requested_ranges.clear()
+
+    hegre._download_with_retries(
+        "https://c.hegre.com/movie.mp4", tmp_path, "movie.mp4", segments=3
+    )
+
+    assert (tmp_path / "movie.mp4").read_bytes() == MOCK_FILE
+    assert requested_ranges == ["bytes=0-0", failing_range]
+    assert not (tmp_path / "movie.mp4.temp.part.segments").exists()
+
+
+def test_segmented_download_restarts_changed_file(monkeypatch, tmp_path):
+    """Test that the completed segments of a file that has changed on the server are downloaded again"""
+    monkeypatch.setattr(hegre_module, "MIN_SEGMENT_SIZE", 1024)
+    (tmp_path / "movie.mp4.temp.part").write_bytes(bytes(len(MOCK_FILE)))
+    (tmp_path / "movie.mp4.temp.part.segments").write_text(
+        json.dumps(
+            {
+                "length": len(MOCK_FILE),
+                "validator": '"v0"',
+                "segments": [[0, 8191, True], [8192, len(MOCK_FILE) - 1, False]],
+            }
+        )
+    )
+    hegre = Hegre(transport=httpx.MockTransport(mock_range_handler))
+
+    hegre._download_with_retries(
+        "https://c.hegre.com/movie.mp4", tmp_path, "movie.mp4", segments=3
+    )
+
+    assert (tmp_path / "movie.mp4").read_bytes() == MOCK_FILE
+
+
+@pytest.mark.parametrize("partial_size,segments", [(0, 1), (1000, 1), (0, 3)])
+def test_download_computes_checksum(monkeypatch, tmp_path, partial_size, segments):
+    """Test that the checksum covers the whole file, also if it was resumed or downloaded in segments"""
+    monkeypatch.setattr(hegre_module, "MIN_SEGMENT_SIZE", 1024)
+    hegre = Hegre(transport=httpx.MockTransport(mock_range_handler))
+    if partial_size:
+        (tmp_path / "movie.mp4.temp").write_bytes(MOCK_FILE[:partial_size])
+        (tmp_path / "movie.mp4.temp.validator").write_text(
+            json.dumps({"ETag": MOCK_ETAG})
+        )
+
+    checksum = hegre._download_with_retries(
+        "https://c.hegre.com/movie.mp4",
+        tmp_path,
+        "movie.mp4",
+        segments=segments,
+        checksum=True,
+    )
+
+    assert checksum == hashlib.sha256(MOCK_FILE).hexdigest()
+
+
+def test_download_detects_truncated_body(tmp_path):
+    """Test that a body shorter than its Content-Length fails the download instead of being accepted"""
+    hegre = Hegre(
+        transport=httpx.MockTransport(
+            lambda _: httpx.Response(
+                200,
+                headers={"Content-Length": str(len(MOCK_FILE))},
+                stream=ChunkedStream(MOCK_FILE[:-100]),
+            )
+        )
+    )
+
+    with pytest.raises(httpx.StreamError):
+        hegre._download_with_retries(
+            "https://c.hegre.com/movie.mp4", tmp_path, "movie.mp4", max_attempts=1
+        )
+
+    assert not (tmp_path / "movie.mp4").exists()
+
+
+def test_parse_listing_page_extracts_codes():
+    """Test that the codes of listing items are extracted from their data-id, if available"""
+    listing_page = """
+        <div id="films-listing">
+            <div class="item" data-id="1234"><a href="/films/film-a">A</a></div>
+            <div class="item"><a href="/films/film-b" data-id="5678">B</a></div>
+            <div class="item"><a href="/films/film-c">C</a></div>
+            <div class="item">
+                <a href="/films/film-d">D</a>
+                <a href="/models/model" data-id="42">Model</a>
+                <span class="favorite" data-id="43"></span>
+            </div>
+        </div>
+    """
+
+    items = parse_listing_page(listing_page, "#films-listing .item")
+
+    assert items == {
+        "https://www.hegre.com/films/film-a": 1234,
+        "https://www.hegre.com/films/film-b": 5678,
+        "https://www.hegre.com/films/film-c": None,
+        "https://www.hegre.com/films/film-d": None,
+    }
+
+
+def test_get_archive_id_from_listing():
+    """Test that the archive ID of a listing item is known without fetching its page"""
+    listing_page = """
+        <div id="galleries-listing">
+            <div class="item" data-id="1234"><a href="/photos/gallery-a">A</a></div>
+            <div class="item"><a href="/photos/gallery-b">B</a></div>
+        </div>
+    """
+    hegre = Hegre(
+        transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, text=listing_page)
+        )
+    )
+
+    hegre._get_listing_page_urls(
+        "https://www.hegre.com/photos?galleries_page=1", "#galleries-listing .item"
+    )
+
+    assert (
+        hegre.get_archive_id("https://www.hegre.com/photos/gallery-a") == "photos 1234"
+    )
+    assert hegre.get_archive_id("https://www.hegre.com/photos/gallery-b") is None
+    assert not hegre._listing_codes
+
+
+def test_get_movie_urls_stops_at_mark(monkeypatch):
+    """Test that an incremental run stops paging once it reaches an item of the previous run"""
+    hegre = Hegre()
+    fetched_pages = []
+
+    def mock_tracking_listing_page_urls(url: str, selector: str) -> list[str] | None:
+        fetched_pages.append(url)
+        return mock_listing_page_urls(url, selector)
+
+    monkeypatch.setattr(
+        hegre, "_get_listing_page_urls", mock_tracking_listing_page_urls
+    )
+
+    urls = hegre.get_movie_urls(
+        TOTAL,
+        SortOption.MOST_RECENT,
+        workers=4,
+        stop_at={
+            "https://www.hegre.com/films/film-4",
+            "https://www.hegre.com/films/film-5",
+        },
+    )
+
+    assert urls == [f"https://www.hegre.com/films/film-{i}" for i in range(4)]
+    assert len(fetched_pages) == 2
+
+
+def test_select_parser_falls_back():
+    """Test that an unavailable parser backend falls back to an installed one"""
+    assert select_parser("html.parser") == "html.parser"
+    assert select_parser("not-installed") in PARSERS
+
+
+def test_download_asset_retries_and_keeps_existing_files(tmp_path):
+    """Test that assets are retried like the main file and existing assets are not downloaded again"""
+    responses = [httpx.Response(503), httpx.Response(200, content=MOCK_FILE)]
+    hegre = Hegre(
+        transport=httpx.MockTransport(lambda _: responses.pop(0)),
+        retry_policy=RetryPolicy(backoff=0),
+    )
+    configuration = Configuration([], tmp_path, 2, 1, SortOption.MOST_RECENT)
+
+    with Progress(disable=True) as progress:
+        for _ in range(2):
+            hegre.download_asset(
+                "https://c.hegre.com/thumb.jpg",
+                str(tmp_path / "thumb.jpg"),
+                configuration,
+                progress,
+            )
+
+    assert (tmp_path / "thumb.jpg").read_bytes() == MOCK_FILE
+    assert not responses
+
+
+class ChunkedStream(httpx.SyncByteStream):
+    """Response body that is streamed in several chunks, like a body received over the network"""
+
+    def __init__(self, content: bytes) -> None:
+        self.content = content
+
+    def __iter__(self):
+        for i in range(0, len(self.content), 1000):
+            yield self.content[i : i + 1000]
+
+
+@pytest.mark.parametrize("encoding", [None, "gzip"])
+def test_download_streams_raw_or_decoded_body(tmp_path, encoding):
+    """Test that unencoded bodies are written as they are and encoded bodies are decoded"""
+    body = gzip.compress(MOCK_FILE) if encoding else MOCK_FILE
+    headers = {"Content-Length": str(len(body))}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    hegre = Hegre(
+        transport=httpx.MockTransport(
+            lambda _: httpx.Response(200, headers=headers, stream=ChunkedStream(body))
+        )
+    )
+
+    hegre._download_file("https://c.hegre.com/movie.mp4", tmp_path / "movie.mp4")
+
+    assert (tmp_path / "movie.mp4").read_bytes() == MOCK_FILE
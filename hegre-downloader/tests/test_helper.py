@@ -1,4 +1,11 @@
-from helper import duration_to_seconds, convert_size
+from helper import (
+    duration_to_seconds,
+    convert_size,
+    parse_size,
+    hash_file,
+    HASH_BUFFER_SIZE,
+)
+import hashlib
 import pytest
 
 
@@ -72,3 +79,29 @@ def test_convert_size():
     assert convert_size(mbytes) == expected_mb_string, "Byte to MiB"
     assert convert_size(gbytes) == expected_gb_string, "Byte to GiB"
     assert convert_size(tbytes) == expected_tb_string, "Byte to TiB"
+
+
+@pytest.mark.parametrize(
+    "size,expected_bytes",
+    [("42", 42), ("512K", 512 * 1024), ("1.5M", 1536 * 1024), ("2 GB", 2 * 1024**3)],
+)
+def test_parse_size(size, expected_bytes):
+    """Test conversion from a human readable size to byte"""
+    assert parse_size(size) == expected_bytes
+
+
+def test_parse_size_invalid_str():
+    """Test size conversion failure for an invalid input string"""
+    with pytest.raises(ValueError):
+        parse_size("fast")
+
+
+@pytest.mark.parametrize("size", [None, 0, 10, HASH_BUFFER_SIZE + 10])
+def test_hash_file(tmp_path, size):
+    """Test hashing a whole file or its first bytes, also across several reads into the buffer"""
+    content = bytes(range(256)) * (HASH_BUFFER_SIZE // 128)
+    (tmp_path / "movie.mp4").write_bytes(content)
+
+    digest = hash_file(tmp_path / "movie.mp4", size=size)
+
+    assert digest.hexdigest() == hashlib.sha256(content[:size]).hexdigest()
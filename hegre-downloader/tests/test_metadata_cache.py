@@ -0,0 +1,165 @@
+from metadata_cache import MetadataCache
+from hegre import Hegre
+from configuration import Configuration
+from sort_option import SortOption
+from model.movie import HegreMovie
+from model.gallery import HegreGallery
+from model.model import HegreModel
+from model.object_type import ObjectType
+from datetime import date
+
+import httpx
+
+ASSET_URL = "https://c.hegre.com/thumb.jpg?token=a"
+MOVIE_URL = "https://www.hegre.com/films/title-of-the-film"
+
+
+def create_movie() -> HegreMovie:
+    movie = HegreMovie(MOVIE_URL)
+    movie.type = ObjectType.FILM
+    movie.title = "Title of the film"
+    movie.code = 1234
+    movie.date = date(2023, 11, 24)
+    movie.duration = 1337
+    movie.tags = ["Massage", "Outdoor"]
+    movie.models = [HegreModel("Model", "https://www.hegre.com/models/model")]
+    movie.downloads = {2160: "https://c.hegre.com/film-2160p.mp4"}
+    movie.subtitles = {"english": "https://c.hegre.com/film-en.srt"}
+    movie.trailers = {1080: "https://p.hegre.com/film-trailer-1080p.mp4"}
+
+    return movie
+
+
+def test_movie_round_trip(tmp_path):
+    """Test that a cached movie is restored with all of its fields"""
+    cache = MetadataCache(tmp_path / "cache.sqlite")
+    movie = create_movie()
+
+    cache.put(movie, etag='"abc"')
+    cached = cache.get(MOVIE_URL)
+
+    assert isinstance(cached.hegre_object, HegreMovie)
+    assert cached.hegre_object.to_json() == movie.to_json()
+    assert cached.hegre_object.get_highest_res_download_url() == (
+        2160,
+        "https://c.hegre.com/film-2160p.mp4",
+    )
+    assert cached.validators() == {"If-None-Match": '"abc"'}
+
+
+def test_gallery_round_trip(tmp_path):
+    """Test that a cached gallery is restored as gallery"""
+    cache = MetadataCache(tmp_path / "cache.sqlite")
+    gallery = HegreGallery("https://www.hegre.com/photos/title-of-the-gallery")
+    gallery.code = 4321
+    gallery.downloads = {12000: "https://c.hegre.com/gallery-12000px.zip"}
+
+    cache.put(gallery)
+    cached = cache.get(gallery.url)
+
+    assert isinstance(cached.hegre_object, HegreGallery)
+    assert cached.hegre_object.to_json() == gallery.to_json()
+
+
+def test_stale_object_is_revalidated(tmp_path):
+    """Test that a stale object is revalidated with a conditional request instead of being parsed again"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(304)
+
+    cache = MetadataCache(tmp_path / "cache.sqlite", ttl=0)
+    cache.put(create_movie(), etag='"abc"')
+    hegre = Hegre(transport=httpx.MockTransport(handler), metadata_cache=cache)
+    hegre._session.cookies.set("login", "1")
+
+    movie = hegre.get_movie_from_url(MOVIE_URL)
+
+    assert movie.code == 1234
+    assert requests[0].headers["If-None-Match"] == '"abc"'
+
+
+def test_fresh_object_is_not_fetched(tmp_path):
+    """Test that a fresh object is returned without a request"""
+    cache = MetadataCache(tmp_path / "cache.sqlite")
+    cache.put(create_movie())
+    hegre = Hegre(
+        transport=httpx.MockTransport(lambda request: httpx.Response(500)),
+        metadata_cache=cache,
+    )
+    hegre._session.cookies.set("login", "1")
+
+    assert hegre.get_movie_from_url(MOVIE_URL).code == 1234
+
+
+def test_unchanged_asset_is_not_downloaded_again(tmp_path):
+    """Test that an existing asset is revalidated by the modification time of the file and kept on HTTP 304"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(304)
+
+    (tmp_path / "thumb.jpg").write_bytes(b"old")
+    hegre = Hegre(transport=httpx.MockTransport(handler))
+    configuration = Configuration(
+        [], tmp_path, 0, 1, SortOption.MOST_RECENT, refresh_assets=True
+    )
+
+    hegre.download_asset(ASSET_URL, str(tmp_path / "thumb.jpg"), configuration)
+
+    assert (tmp_path / "thumb.jpg").read_bytes() == b"old"
+    assert "If-Modified-Since" in requests[0].headers
+    assert not (tmp_path / "thumb.jpg.temp").exists()
+
+
+def test_changed_asset_is_replaced_and_its_validators_are_stored(tmp_path):
+    """Test that a changed asset is replaced and revalidated with its ETag the next time"""
+    responses = [
+        httpx.Response(200, content=b"new", headers={"ETag": '"v2"'}),
+        httpx.Response(304),
+    ]
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return responses.pop(0)
+
+    (tmp_path / "thumb.jpg").write_bytes(b"old")
+    cache = MetadataCache(tmp_path / "cache.sqlite")
+    hegre = Hegre(transport=httpx.MockTransport(handler), metadata_cache=cache)
+
+    assert hegre._refresh_asset(ASSET_URL, str(tmp_path / "thumb.jpg"))
+    assert not hegre._refresh_asset(ASSET_URL, str(tmp_path / "thumb.jpg"))
+
+    assert (tmp_path / "thumb.jpg").read_bytes() == b"new"
+    assert requests[1].headers["If-None-Match"] == '"v2"'
+
+
+def test_first_asset_download_stores_its_validators(tmp_path):
+    """Test that the validators of a newly downloaded asset are stored, so its first refresh is conditional on them"""
+    cache = MetadataCache(tmp_path / "cache.sqlite")
+    hegre = Hegre(
+        transport=httpx.MockTransport(
+            lambda _: httpx.Response(
+                200,
+                content=b"new",
+                headers={
+                    "ETag": '"v1"',
+                    "Last-Modified": "Fri, 24 Nov 2023 00:00:00 GMT",
+                },
+            )
+        ),
+        metadata_cache=cache,
+    )
+    configuration = Configuration([], tmp_path, 0, 1, SortOption.MOST_RECENT)
+
+    hegre.download_asset(ASSET_URL, str(tmp_path / "thumb.jpg"), configuration)
+
+    assert (tmp_path / "thumb.jpg").read_bytes() == b"new"
+    assert cache.get_asset_validators(str(tmp_path / "thumb.jpg")) == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Fri, 24 Nov 2023 00:00:00 GMT",
+    }
+    assert not (tmp_path / "thumb.jpg.temp.validator").exists()
@@ -0,0 +1,113 @@
+import json
+
+from pathlib import Path
+
+from benchmarks.mock_server import MockSettings, LocalTransport, start_server
+from hegre import Hegre, generate_filename, get_destination_folder
+from sort_option import SortOption
+from configuration import Configuration
+from metadata_cache import MetadataCache
+from metadata_refresh import (
+    refresh_metadata,
+    refresh_metadata_file,
+    CREATED,
+    UPDATED,
+    UNCHANGED,
+    NOT_DOWNLOADED,
+)
+
+import pytest
+
+
+@pytest.fixture
+def hegre():
+    """Client that is logged in to a mock server with 3 movies and galleries"""
+    server = start_server(MockSettings(3, media_size=4096))
+    hegre = Hegre(http2=False, transport=LocalTransport(server.server_address[1]))
+    hegre.login("user", "password")
+
+    yield hegre
+
+    server.shutdown()
+
+
+def get_files(hegre_object, configuration) -> tuple:
+    """Returns the paths of the media file and the metadata file of an object"""
+    folder = Path(get_destination_folder(hegre_object, configuration))
+    _, url = hegre_object.get_highest_res_download_url()
+    filename, metadata_filename = generate_filename(url, hegre_object)
+
+    return folder / filename, folder / metadata_filename
+
+
+def test_only_changed_metadata_files_are_rewritten(hegre, tmp_path):
+    """Test that metadata files are created for downloaded movies, rewritten on changes and otherwise kept"""
+    configuration = Configuration([], tmp_path, 0, 1, SortOption.MOST_RECENT)
+    urls = hegre.resolve_urls("https://www.hegre.com/movies")
+    media_file, metadata_file = get_files(
+        hegre.get_movie_from_url(urls[0]), configuration
+    )
+    media_file.write_bytes(b"movie")
+
+    statuses = [
+        result.status for result in refresh_metadata(hegre, urls, configuration)
+    ]
+    assert statuses == [CREATED, NOT_DOWNLOADED, NOT_DOWNLOADED]
+    assert refresh_metadata(hegre, urls[:1], configuration)[0].status == UNCHANGED
+
+    metadata = json.loads(metadata_file.read_text())
+    metadata["tags"] = ["outdated"]
+    metadata["file"] = {"name": media_file.name, "size": 5, "sha256": "abc"}
+    metadata_file.write_text(json.dumps(metadata))
+
+    assert refresh_metadata(hegre, urls[:1], configuration)[0].status == UPDATED
+    metadata = json.loads(metadata_file.read_text())
+    assert metadata["tags"] != ["outdated"]
+    assert metadata["file"]["sha256"] == "abc"
+
+
+def test_refresh_does_not_create_folders(hegre, tmp_path):
+    """Test that movies that have not been downloaded leave no trace in the destination folder"""
+    configuration = Configuration(
+        [], tmp_path / "library", 0, 1, SortOption.MOST_RECENT
+    )
+    movie = hegre.get_movie_from_url("https://www.hegre.com/films/film-0")
+
+    assert refresh_metadata_file(movie, configuration) == NOT_DOWNLOADED
+    assert not (tmp_path / "library").exists()
+
+
+def test_refresh_finds_files_of_other_resolution(hegre, tmp_path):
+    """Test that a movie downloaded in another resolution than the configured one is refreshed in place"""
+    configuration = Configuration([], tmp_path, 1080, 1, SortOption.MOST_RECENT)
+    movie = hegre.get_movie_from_url("https://www.hegre.com/films/film-0")
+    media_file, metadata_file = get_files(movie, configuration)
+    media_file.write_bytes(b"movie")
+
+    assert refresh_metadata_file(movie, configuration) == CREATED
+    assert refresh_metadata_file(movie, configuration) == UNCHANGED
+    assert [path.name for path in media_file.parent.glob("*.json")] == [
+        metadata_file.name
+    ]
+
+
+def test_refresh_revalidates_cached_objects(tmp_path):
+    """Test that a refresh fetches the pages of objects that are still fresh in the metadata cache"""
+    server = start_server(MockSettings(1, media_size=4096))
+    cache = MetadataCache(tmp_path / "cache.sqlite")
+    hegre = Hegre(
+        http2=False,
+        transport=LocalTransport(server.server_address[1]),
+        metadata_cache=cache,
+    )
+    hegre.login("user", "password")
+    url = "https://www.hegre.com/films/film-0"
+    outdated = hegre.get_movie_from_url(url)
+    outdated.tags = ["Outdated"]
+    cache.put(outdated)
+
+    try:
+        assert hegre.get_movie_from_url(url).tags == ["Outdated"]
+        assert hegre.get_movie_from_url(url, revalidate=True).tags != ["Outdated"]
+    finally:
+        server.shutdown()
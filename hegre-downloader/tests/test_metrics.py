@@ -0,0 +1,80 @@
+from hegre import Hegre
+from metrics import Metrics, MetricsExporter
+from sort_option import SortOption
+from configuration import Configuration
+from retry import RetryPolicy
+from rich.progress import Progress
+
+import httpx
+import pytest
+
+MOCK_FILE = bytes(range(256)) * 64
+
+
+def test_prometheus_histogram_is_cumulative():
+    """Test that the buckets of a stage are rendered cumulatively, with +Inf equal to the count"""
+    metrics = Metrics()
+    for seconds in (0.001, 0.02, 0.02, 1000.0):
+        metrics.observe("page_parse", seconds)
+    metrics.add_item("completed")
+
+    lines = metrics.to_prometheus().splitlines()
+
+    assert (
+        'hegre_stage_duration_seconds_bucket{stage="page_parse",le="0.005"} 1' in lines
+    )
+    assert (
+        'hegre_stage_duration_seconds_bucket{stage="page_parse",le="0.05"} 3' in lines
+    )
+    assert 'hegre_stage_duration_seconds_bucket{stage="page_parse",le="600"} 3' in lines
+    assert (
+        'hegre_stage_duration_seconds_bucket{stage="page_parse",le="+Inf"} 4' in lines
+    )
+    assert 'hegre_stage_duration_seconds_count{stage="page_parse"} 4' in lines
+    assert 'hegre_items_total{result="completed"} 1' in lines
+
+
+def test_stage_counts_errors():
+    """Test that a stage which raises is timed and counted as an error"""
+    metrics = Metrics()
+
+    with pytest.raises(ValueError):
+        with metrics.stage("page_parse"):
+            raise ValueError()
+
+    assert 'hegre_stage_errors_total{stage="page_parse"} 1' in metrics.to_prometheus()
+    assert 'hegre_stage_duration_seconds_count{stage="page_parse"} 1' in (
+        metrics.to_prometheus()
+    )
+
+
+def test_download_records_stages_and_status_codes(tmp_path):
+    """Test that a download with a failed attempt records retries, bytes and the status codes by host"""
+    responses = [httpx.Response(503), httpx.Response(200, content=MOCK_FILE)]
+    metrics = Metrics()
+    hegre = Hegre(
+        transport=httpx.MockTransport(lambda _: responses.pop(0)),
+        metrics=metrics,
+        retry_policy=RetryPolicy(backoff=0),
+    )
+    configuration = Configuration([], tmp_path, 2, 1, SortOption.MOST_RECENT)
+
+    with Progress(disable=True) as progress:
+        hegre.download_asset(
+            "https://c.hegre.com/thumb.jpg",
+            str(tmp_path / "thumb.jpg"),
+            configuration,
+            progress,
+        )
+
+    exporter = MetricsExporter(metrics, str(tmp_path / "hegre.prom"))
+    exporter.stop()
+    lines = (tmp_path / "hegre.prom").read_text().splitlines()
+
+    assert 'hegre_stage_retries_total{stage="asset_transfer"} 1' in lines
+    assert (
+        f'hegre_stage_bytes_total{{stage="asset_transfer"}} {len(MOCK_FILE)}' in lines
+    )
+    assert 'hegre_http_responses_total{host="c.hegre.com",status="200"} 1' in lines
+    assert 'hegre_http_responses_total{host="c.hegre.com",status="503"} 1' in lines
+    assert 'hegre_stage_duration_seconds_count{stage="first_byte"} 2' in lines
@@ -0,0 +1,74 @@
+from benchmarks.mock_server import (
+    MockSettings,
+    LocalTransport,
+    start_server,
+    ITEMS_PER_PAGE,
+)
+from hegre import Hegre
+from retry import RetryPolicy
+from model.object_type import ObjectType
+
+import pytest
+
+ITEMS = ITEMS_PER_PAGE + 5
+
+
+@pytest.fixture
+def hegre():
+    """Client that is logged in to a mock server with ITEMS movies and galleries of 4 KiB"""
+    server = start_server(MockSettings(ITEMS, media_size=4096))
+    hegre = Hegre(http2=False, transport=LocalTransport(server.server_address[1]))
+    hegre.login("user", "password")
+
+    yield hegre
+
+    server.shutdown()
+
+
+def test_mock_server_serves_parseable_catalog(hegre):
+    """Test that the listings and pages of the mock server are parsed like the real ones, so benchmarks measure real work"""
+    movie_urls = hegre.resolve_urls("https://www.hegre.com/movies", workers=2)
+    gallery_urls = hegre.resolve_urls("https://www.hegre.com/photos")
+
+    assert len(movie_urls) == len(gallery_urls) == ITEMS
+
+    film = hegre.get_movie_from_url(movie_urls[0])
+    sexed = hegre.get_movie_from_url(movie_urls[9])
+    gallery = hegre.get_gallery_from_url(gallery_urls[0])
+
+    assert (film.type, sorted(film.downloads)) == (ObjectType.FILM, [1080, 2160])
+    assert (sexed.type, sorted(sexed.downloads)) == (ObjectType.SEXED, [1080])
+    assert sorted(gallery.downloads) == [3000, 6000]
+    assert hegre.get_archive_id(movie_urls[0]) == film.archive_id()
+
+
+def test_mock_server_serves_media_with_ranges(hegre, tmp_path):
+    """Test that media bodies are served in full and in segments"""
+    film = hegre.get_movie_from_url("https://www.hegre.com/films/film-0")
+    _, url = film.get_highest_res_download_url()
+
+    hegre._download_with_retries(url, tmp_path, "movie.mp4")
+    hegre._download_with_retries(url, tmp_path, "segmented.mp4", segments=2)
+
+    assert (tmp_path / "movie.mp4").stat().st_size == 4096
+    assert (tmp_path / "segmented.mp4").read_bytes() == (
+        tmp_path / "movie.mp4"
+    ).read_bytes()
+
+
+def test_crawl_retries_page_faults():
+    """Test that a crawl against a server failing some of its page requests still resolves every item"""
+    server = start_server(MockSettings(ITEMS, media_size=4096, page_fault_rate=0.3))
+    hegre = Hegre(
+        http2=False,
+        transport=LocalTransport(server.server_address[1]),
+        retry_policy=RetryPolicy(max_attempts=10, backoff=0),
+    )
+    hegre.login("user", "password")
+
+    urls = hegre.resolve_urls("https://www.hegre.com/movies", workers=2)
+    movies = [hegre.get_movie_from_url(url) for url in urls]
+    server.shutdown()
+
+    assert [movie.url for movie in movies] == urls
+    assert len(urls) == ITEMS
@@ -0,0 +1,152 @@
+import threading
+
+from pipeline import DownloadPipeline, PipelineItem
+
+import pytest
+
+URLS = [f"https://www.hegre.com/films/film-{i}" for i in range(10)]
+
+
+class Recorder:
+    """Records the items passing through the stages of a pipeline"""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.fetched = []
+        self.media = []
+        self.assets = []
+        self.completed = []
+        self.errors = []
+
+    def record(self, stage: list, item: PipelineItem) -> None:
+        with self.lock:
+            stage.append(item.url)
+
+    def pipeline(self, **kwargs) -> DownloadPipeline:
+        def fetch(item):
+            self.record(self.fetched, item)
+            return item.url
+
+        stages = {
+            "fetch": fetch,
+            "download_media": lambda item: self.record(self.media, item),
+            "list_assets": lambda item: [
+                (f"{item.url}.jpg", "thumb.jpg"),
+                (f"{item.url}.srt", "subtitles.srt"),
+            ],
+            "download_asset": lambda item, asset: self.record(self.assets, item),
+            "on_complete": lambda item: self.record(self.completed, item),
+            "on_error": lambda item, e: self.record(self.errors, item),
+        }
+        stages.update(kwargs)
+
+        return DownloadPipeline(**stages)
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_all_items_pass_all_stages(workers):
+    """Test that every URL is fetched, downloaded and completed exactly once"""
+    recorder = Recorder()
+    pipeline = recorder.pipeline(
+        metadata_workers=workers, media_workers=workers, asset_workers=workers
+    )
+
+    assert pipeline.run(iter(URLS))
+    assert sorted(recorder.completed) == sorted(URLS)
+    assert sorted(recorder.assets) == sorted(URLS * 2)
+
+
+def test_skipped_items_do_not_reach_later_stages():
+    """Test that items without an object are not downloaded"""
+    recorder = Recorder()
+    pipeline = recorder.pipeline(
+        fetch=lambda item: None if item.count % 2 else item.url
+    )
+
+    assert pipeline.run(URLS)
+    assert recorder.media == URLS[::2]
+    assert sorted(recorder.completed) == sorted(URLS[::2])
+
+
+def test_errors_are_reported_and_do_not_stop_other_items():
+    """Test that a failing item is reported and the remaining items are downloaded"""
+    recorder = Recorder()
+
+    def download_media(item):
+        if item.count == 3:
+            raise ValueError("broken file")
+
+    pipeline = recorder.pipeline(download_media=download_media)
+
+    assert not pipeline.run(URLS)
+    assert recorder.errors == [URLS[3]]
+    assert len(recorder.completed) == len(URLS) - 1
+
+
+def test_failed_asset_fails_item_once():
+    """Test that an item with failing assets is reported once and not completed"""
+    recorder = Recorder()
+
+    def download_asset(item, asset):
+        if item.count == 3:
+            raise ValueError("broken asset")
+
+    pipeline = recorder.pipeline(download_asset=download_asset)
+
+    assert not pipeline.run(URLS)
+    assert recorder.errors == [URLS[3]]
+    assert URLS[3] not in recorder.completed
+
+
+def test_assets_are_downloaded_alongside_media():
+    """Test that the assets of an item are downloaded while its file is still downloading"""
+    recorder = Recorder()
+    asset_started = threading.Event()
+
+    def download_media(item):
+        assert asset_started.wait(5)
+
+    pipeline = recorder.pipeline(
+        download_media=download_media,
+        download_asset=lambda item, asset: asset_started.set(),
+    )
+
+    assert pipeline.run(URLS[:1])
+    assert recorder.completed == URLS[:1]
+
+
+def test_metadata_stage_is_bounded_by_queue():
+    """Test that pages are not fetched arbitrarily far ahead of a blocked media stage"""
+    recorder = Recorder()
+    release = threading.Event()
+
+    pipeline = recorder.pipeline(
+        download_media=lambda item: release.wait(5), queue_size=1
+    )
+    thread = threading.Thread(target=pipeline.run, args=(iter(URLS),))
+    thread.start()
+
+    # one item in the media stage, one in the queue and one waiting for the queue
+    threading.Event().wait(0.2)
+    assert len(recorder.fetched) <= 3
+
+    release.set()
+    thread.join(5)
+    assert len(recorder.completed) == len(URLS)
+
+
+def test_assets_do_not_hold_up_media():
+    """Test that the next file is downloaded while the assets of the previous one are still downloading"""
+    recorder = Recorder()
+    release = threading.Event()
+
+    pipeline = recorder.pipeline(download_asset=lambda item, asset: release.wait(5))
+    thread = threading.Thread(target=pipeline.run, args=(URLS[:2],))
+    thread.start()
+
+    threading.Event().wait(0.2)
+    assert recorder.media == URLS[:2]
+
+    release.set()
+    thread.join(5)
+    assert sorted(recorder.completed) == URLS[:2]
@@ -0,0 +1,70 @@
+import io
+import json
+import threading
+
+from rich.console import Console
+from rich.progress import Progress
+
+from progress_reporter import ProgressReporter
+
+THREADS = 8
+ADVANCES = 10000
+
+
+def test_concurrent_advances_are_not_lost():
+    """Test that advances of the same task from several threads add up"""
+    reporter = ProgressReporter()
+    task_id = reporter.add_task("movie.mp4", total=THREADS * ADVANCES)
+
+    def advance():
+        for _ in range(ADVANCES):
+            reporter.update(task_id, advance=1)
+
+    threads = [threading.Thread(target=advance) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert reporter._tasks[task_id].completed == THREADS * ADVANCES
+
+
+def test_renders_samples_to_progress_bars():
+    """Test that the progress bars show the sampled state once the reporter stops"""
+    progress = Progress(auto_refresh=False, console=Console(file=io.StringIO()))
+
+    with ProgressReporter(progress) as reporter:
+        task_id = reporter.add_task("movie.mp4", start=False)
+        reporter.update(task_id, total=100, completed=20)
+        reporter.start_task(task_id)
+        reporter.update(task_id, advance=30)
+
+    (task,) = progress.tasks
+    assert task.completed == 50
+    assert task.total == 100
+    assert task.started
+
+
+def test_writes_json_lines_in_headless_mode():
+    """Test that the headless mode writes the active tasks as JSON lines without markup"""
+    json_file = io.StringIO()
+    reporter = ProgressReporter(json_file=json_file)
+    finished = reporter.add_task("thumb.jpg", total=10)
+    reporter.update(finished, advance=10)
+    active = reporter.add_task("[ 1 /  2] movie.mp4", total=100)
+    reporter.update(active, advance=40)
+    failed = reporter.add_task("[red strike]trailer.mp4[/]", total=100)
+    reporter.stop_task(failed)
+
+    reporter.render()
+    reporter.update(active, advance=10)
+    reporter.render()
+
+    first, second = [json.loads(line) for line in json_file.getvalue().splitlines()]
+    assert first["completed"] == 50
+    assert first["finished_tasks"] == 2
+    assert first["tasks"] == [
+        {"description": "[ 1 /  2] movie.mp4", "completed": 40, "total": 100}
+    ]
+    assert second["completed"] == 60
+    assert second["rate"] > 0
@@ -0,0 +1,105 @@
+from datetime import datetime, time
+
+from hegre import Hegre
+from rate_limiter import BandwidthLimiter, TokenBucket, parse_schedule
+
+import rate_limiter
+import httpx
+import pytest
+
+RATE = 1000
+
+
+class FakeClock:
+    """Monotonic clock that only advances when told to"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_allows_burst_then_delays():
+    """Test that a full bucket allows one burst without delay and delays everything beyond it"""
+    bucket = TokenBucket(RATE, clock=FakeClock())
+
+    assert bucket.reserve(RATE) == 0
+    assert bucket.reserve(RATE // 2) == pytest.approx(0.5)
+
+
+def test_token_bucket_serves_reservations_in_order():
+    """Test that concurrent transfers wait for all earlier reservations, which shares the rate fairly"""
+    clock = FakeClock()
+    bucket = TokenBucket(RATE, burst=1, clock=clock)
+    bucket.reserve(1)
+
+    delays = [bucket.reserve(RATE // 4) for _ in range(4)]
+
+    assert delays == pytest.approx([0.25, 0.5, 0.75, 1.0])
+
+    clock.now = 1.0
+    assert bucket.reserve(RATE // 4) == pytest.approx(0.25)
+
+
+def test_token_bucket_without_rate_never_delays():
+    """Test that a rate of 0 means no limit"""
+    bucket = TokenBucket(0, clock=FakeClock())
+
+    assert bucket.reserve(10**9) == 0
+
+
+def test_parse_schedule_wraps_around_midnight():
+    """Test parsing a schedule with a window that wraps around midnight"""
+    limiter = BandwidthLimiter(
+        RATE, schedule=parse_schedule("09:00-18:00=1M, 22:00-06:00=0")
+    )
+
+    assert limiter.rate_at(time(12, 0)) == 1024**2
+    assert limiter.rate_at(time(23, 30)) == 0
+    assert limiter.rate_at(time(3, 0)) == 0
+    assert limiter.rate_at(time(20, 0)) == RATE
+
+
+def test_parse_schedule_invalid_window():
+    """Test schedule parsing failure for an invalid window"""
+    with pytest.raises(ValueError):
+        parse_schedule("daytime=1M")
+
+
+def test_bandwidth_limiter_applies_schedule():
+    """Test that the global rate follows the time of day"""
+    limiter = BandwidthLimiter(
+        RATE,
+        schedule=parse_schedule("00:00-12:00=0"),
+        clock=FakeClock(),
+        now=lambda: datetime(2023, 11, 24, 8, 0),
+    )
+
+    assert limiter.reserve(10 * RATE) == 0
+
+
+def test_bandwidth_limiter_caps_assets_separately():
+    """Test that the asset cap does not slow down media files"""
+    limiter = BandwidthLimiter(assets_rate=RATE, clock=FakeClock())
+
+    assert limiter.reserve(10 * RATE) == 0
+    assert limiter.reserve(2 * RATE, asset=True) == pytest.approx(1.0)
+
+
+def test_download_consumes_bandwidth(monkeypatch, tmp_path):
+    """Test that every downloaded chunk is taken from the limiter"""
+    content = bytes(64 * 1024)
+    delays = []
+    monkeypatch.setattr(rate_limiter.time, "sleep", delays.append)
+
+    limiter = BandwidthLimiter(len(content) // 2, clock=FakeClock())
+    hegre = Hegre(
+        transport=httpx.MockTransport(lambda _: httpx.Response(200, content=content)),
+        bandwidth_limiter=limiter,
+    )
+
+    hegre._download_file("https://c.hegre.com/movie.mp4", tmp_path / "movie.mp4")
+
+    assert (tmp_path / "movie.mp4").read_bytes() == content
+    assert delays[-1] == pytest.approx(1.0)
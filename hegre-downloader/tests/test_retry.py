@@ -0,0 +1,145 @@
+from hegre import Hegre
+from exceptions import CircuitOpenError
+from retry import RetryPolicy, CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+import httpx
+import pytest
+
+URL = "https://www.hegre.com/films/film-0"
+
+
+class FakeClock:
+    """Monotonic clock that only advances when told to"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def status_error(status: int, headers: dict[str, str] = {}) -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", URL)
+    response = httpx.Response(status, headers=headers, request=request)
+
+    return httpx.HTTPStatusError(str(status), request=request, response=response)
+
+
+@pytest.mark.parametrize(
+    "error, retryable",
+    [
+        (status_error(404), False),
+        (status_error(403), False),
+        (status_error(503), True),
+        (status_error(429), True),
+        (httpx.ConnectTimeout("timeout"), True),
+        (httpx.StreamError("truncated"), True),
+        (httpx.UnsupportedProtocol("ftp"), False),
+    ],
+)
+def test_fatal_errors_are_not_retried(error, retryable):
+    """Test that only temporary errors get a delay, errors like HTTP 404 are fatal"""
+    delay = RetryPolicy().get_delay(1, error)
+
+    assert (delay is not None) == retryable
+
+
+def test_backoff_grows_with_full_jitter_and_honors_retry_after():
+    """Test that delays are random up to an exponentially growing cap and Retry-After takes precedence"""
+    policy = RetryPolicy(backoff=1.0, max_backoff=4.0, seed=1)
+    error = status_error(503)
+
+    for attempt, cap in ((1, 1.0), (2, 2.0), (3, 4.0), (10, 4.0)):
+        delays = [policy.get_delay(attempt, error) for _ in range(50)]
+        assert all(0 <= delay <= cap for delay in delays)
+        assert max(delays) > cap / 2
+
+    assert policy.get_delay(1, status_error(429, {"Retry-After": "7"})) == 7.0
+
+
+def test_circuit_opens_and_lets_a_single_probe_through():
+    """Test that a host is suspended after consecutive failures and closed again by a successful probe"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+
+    breaker.record_failure("c.hegre.com")
+    breaker.check("c.hegre.com")
+    breaker.record_failure("c.hegre.com")
+    assert breaker.state("c.hegre.com") == OPEN
+    breaker.check("www.hegre.com")
+
+    with pytest.raises(CircuitOpenError) as e:
+        breaker.check("c.hegre.com")
+    assert e.value.retry_after == 30
+
+    clock.now += 30
+    breaker.check("c.hegre.com")
+    assert breaker.state("c.hegre.com") == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.check("c.hegre.com")
+
+    breaker.record_success("c.hegre.com")
+    assert breaker.state("c.hegre.com") == CLOSED
+
+
+def test_page_fetch_is_retried_after_delay():
+    """Test that a page fetch is retried after a throttled response and waits for its Retry-After"""
+    responses = [
+        httpx.Response(429, headers={"Retry-After": "2"}),
+        httpx.Response(503),
+        httpx.Response(200, text="<html></html>"),
+    ]
+    delays = []
+    hegre = Hegre(
+        transport=httpx.MockTransport(lambda _: responses.pop(0)),
+        retry_policy=RetryPolicy(backoff=0.5, seed=1, sleep=delays.append),
+    )
+
+    assert hegre._get(URL).status_code == 200
+    assert delays[0] == 2.0
+    assert 0 <= delays[1] <= 1.0
+
+
+def test_page_fetch_does_not_retry_not_found():
+    """Test that a missing page fails right away without counting against the host"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(404)
+
+    breaker = CircuitBreaker(failure_threshold=1)
+    hegre = Hegre(
+        transport=httpx.MockTransport(handler),
+        retry_policy=RetryPolicy(breaker=breaker, sleep=lambda _: None),
+    )
+
+    with pytest.raises(httpx.HTTPStatusError):
+        hegre._get(URL)
+
+    assert len(requests) == 1
+    assert breaker.state("www.hegre.com") == CLOSED
+
+
+def test_probe_is_released_after_unrelated_error(tmp_path):
+    """Test that a probe download failing with an error unrelated to the host does not keep the circuit half-open"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure("c.hegre.com")
+    clock.now += 30
+    hegre = Hegre(
+        transport=httpx.MockTransport(lambda _: httpx.Response(200, content=b"data")),
+        retry_policy=RetryPolicy(breaker=breaker, sleep=lambda _: None),
+    )
+
+    # the destination folder does not exist
+    with pytest.raises(OSError):
+        hegre._download_with_retries(
+            "https://c.hegre.com/movie.mp4",
+            tmp_path / "missing",
+            "movie.mp4",
+            max_attempts=1,
+        )
+
+    breaker.check("c.hegre.com")
+    assert breaker.state("c.hegre.com") == HALF_OPEN
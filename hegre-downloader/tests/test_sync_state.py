@@ -0,0 +1,29 @@
+from sync_state import SyncState, MARK_SIZE
+from sort_option import SortOption
+
+KEY = SyncState.key("https://www.hegre.com/movies/", SortOption.MOST_RECENT)
+
+
+def test_key():
+    """Test that the key of a listing does not depend on a trailing slash"""
+    assert KEY == SyncState.key("https://www.hegre.com/movies", "most_recent")
+
+
+def test_update_mark_persists_newest_urls(tmp_path):
+    """Test that the newest URLs are prepended to the mark and written to the state file"""
+    filename = tmp_path / "state.json"
+    state = SyncState(filename)
+
+    state.update_mark(KEY, ["c", "d"])
+    state.update_mark(KEY, ["a", "b"])
+
+    assert SyncState(filename).get_mark(KEY) == {"a", "b", "c", "d"}
+
+
+def test_update_mark_keeps_mark_size(tmp_path):
+    """Test that only the newest MARK_SIZE URLs are kept"""
+    state = SyncState(tmp_path / "state.json")
+
+    state.update_mark(KEY, [str(i) for i in range(MARK_SIZE * 2)])
+
+    assert state.get_mark(KEY) == {str(i) for i in range(MARK_SIZE)}
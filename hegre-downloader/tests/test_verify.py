@@ -0,0 +1,41 @@
+import hashlib
+
+from model.movie import HegreMovie
+from model.media_file import MediaFile
+from verify import verify_library, OK, MISSING, SIZE_MISMATCH, CHECKSUM_MISMATCH
+
+CONTENT = b"movie" * 1000
+
+
+def write_movie(folder, code: int, content: bytes = CONTENT) -> None:
+    """Writes a movie file and its metadata file with the checksum of CONTENT"""
+    movie = HegreMovie(f"https://www.hegre.com/films/film-{code}")
+    movie.code = code
+    movie.file = MediaFile(
+        f"{code}-movie.mp4", len(CONTENT), hashlib.sha256(CONTENT).hexdigest()
+    )
+    movie.write_metadata_file(folder, f"{code}-movie.json")
+
+    if content is not None:
+        (folder / f"{code}-movie.mp4").write_bytes(content)
+
+
+def test_verify_library_detects_damaged_files(tmp_path):
+    """Test that missing, truncated and corrupted files are reported and intact files pass"""
+    (tmp_path / "2023").mkdir()
+    write_movie(tmp_path / "2023", 1)
+    write_movie(tmp_path, 2, content=None)
+    write_movie(tmp_path, 3, content=CONTENT[:-1])
+    write_movie(tmp_path, 4, content=CONTENT[:-1] + b"!")
+    (tmp_path / "5-movie.json").write_text("{}")
+
+    results = verify_library(tmp_path, workers=2)
+
+    assert sorted(
+        (result.media_file.rsplit("/", 1)[-1], result.status) for result in results
+    ) == [
+        ("1-movie.mp4", OK),
+        ("2-movie.mp4", MISSING),
+        ("3-movie.mp4", SIZE_MISMATCH),
+        ("4-movie.mp4", CHECKSUM_MISMATCH),
+    ]
@@ -0,0 +1,189 @@
+import os
+import threading
+import multiprocessing
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from download_archive import SqliteArchive
+from work_ledger import WorkLedger, PENDING, LEASED, DONE, FAILED
+
+import httpx
+import pytest
+
+LEASE = 60
+URLS = [f"https://www.hegre.com/films/film-{i}" for i in range(5)]
+
+
+class FakeClock:
+    """Wall clock that only advances when told to"""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_workers_claim_urls_in_order_and_only_once(tmp_path):
+    """Test that two workers claim the URLs in the order of the listing, without claiming a URL twice"""
+    clock = FakeClock()
+    first = WorkLedger(tmp_path / "ledger.db", "first", lease=LEASE, clock=clock)
+    second = WorkLedger(tmp_path / "ledger.db", "second", lease=LEASE, clock=clock)
+
+    assert first.add(URLS[:3], source="https://www.hegre.com/movies") == 3
+    assert second.add(URLS) == 2
+
+    assert [first.claim(), second.claim(), first.claim()] == URLS[:3]
+    assert second.is_resolved("https://www.hegre.com/movies")
+    assert first.counts() == {PENDING: 2, LEASED: 3, DONE: 0, FAILED: 0}
+
+
+def test_expired_lease_is_claimed_by_another_worker(tmp_path):
+    """Test that the URL of a worker that stopped sending heartbeats is claimed again after its lease"""
+    clock = FakeClock()
+    dead = WorkLedger(tmp_path / "ledger.db", "dead", lease=LEASE, clock=clock)
+    alive = WorkLedger(tmp_path / "ledger.db", "alive", lease=LEASE, clock=clock)
+    dead.add(URLS[:2])
+    alive.claim()
+    dead.claim()
+
+    clock.now += LEASE / 2
+    alive.heartbeat()
+    assert alive.claim() is None
+
+    clock.now += LEASE
+    assert alive.claim() == URLS[1]
+    assert alive.claim() is None
+
+
+def test_failed_url_is_retried_until_max_attempts(tmp_path):
+    """Test that a released URL is claimed again and given up after the maximum number of attempts"""
+    ledger = WorkLedger(tmp_path / "ledger.db", max_attempts=2, clock=FakeClock())
+    ledger.add(URLS[:1])
+
+    for _ in range(2):
+        assert ledger.claim() == URLS[0]
+        ledger.release(URLS[0], error="HTTP 500")
+
+    assert ledger.claim() is None
+    assert ledger.counts()[FAILED] == 1
+    assert list(ledger.iter_claims()) == []
+
+
+def test_expired_lease_of_last_attempt_fails(tmp_path):
+    """Test that a URL whose worker dies during the last attempt is given up instead of staying leased"""
+    clock = FakeClock()
+    dead = WorkLedger(
+        tmp_path / "ledger.db", "dead", lease=LEASE, max_attempts=1, clock=clock
+    )
+    alive = WorkLedger(
+        tmp_path / "ledger.db", "alive", lease=LEASE, max_attempts=1, clock=clock
+    )
+    dead.add(URLS[:1])
+    assert dead.claim() == URLS[0]
+
+    clock.now += LEASE * 2
+    assert list(alive.iter_claims()) == []
+    assert alive.counts() == {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 1}
+
+
+def test_ledger_does_not_use_wal(tmp_path):
+    """Test that the ledger uses a rollback journal, as WAL does not work on network storage"""
+    ledger = WorkLedger(tmp_path / "ledger.db")
+
+    assert ledger._connection.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+
+
+def test_stop_releases_leases(tmp_path):
+    """Test that a worker that stops returns its claimed URLs to the queue"""
+    ledger = WorkLedger(tmp_path / "ledger.db", clock=FakeClock())
+    ledger.add(URLS[:2])
+
+    with ledger:
+        assert ledger.claim() == URLS[0]
+        ledger.complete(URLS[0])
+        assert ledger.claim() == URLS[1]
+
+    assert ledger.counts() == {PENDING: 1, LEASED: 0, DONE: 1, FAILED: 0}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        body = self.path.encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def run_worker(
+    ledger_file: str, archive_file: str, folder: str, base_url: str, crash: bool
+) -> None:
+    ledger = WorkLedger(ledger_file, lease=1, poll_interval=0.05)
+    archive = SqliteArchive(archive_file)
+
+    if crash:
+        # claims a URL and dies without releasing it, so another worker takes it over once its lease expired
+        ledger.claim()
+        os._exit(1)
+
+    with ledger:
+        for url in ledger.iter_claims():
+            name = url.rsplit("/", 1)[-1]
+            if name not in archive:
+                response = httpx.get(f"{base_url}/{name}")
+                with open(os.path.join(folder, name), "wb") as file:
+                    file.write(response.content)
+                archive.add(name, url=url, size=len(response.content))
+
+            ledger.complete(url)
+
+    archive.close()
+
+
+def test_worker_processes_download_all_urls_against_stub_server(tmp_path):
+    """Test that several worker processes download every URL, including the URL of a crashed worker"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    ledger_file = str(tmp_path / "ledger.db")
+    archive_file = str(tmp_path / "archive.db")
+    ledger = WorkLedger(ledger_file)
+    ledger.add(URLS)
+    ledger.close()
+
+    # SQLite connections must not be inherited by forked processes
+    context = multiprocessing.get_context("spawn")
+    crashed = context.Process(
+        target=run_worker,
+        args=(ledger_file, archive_file, str(tmp_path), base_url, True),
+    )
+    crashed.start()
+    crashed.join()
+
+    workers = [
+        context.Process(
+            target=run_worker,
+            args=(ledger_file, archive_file, str(tmp_path), base_url, False),
+        )
+        for _ in range(3)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=30)
+    server.shutdown()
+
+    assert [worker.exitcode for worker in workers] == [0, 0, 0]
+    assert WorkLedger(ledger_file).counts()[DONE] == len(URLS)
+
+    archive = SqliteArchive(archive_file)
+    for url in URLS:
+        name = url.rsplit("/", 1)[-1]
+        assert name in archive
+        assert (tmp_path / name).read_text() == f"/{name}"
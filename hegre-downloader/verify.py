@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+import time
+import argparse
+import pathlib
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+
+from helper import convert_size, hash_file
+from model.media_file import MediaFile
+
+from rich.console import Console
+from rich.progress import Progress, TaskID
+
+OK = "ok"
+MISSING = "missing"
+SIZE_MISMATCH = "size mismatch"
+CHECKSUM_MISMATCH = "checksum mismatch"
+
+
+class VerifyResult:
+    """Result of the verification of a downloaded movie/gallery file against its metadata file"""
+
+    media_file: str
+    status: str
+    size: int
+
+    def __init__(self, media_file: str, status: str, size: int = 0) -> None:
+        self.media_file = media_file
+        self.status = status
+        self.size = size
+
+
+def find_metadata_files(folder: str) -> Iterator[str]:
+    """Yields all metadata files in the given folder and its subfolders (e.g. one per year)"""
+    for dirpath, _, filenames in os.walk(folder):
+        for filename in sorted(filenames):
+            if filename.endswith(".json"):
+                yield os.path.join(dirpath, filename)
+
+
+def load_media_file(metadata_file: str) -> Optional[MediaFile]:
+    """Returns the recorded media file of a metadata file, None if it has no (or no valid) record"""
+    try:
+        with open(metadata_file, "r", encoding="utf-8") as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(data, dict) or not isinstance(data.get("file"), dict):
+        return None
+
+    return MediaFile.from_dict(data["file"])
+
+
+def verify_media_file(
+    metadata_file: str,
+    media_file: MediaFile,
+    progress: Optional[Progress] = None,
+    task_id: Optional[TaskID] = None,
+) -> VerifyResult:
+    """Checks the size and then the checksum of the media file next to a metadata file"""
+    filename = os.path.join(os.path.dirname(metadata_file), media_file.name)
+
+    if not os.path.exists(filename):
+        return VerifyResult(filename, MISSING)
+
+    size = os.path.getsize(filename)
+    if size != media_file.size:
+        return VerifyResult(filename, SIZE_MISMATCH, size)
+
+    checksum = hash_file(filename).hexdigest()
+    if progress and task_id != None:
+        progress.update(task_id, advance=size)
+
+    if checksum != media_file.sha256:
+        return VerifyResult(filename, CHECKSUM_MISMATCH, size)
+
+    return VerifyResult(filename, OK, size)
+
+
+def verify_library(
+    folder: str, workers: int, progress: Optional[Progress] = None
+) -> list[VerifyResult]:
+    """Verifies all media files of a library in parallel
+
+    Files are read into a reused buffer and hashed outside of the GIL, so several workers can keep a fast
+    disk (or several disks) busy.
+
+    Returns:
+        list[VerifyResult]: Results of all media files with a recorded checksum, in the order of their metadata files
+    """
+    records = [
+        (metadata_file, media_file)
+        for metadata_file in find_metadata_files(folder)
+        if (media_file := load_media_file(metadata_file))
+    ]
+
+    task_id = None
+    if progress:
+        task_id = progress.add_task(
+            "Verifying files", total=sum(media_file.size for _, media_file in records)
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(
+            pool.map(
+                lambda record: verify_media_file(*record, progress, task_id),
+                records,
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="verify",
+        description="Verifies the size and checksum of all downloaded movies/galleries against their metadata files",
+    )
+    parser.add_argument(
+        "path",
+        metavar="PATH",
+        type=pathlib.Path,
+        help="Destination folder of the downloads (-d of the downloader)",
+    )
+    parser.add_argument(
+        "-p",
+        metavar="NUM_OF_TASKS",
+        help="Number of files verified in parallel. Defaults to 4.",
+        type=int,
+        action="store",
+        default=4,
+    )
+    args = parser.parse_args()
+
+    console = Console()
+    started = time.monotonic()
+
+    with Progress(console=console) as progress:
+        results = verify_library(args.path, args.p, progress)
+
+    elapsed = max(time.monotonic() - started, 1e-9)
+    verified_bytes = sum(result.size for result in results if result.status == OK)
+    failed = [result for result in results if result.status != OK]
+
+    for result in failed:
+        console.print(f"[red]:x: {result.media_file}: {result.status}")
+
+    console.print(
+        f"Verified {len(results) - len(failed)} of {len(results)} files ({convert_size(verified_bytes)}, {convert_size(int(verified_bytes / elapsed))}/s)"
+    )
+
+    sys.exit(1 if failed else 0)
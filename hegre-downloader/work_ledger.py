@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import os
+import time
+import socket
+import sqlite3
+import threading
+
+from typing import Callable, Iterable, Iterator, Optional
+
+from helper import connect_shared_sqlite
+
+# seconds a claimed URL stays leased to a worker without a heartbeat
+DEFAULT_LEASE = 300.0
+# seconds an idle worker waits before it checks for released or expired leases again
+DEFAULT_POLL_INTERVAL = 5.0
+# number of claims of a URL, before a failing URL is given up
+MAX_ATTEMPTS = 3
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkLedger:
+    """Queue of URLs in a SQLite database (with a rollback journal), shared by several workers
+
+    Every worker adds the URLs it has resolved, which is idempotent, and then claims URLs one at a time.
+    A claimed URL is leased to its worker, which extends the leases of all its URLs with a heartbeat. If a
+    worker dies, its leases expire and other workers claim its URLs again. A failed URL is released, so
+    another worker retries it, until it has been claimed MAX_ATTEMPTS times. A URL whose lease expires
+    after its last attempt is given up as well.
+
+    The database can be shared by processes on several hosts, if it is placed on a file system with
+    working locks (it does not use WAL, which needs all connections on one host). Their clocks have to
+    be in sync (to well within a lease). A ledger is meant for a single mirror run: once a URL has been
+    resolved, later workers claim the URLs of the ledger instead of resolving it again.
+    """
+
+    filename: str
+    worker_id: str
+    lease: float
+    poll_interval: float
+    max_attempts: int
+    _clock: Callable[[], float]
+    _connection: sqlite3.Connection
+    _lock: threading.Lock
+    _stop: threading.Event
+    _heartbeat: Optional[threading.Thread]
+
+    def __init__(
+        self,
+        filename: str,
+        worker_id: Optional[str] = None,
+        lease: float = DEFAULT_LEASE,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        max_attempts: int = MAX_ATTEMPTS,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """Opens the ledger, creating it if necessary
+
+        Args:
+            filename (str): SQLite database on storage shared by all workers
+            worker_id (Optional[str], optional): Unique ID of this worker. Defaults to host name and process ID.
+            lease (float, optional): Seconds a claim is valid without a heartbeat. Defaults to DEFAULT_LEASE.
+            poll_interval (float, optional): Seconds an idle worker waits for leases of other workers. Defaults to DEFAULT_POLL_INTERVAL.
+            max_attempts (int, optional): Number of claims of a URL before it is given up. Defaults to MAX_ATTEMPTS.
+            clock (Callable[[], float], optional): Wall clock in seconds, shared by all hosts. Defaults to time.time.
+        """
+        self.filename = filename
+        self.worker_id = worker_id or default_worker_id()
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+        self._connection = connect_shared_sqlite(filename)
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS work (
+                    url TEXT PRIMARY KEY,
+                    position INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    worker TEXT,
+                    lease_until REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT
+                )"""
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS work_state ON work (state, position)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS sources (url TEXT PRIMARY KEY, resolved_at REAL NOT NULL)"
+            )
+
+    def __enter__(self) -> WorkLedger:
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """Starts the heartbeat, which extends the leases of this worker"""
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self._heartbeat.start()
+
+    def stop(self) -> None:
+        """Stops the heartbeat and releases the URLs this worker still holds"""
+        if self._heartbeat:
+            self._stop.set()
+            self._heartbeat.join()
+            self._heartbeat = None
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE work SET state = ?, worker = NULL, lease_until = NULL WHERE worker = ? AND state = ?",
+                (PENDING, self.worker_id, LEASED),
+            )
+
+    def add(self, urls: Iterable[str], source: Optional[str] = None) -> int:
+        """Adds URLs in the given order, skipping URLs that are already in the ledger
+
+        Args:
+            urls (Iterable[str]): URLs of single movies and galleries
+            source (Optional[str], optional): URL the URLs have been resolved from, which is marked as resolved. Defaults to None.
+
+        Returns:
+            int: Number of added URLs
+        """
+        with self._lock, self._connection:
+            position = self._connection.execute(
+                "SELECT COALESCE(MAX(position), -1) + 1 FROM work"
+            ).fetchone()[0]
+
+            added = self._connection.executemany(
+                "INSERT OR IGNORE INTO work (url, position, state) VALUES (?, ?, ?)",
+                [(url, position + i, PENDING) for i, url in enumerate(urls)],
+            ).rowcount
+
+            if source:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO sources VALUES (?, ?)",
+                    (source, self._clock()),
+                )
+
+        return added
+
+    def is_resolved(self, source: str) -> bool:
+        """Returns True, if a worker has already added the URLs resolved from the given URL"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM sources WHERE url = ?", (source,)
+            ).fetchone()
+
+        return row is not None
+
+    def claim(self) -> Optional[str]:
+        """Leases the first pending URL (or URL with an expired lease) to this worker
+
+        Returns:
+            Optional[str]: Claimed URL, None if there is nothing to claim at the moment
+        """
+        now = self._clock()
+
+        with self._lock, self._connection:
+            # the worker of an expired lease died during the last attempt, so the URL is given up
+            self._connection.execute(
+                """UPDATE work SET state = ?, worker = NULL, lease_until = NULL,
+                error = COALESCE(error, 'lease expired')
+                WHERE state = ? AND lease_until < ? AND attempts >= ?""",
+                (FAILED, LEASED, now, self.max_attempts),
+            )
+
+            # a single statement, so no other worker can claim the same URL in between
+            row = self._connection.execute(
+                """UPDATE work SET state = ?, worker = ?, lease_until = ?, attempts = attempts + 1
+                WHERE url = (
+                    SELECT url FROM work
+                    WHERE (state = ? OR (state = ? AND lease_until < ?)) AND attempts < ?
+                    ORDER BY position LIMIT 1
+                )
+                RETURNING url""",
+                (
+                    LEASED,
+                    self.worker_id,
+                    now + self.lease,
+                    PENDING,
+                    LEASED,
+                    now,
+                    self.max_attempts,
+                ),
+            ).fetchone()
+
+        return row[0] if row else None
+
+    def complete(self, url: str) -> None:
+        """Marks a URL as done"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE work SET state = ?, worker = ?, lease_until = NULL, error = NULL WHERE url = ?",
+                (DONE, self.worker_id, url),
+            )
+
+    def release(self, url: str, error: Optional[str] = None) -> None:
+        """Returns a failed URL to the queue, or gives it up after MAX_ATTEMPTS claims"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                """UPDATE work SET state = CASE WHEN attempts < ? THEN ? ELSE ? END,
+                worker = NULL, lease_until = NULL, error = ?
+                WHERE url = ? AND worker = ? AND state = ?""",
+                (
+                    self.max_attempts,
+                    PENDING,
+                    FAILED,
+                    error,
+                    url,
+                    self.worker_id,
+                    LEASED,
+                ),
+            )
+
+    def heartbeat(self) -> None:
+        """Extends the leases of all URLs this worker holds"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE work SET lease_until = ? WHERE worker = ? AND state = ?",
+                (self._clock() + self.lease, self.worker_id, LEASED),
+            )
+
+    def counts(self) -> dict[str, int]:
+        """Returns the number of URLs in each state"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT state, COUNT(*) FROM work GROUP BY state"
+            ).fetchall()
+
+        return {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0} | dict(rows)
+
+    def iter_claims(self) -> Iterator[str]:
+        """Claims and yields URLs until all URLs are done or failed
+
+        While URLs are still leased, to this or other workers, the worker waits, so it retries them if they
+        are released after a failure or their worker dies.
+        """
+        while True:
+            if url := self.claim():
+                yield url
+            elif self._has_leases():
+                time.sleep(self.poll_interval)
+            else:
+                return
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _has_leases(self) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM work WHERE state = ? LIMIT 1", (LEASED,)
+            ).fetchone()
+
+        return row is not None
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self.lease / 3):
+            self.heartbeat()